@@ -36,12 +36,14 @@ from pitivi.settings import GlobalSettings
 from pitivi.settings import xdg_cache_home
 from pitivi.shortcuts import ShortcutsManager
 from pitivi.shortcuts import show_shortcuts
+from pitivi.timeline.previewers import PreviewsCacheCleaner
 from pitivi.undo.project import ProjectObserver
 from pitivi.undo.undo import UndoableActionLog
 from pitivi.utils import loggable
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import path_from_uri
 from pitivi.utils.misc import quote_uri
+from pitivi.utils.proxy import get_proxy_target
 from pitivi.utils.proxy import ProxyManager
 from pitivi.utils.system import get_system
 from pitivi.utils.threads import ThreadMaster
@@ -75,6 +77,8 @@ class Pitivi(Gtk.Application, Loggable):
         self.threads = None
         self.effects = None
         self.system = None
+        # Whether the previews cache has been cleaned, see _new_project_loaded_cb.
+        self.__previews_cache_cleaned = False
         self.project_manager = ProjectManager(self)
 
         self.action_log = None
@@ -235,6 +239,7 @@ class Pitivi(Gtk.Application, Loggable):
             self.gui.destroy()
         self.threads.wait_all_threads()
         self.settings.store_settings()
+        self.proxy_manager.save_jobs()
         self.quit()
         return True
 
@@ -284,6 +289,15 @@ class Pitivi(Gtk.Application, Loggable):
 
         self._set_scenario_file(project.get_uri())
 
+        # The cache files of the project assets are kept when cleaning the cache.
+        for asset in project.list_sources():
+            PreviewsCacheCleaner.protect_uri(asset.props.id)
+            PreviewsCacheCleaner.protect_uri(get_proxy_target(asset).props.id)
+        if not self.__previews_cache_cleaned:
+            self.__previews_cache_cleaned = True
+            self.threads.add_thread(PreviewsCacheCleaner,
+                                    self.settings.previewers_cache_max_size * 1024 * 1024)
+
     def __project_saved_cb(self, unused_project_manager, unused_project, uri):
         if uri:
             self.recent_manager.add_item(uri)
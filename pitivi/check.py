@@ -341,11 +341,15 @@ def require_version(modulename, version):
         sys.exit(1)
 
 
-def initialize_modules():
+def initialize_modules(headless=False):
     """Initializes the modules.
 
     This has to be done in a specific order otherwise the app
     crashes on some systems.
+
+    Args:
+        headless (Optional[bool]): Whether to skip connecting to the display,
+            for the commands not needing the user interface.
     """
     try:
         import gi
@@ -357,7 +361,8 @@ def initialize_modules():
     require_version("Gtk", GTK_API_VERSION)
     require_version("Gdk", GTK_API_VERSION)
     from gi.repository import Gdk
-    Gdk.init([])
+    if not headless:
+        Gdk.init([])
     from gi.repository import Gtk
 
     # Monkey patch deprecated methods to use the new variant by default
@@ -442,7 +447,6 @@ HARD_DEPENDENCIES = [GICheck(version_required="3.20.0"),
                      GIDependency("Gio", apiversion="2.0"),
                      GstPluginDependency("gtk"),
                      GstPluginDependency("gdkpixbuf"),
-                     ClassicDependency("matplotlib"),
                      GIDependency("Peas", apiversion="1.0"),
                      GIDependency("PangoCairo", apiversion="1.0"),
                      ]
@@ -1,5 +1,6 @@
 #include <Python.h>
 #include <stdio.h>
+#include <string.h>
 #include <cairo.h>
 #include <py3cairo.h>
 #include <gst/gst.h>
@@ -7,16 +8,40 @@
 static GObjectClass * gobject_class;
 
 /*
- * This function must be called with a range of samples, and a desired
- * width and height.
+ * Gets the sample at the specified index, either from a buffer of floats
+ * or doubles if `format` is not 0, or from a sequence of Python floats.
+ */
+static inline double
+get_sample (Py_buffer * view, char format, PyObject * seq, Py_ssize_t i)
+{
+  if (format == 'd')
+    return ((double *) view->buf)[i];
+  if (format == 'f')
+    return ((float *) view->buf)[i];
+
+  /* Guaranteed to return something */
+  return PyFloat_AsDouble (PySequence_Fast_GET_ITEM (seq, i));
+}
+
+/*
+ * This function must be called with samples, and a desired width and height.
+ * The samples can be any object supporting the buffer protocol, such as a
+ * numpy array of float32 or float64, or a sequence of floats.
+ * Only the samples between start and end are drawn, multiplied by factor.
  * It will average samples if needed.
  */
 static PyObject *
-py_fill_surface (PyObject * self, PyObject * args)
+py_fill_surface (PyObject * self, PyObject * args, PyObject * kwargs)
 {
+  static char *kwlist[] = { "samples", "width", "height", "start", "end",
+    "factor", NULL
+  };
   PyObject *samples;
-  PyObject *sampleObj;
-  int length, i;
+  PyObject *seq = NULL;
+  Py_buffer view;
+  char format = 0;
+  Py_ssize_t length, start = 0, end = -1, i;
+  double factor = 1.;
   double sample;
   cairo_surface_t *surface;
   cairo_t *ctx;
@@ -27,10 +52,43 @@ py_fill_surface (PyObject * self, PyObject * args)
   float x = 0.;
   double accum;
 
-  if (!PyArg_ParseTuple (args, "O!ii", &PyList_Type, &samples, &width, &height))
+  if (!PyArg_ParseTupleAndKeywords (args, kwargs, "Oii|nnd", kwlist,
+          &samples, &width, &height, &start, &end, &factor))
     return NULL;
 
-  length = PyList_Size (samples);
+  if (PyObject_CheckBuffer (samples)) {
+    const char *view_format;
+
+    if (PyObject_GetBuffer (samples, &view,
+            PyBUF_C_CONTIGUOUS | PyBUF_FORMAT) < 0)
+      return NULL;
+
+    view_format = view.format;
+    if (view_format[0] == '@' || view_format[0] == '=')
+      view_format++;
+    if (view.ndim != 1 || (strcmp (view_format, "d")
+            && strcmp (view_format, "f"))) {
+      PyBuffer_Release (&view);
+      PyErr_SetString (PyExc_TypeError,
+          "samples must be a one-dimensional buffer of floats or doubles");
+      return NULL;
+    }
+    format = view_format[0];
+    length = view.shape[0];
+  } else {
+    seq = PySequence_Fast (samples,
+        "samples must be a sequence or support the buffer protocol");
+    if (seq == NULL)
+      return NULL;
+    length = PySequence_Fast_GET_SIZE (seq);
+  }
+
+  if (end < 0 || end > length)
+    end = length;
+  if (start < 0)
+    start = 0;
+  if (start > end)
+    start = end;
 
   surface = cairo_image_surface_create (CAIRO_FORMAT_ARGB32, width, height);
 
@@ -40,20 +98,19 @@ py_fill_surface (PyObject * self, PyObject * args)
   cairo_set_line_width (ctx, 0.5);
   cairo_move_to (ctx, 0, height);
 
-  pixelsPerSample = width / (float) length;
+  pixelsPerSample = end > start ? width / (float) (end - start) : 0.;
   currentPixel = 0.;
   samplesInAccum = 0;
   accum = 0.;
 
-  for (i = 0; i < length; i++) {
-    /* Guaranteed to return something */
-    sampleObj = PyList_GetItem (samples, i);
-    sample = PyFloat_AsDouble (sampleObj);
+  for (i = start; i < end; i++) {
+    sample = get_sample (&view, format, seq, i);
 
     /* If the object was not a float or convertible to float */
-    if (PyErr_Occurred ()) {
-      cairo_surface_finish (surface);
-      Py_DECREF (samples);
+    if (!format && PyErr_Occurred ()) {
+      cairo_destroy (ctx);
+      cairo_surface_destroy (surface);
+      Py_DECREF (seq);
       return NULL;
     }
 
@@ -61,7 +118,7 @@ py_fill_surface (PyObject * self, PyObject * args)
     samplesInAccum += 1;
     accum += sample;
     if (currentPixel > 1.0) {
-      accum /= samplesInAccum;
+      accum = accum * factor / samplesInAccum;
       cairo_line_to (ctx, x, height - accum);
       accum = 0;
       currentPixel -= 1.0;
@@ -70,16 +127,22 @@ py_fill_surface (PyObject * self, PyObject * args)
     x += pixelsPerSample;
   }
 
-  Py_DECREF (samples);
+  if (format)
+    PyBuffer_Release (&view);
+  else
+    Py_DECREF (seq);
+
   cairo_line_to (ctx, width, height);
   cairo_close_path (ctx);
   cairo_fill_preserve (ctx);
+  cairo_destroy (ctx);
 
   return PycairoSurface_FromSurface (surface, NULL);
 }
 
 static PyMethodDef renderer_methods[] = {
-  {"fill_surface", py_fill_surface, METH_VARARGS},
+  {"fill_surface", (PyCFunction) py_fill_surface,
+      METH_VARARGS | METH_KEYWORDS},
   {NULL, NULL}
 };
 
@@ -53,6 +53,7 @@ from pitivi.utils.misc import quote_uri
 from pitivi.utils.misc import show_user_manual
 from pitivi.utils.proxy import get_proxy_target
 from pitivi.utils.proxy import ProxyingStrategy
+from pitivi.utils.proxy import ProxyJobPriority
 from pitivi.utils.proxy import ProxyManager
 from pitivi.utils.ui import beautify_asset
 from pitivi.utils.ui import beautify_eta
@@ -544,11 +545,17 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
         self._listview_button = builder.get_object("media_listview_button")
         self.search_entry = builder.get_object("media_search_entry")
 
+        # The ID of the idle update of the proxying jobs priorities.
+        self.__proxies_priorities_id = 0
+
         self.scrollwin = Gtk.ScrolledWindow()
         self.scrollwin.set_policy(
             Gtk.PolicyType.NEVER, Gtk.PolicyType.AUTOMATIC)
         self.scrollwin.get_accessible().set_name(
             "media_flowbox_scrollwindow")
+        vadjustment = self.scrollwin.get_vadjustment()
+        vadjustment.connect("value-changed", self.__vadjustment_changed_cb)
+        vadjustment.connect("changed", self.__vadjustment_changed_cb)
 
         self.store = Gio.ListStore()
         self.store.connect("items-changed", self._store_items_changed_cb)
@@ -699,6 +706,31 @@ class MediaLibraryWidget(Gtk.Box, Loggable):
             self._welcome_infobar.show_all()
         else:
             self._welcome_infobar.hide()
+        self.__schedule_proxies_priorities_update()
+
+    def __vadjustment_changed_cb(self, unused_vadjustment):
+        self.__schedule_proxies_priorities_update()
+
+    def __schedule_proxies_priorities_update(self):
+        if not self.__proxies_priorities_id:
+            self.__proxies_priorities_id = GLib.idle_add(self.__update_proxies_priorities)
+
+    def __update_proxies_priorities(self):
+        """Prioritizes the proxies of the assets visible in the view."""
+        self.__proxies_priorities_id = 0
+        vadjustment = self.scrollwin.get_vadjustment()
+        top = vadjustment.get_value()
+        bottom = top + vadjustment.get_page_size()
+
+        assets = []
+        for i, child in enumerate(self.flowbox):
+            allocation = child.get_allocation()
+            if child.get_visible() and \
+                    allocation.y < bottom and allocation.y + allocation.height > top:
+                assets.append(self.store[i].asset)
+
+        self.app.proxy_manager.set_prioritized_assets(ProxyJobPriority.MEDIA_LIBRARY, assets)
+        return False
 
     def _import_sources_cb(self, unused_action):
         self.show_import_assets_dialog()
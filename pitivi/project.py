@@ -47,6 +47,7 @@ from pitivi.timeline.previewers import Previewer
 from pitivi.timeline.previewers import ThumbnailCache
 from pitivi.undo.project import AssetAddedIntention
 from pitivi.undo.project import AssetProxiedIntention
+from pitivi.utils.discoverer import DiscovererCache
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import disconnect_all_by_func
 from pitivi.utils.misc import fixate_caps_with_default_values
@@ -674,6 +675,17 @@ class Project(Loggable, GES.Project):
         self.app.proxy_manager.connect("proxy-ready",
                                        self.__proxy_ready_cb)
 
+        # The discoverer infos of the files which did not change since they
+        # have been discovered are loaded from the disk instead. This needs
+        # the GES.DiscovererManager added in GES 1.24.
+        self.__discoverer_cache = None
+        if hasattr(GES, "DiscovererManager"):
+            self.__discoverer_cache = DiscovererCache()
+            discoverer_manager = GES.DiscovererManager.get_default()
+            discoverer_manager.connect("load-serialized-info",
+                                       self.__load_serialized_info_cb)
+            discoverer_manager.connect("discovered", self.__discovered_cb)
+
         # GstValidate
         self.scenario = scenario
         self.runner = None
@@ -685,10 +697,10 @@ class Project(Loggable, GES.Project):
         self.nb_remaining_file_to_import = 0
         self.nb_imported_files = 0
 
-        # Main assets that were proxied when saving the project but
-        # whose proxies had been deleted from the filesystem. The
-        # proxy files are being regenerated.
-        self.__deleted_proxy_files = set()
+        # The URIs of the proxies which had been deleted from the filesystem
+        # when loading the project, mapped to the URIs of their targets.
+        # The proxy files are being regenerated.
+        self.__deleted_proxy_files = {}
 
         # List of proxy assets uris that were deleted on the filesystem
         # and we are waiting for the main asset (ie. the file from
@@ -1225,28 +1237,17 @@ class Project(Loggable, GES.Project):
         Returns:
             int: The current asset loading progress (in percent).
         """
+        # The assets whose deleted proxies are being recreated.
+        regenerated_targets = set(self.__deleted_proxy_files.values())
+        regenerated_targets.update(self.__awaited_deleted_proxy_targets)
+
         num_loaded = 0
         all_ready = True
         for asset in self.loading_assets:
             if asset.creation_progress < 100:
                 all_ready = False
             else:
-                # Check that we are not recreating deleted proxy
-                proxy_uri = self.app.proxy_manager.get_proxy_uri(asset)
-                scaled_proxy_uri = self.app.proxy_manager.get_proxy_uri(asset, scaled=True)
-
-                no_hq_proxy = False
-                no_scaled_proxy = False
-
-                if proxy_uri and proxy_uri not in self.__deleted_proxy_files and \
-                        asset.props.id not in self.__awaited_deleted_proxy_targets:
-                    no_hq_proxy = True
-
-                if scaled_proxy_uri and scaled_proxy_uri not in self.__deleted_proxy_files and \
-                        asset.props.id not in self.__awaited_deleted_proxy_targets:
-                    no_scaled_proxy = True
-
-                if no_hq_proxy and no_scaled_proxy:
+                if asset.props.id not in regenerated_targets:
                     asset.ready = True
 
                 num_loaded += 1
@@ -1343,6 +1344,13 @@ class Project(Loggable, GES.Project):
 
         self.__set_proxy(asset, proxy)
 
+    def __load_serialized_info_cb(self, unused_discoverer_manager, uri):
+        return self.__discoverer_cache.load(uri)
+
+    def __discovered_cb(self, unused_discoverer_manager, info, error):
+        if not error:
+            self.__discoverer_cache.save(info)
+
     def __set_proxy(self, asset, proxy):
         asset.creation_progress = 100
         asset.ready = True
@@ -1384,6 +1392,14 @@ class Project(Loggable, GES.Project):
         self.app.proxy_manager.add_job(asset, scaled=scaled)
         self.__update_asset_loading_progress()
 
+    def __resume_interrupted_proxying(self):
+        """Requeues the proxying jobs not finished when Pitivi exited."""
+        assets = self.list_assets(GES.UriClip)
+        for asset, scaled in self.app.proxy_manager.take_interrupted_jobs(assets):
+            self.info("Resuming the interrupted proxying of %s", asset.props.id)
+            self._prepare_asset_processing(asset)
+            self.app.proxy_manager.add_job(asset, scaled=scaled)
+
     def do_missing_uri(self, error, asset):
         if self.app.proxy_manager.is_proxy_asset(asset):
             self.debug("Missing proxy file: %s", asset.props.id)
@@ -1402,7 +1418,7 @@ class Project(Loggable, GES.Project):
             else:
                 self.__awaited_deleted_proxy_targets.add(target_uri)
 
-            self.__deleted_proxy_files.add(asset.props.id)
+            self.__deleted_proxy_files[asset.props.id] = target_uri
             return target_uri
 
         new_uri = GES.Project.do_missing_uri(self, error, asset)
@@ -1447,7 +1463,7 @@ class Project(Loggable, GES.Project):
             self.__awaited_deleted_proxy_targets.remove(asset.props.id)
         elif asset.props.id in self.__deleted_proxy_files:
             self.info("Deleted proxy file %s now ready again.", asset.props.id)
-            self.__deleted_proxy_files.remove(asset.props.id)
+            del self.__deleted_proxy_files[asset.props.id]
 
         if self.loaded:
             if not asset.get_proxy_target() in self.list_assets(GES.Extractable):
@@ -1482,6 +1498,7 @@ class Project(Loggable, GES.Project):
         self._ensure_layer()
 
         if self.uri:
+            self.__resume_interrupted_proxying()
             self.loading_assets = {asset for asset in self.loading_assets
                                    if self.app.proxy_manager.is_asset_queued(asset)}
 
@@ -1661,6 +1678,10 @@ class Project(Loggable, GES.Project):
         self.app.proxy_manager.disconnect_by_func(self.__proxy_error_cb)
         self.app.proxy_manager.disconnect_by_func(self.__asset_transcoding_cancelled_cb)
         self.app.proxy_manager.disconnect_by_func(self.__proxy_ready_cb)
+        if self.__discoverer_cache:
+            discoverer_manager = GES.DiscovererManager.get_default()
+            discoverer_manager.disconnect_by_func(self.__load_serialized_info_cb)
+            discoverer_manager.disconnect_by_func(self.__discovered_cb)
 
     def save(self, ges_timeline, uri, formatter_asset, overwrite):
         for container_profile in self.list_encoding_profiles():
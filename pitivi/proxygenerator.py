@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Creation of proxies without the user interface.
+
+Run as `pitivi generate-proxies [OPTIONS] PATH...`.
+"""
+import argparse
+import os
+from gettext import gettext as _
+
+from gi.repository import GES
+from gi.repository import GLib
+from gi.repository import Gst
+
+# Registers the elements teeing the thumbnails and waveforms of the proxies.
+import pitivi.timeline.previewers  # noqa pylint: disable=unused-import
+from pitivi.settings import GlobalSettings
+from pitivi.utils import loggable
+from pitivi.utils.loggable import Loggable
+from pitivi.utils.misc import path_from_uri
+from pitivi.utils.misc import quote_uri
+from pitivi.utils.proxy import ProxyManager
+from pitivi.utils.proxy import ProxyingStrategy
+
+
+class ProxiesProject:
+    """The parts of a project used by the ProxyManager.
+
+    The scaled proxy size is the one configured for new projects.
+    """
+
+    def __init__(self, settings):
+        self.scaled_proxy_width = settings.default_scaled_proxy_width
+        self.scaled_proxy_height = settings.default_scaled_proxy_height
+        self.ges_timeline = GES.Timeline.new()
+
+    def has_scaled_proxy_size(self):
+        return True
+
+    def finalize_proxy(self, proxy):
+        """Handles a shadow proxy being ready."""
+
+
+class ProxiesGenerator(Loggable):
+    """Creates the proxies of media files, like the media library does.
+
+    Stands in for the app of the ProxyManager.
+
+    Attributes:
+        settings (GlobalSettings): The settings the proxies are created with.
+        proxy_manager (ProxyManager): The manager transcoding the files.
+        current_project (ProxiesProject): The project parameters.
+        errors (List[str]): The URIs which could not be proxied.
+    """
+
+    def __init__(self, settings, scaled=False, force=False):
+        Loggable.__init__(self)
+        self.settings = settings
+        # The ProxyManager gets the current project from here.
+        self.project_manager = self
+        self.current_project = ProxiesProject(settings)
+        # The jobs of the app, which might be running, are left alone.
+        self.proxy_manager = ProxyManager(self, save_jobs=False)
+        self.proxy_manager.connect("proxy-ready", self.__proxy_ready_cb)
+        self.proxy_manager.connect("error-preparing-asset", self.__error_preparing_asset_cb)
+
+        self.errors = []
+        self.__scaled = scaled
+        self.__force = force
+        # The URIs of the files being discovered or proxied.
+        self.__pending_uris = set()
+        self.__mainloop = GLib.MainLoop()
+
+    @staticmethod
+    def list_uris(paths):
+        """Gets the URIs of the files at or under the specified paths.
+
+        Args:
+            paths (List[str]): File or directory paths or URIs.
+
+        Returns:
+            List[str]: The URIs of the files, except the proxies.
+        """
+        uris = []
+        for path in paths:
+            if Gst.uri_is_valid(path):
+                path = path_from_uri(path)
+
+            if os.path.isdir(path):
+                files = []
+                for dirpath, dirnames, filenames in os.walk(path):
+                    dirnames.sort()
+                    files.extend(os.path.join(dirpath, filename)
+                                 for filename in sorted(filenames)
+                                 if not filename.startswith("."))
+            else:
+                files = [path]
+
+            for file_path in files:
+                uri = quote_uri(Gst.filename_to_uri(os.path.abspath(file_path)))
+                if ProxyManager.is_proxy_asset(uri) or uri.endswith(ProxyManager.part_suffix):
+                    continue
+                uris.append(uri)
+
+        return uris
+
+    def run(self, uris):
+        """Creates the proxies of the specified files.
+
+        Args:
+            uris (List[str]): The URIs of the files.
+
+        Returns:
+            bool: True if all the files could be proxied or do not need it.
+        """
+        if self.proxy_manager.proxying_unsupported:
+            self.errors.extend(uris)
+            return False
+
+        for uri in uris:
+            self.__pending_uris.add(uri)
+            GES.Asset.request_async(GES.UriClip, uri, None, self.__asset_loaded_cb, uri)
+
+        if self.__pending_uris:
+            self.__mainloop.run()
+
+        return not self.errors
+
+    def __asset_loaded_cb(self, unused_source, res, uri):
+        try:
+            asset = GES.Asset.request_finish(res)
+        except GLib.Error as e:
+            self.errors.append(uri)
+            self.__done(uri, _("Not a media file: %s") % e.message)
+            return
+
+        asset.force_proxying = self.__force
+        asset.proxying_error = None
+        self.proxy_manager.add_job(asset, scaled=self.__scaled)
+
+    def __proxy_ready_cb(self, unused_proxy_manager, asset, proxy):
+        if proxy:
+            self.__done(asset.props.id, proxy.props.id)
+        else:
+            self.__done(asset.props.id, _("Does not need a proxy"))
+
+    def __error_preparing_asset_cb(self, unused_proxy_manager, asset, unused_proxy, error):
+        self.errors.append(asset.props.id)
+        self.__done(asset.props.id, _("Failed: %s") % error.message)
+
+    def __done(self, uri, message):
+        print("%s: %s" % (path_from_uri(uri), message))
+        self.__pending_uris.discard(uri)
+        if not self.__pending_uris:
+            self.__mainloop.quit()
+
+
+def main(argv):
+    """Creates the proxies of the media files specified on the command line.
+
+    Args:
+        argv (List[str]): The arguments following the subcommand.
+
+    Returns:
+        int: The exit status.
+    """
+    settings = GlobalSettings()
+
+    parser = argparse.ArgumentParser(
+        prog="pitivi generate-proxies",
+        description=_("Creates the proxies of media files, using the proxy settings of Pitivi."))
+    parser.add_argument("paths", nargs="+", metavar="PATH",
+                        help=_("Media files, or directories to search for media files"))
+    parser.add_argument("--scaled", action="store_true",
+                        help=_("Create scaled proxies instead of high-quality proxies"))
+    parser.add_argument("--width", type=int, default=settings.default_scaled_proxy_width,
+                        help=_("The max width of the scaled proxies"))
+    parser.add_argument("--height", type=int, default=settings.default_scaled_proxy_height,
+                        help=_("The max height of the scaled proxies"))
+    parser.add_argument("--jobs", type=int, default=settings.num_transcoding_jobs,
+                        help=_("How many files are transcoded in parallel"))
+    parser.add_argument("--force", action="store_true",
+                        help=_("Create proxies even for the formats not needing them"))
+    args = parser.parse_args(argv)
+
+    enable_color = os.environ.get("PITIVI_DEBUG_NO_COLOR", "0") not in ("", "1")
+    loggable.init("PITIVI_DEBUG", enable_color, "GST_DEBUG" in os.environ)
+
+    settings.num_transcoding_jobs = max(1, args.jobs)
+    settings.default_scaled_proxy_width = args.width
+    settings.default_scaled_proxy_height = args.height
+    if args.force and settings.proxying_strategy == ProxyingStrategy.NOTHING:
+        settings.proxying_strategy = ProxyingStrategy.AUTOMATIC
+
+    generator = ProxiesGenerator(settings, scaled=args.scaled, force=args.force)
+    uris = generator.list_uris(args.paths)
+    if not generator.run(uris):
+        print(_("Failed creating the proxies of %d files") % len(generator.errors))
+        return 1
+    return 0
@@ -100,7 +100,10 @@ class Notification:
     def signal_name(attrname):
         return attrname + "Changed"
 
-    def __get__(self, instance, unused):
+    def __get__(self, instance, owner):
+        if instance is None:
+            # The default value, when accessed on the class.
+            return getattr(owner, self.attrname)
         return getattr(instance, self.attrname)
 
     def __set__(self, instance, value):
@@ -26,13 +26,12 @@ from gi.repository import GObject
 from gi.repository import Gst
 from gi.repository import GstController
 from gi.repository import Gtk
-from matplotlib.backends.backend_gtk3cairo import FigureCanvasGTK3Cairo as FigureCanvas
-from matplotlib.figure import Figure
 
 from pitivi.configure import get_pixmap_dir
 from pitivi.effects import ALLOWED_ONLY_ONCE_EFFECTS
 from pitivi.timeline.previewers import AudioPreviewer
 from pitivi.timeline.previewers import ImagePreviewer
+from pitivi.timeline.previewers import Previewer
 from pitivi.timeline.previewers import TitlePreviewer
 from pitivi.timeline.previewers import VideoPreviewer
 from pitivi.undo.timeline import CommitTimelineFinalizingAction
@@ -46,11 +45,16 @@ from pitivi.utils.timeline import Selected
 from pitivi.utils.timeline import UNSELECT
 from pitivi.utils.timeline import Zoomable
 from pitivi.utils.ui import EFFECT_TARGET_ENTRY
+from pitivi.utils.ui import hex_to_rgb
 from pitivi.utils.ui import set_children_state_recurse
 from pitivi.utils.ui import unset_children_state_recurse
 
 KEYFRAME_LINE_HEIGHT = 2
 KEYFRAME_LINE_ALPHA = 0.5
+# The max distance in pixels at which the line is considered clicked.
+KEYFRAME_LINE_PICK_RADIUS = 5
+KEYFRAME_NODE_RADIUS = 5
+SPECIAL_KEYFRAME_NODE_RADIUS = 6
 KEYFRAME_LINE_COLOR = "#EDD400"  # "Tango" medium yellow
 KEYFRAME_NODE_COLOR = "#F57900"  # "Tango" medium orange
 SELECTED_KEYFRAME_NODE_COLOR = "#204A87"  # "Tango" dark sky blue
@@ -73,7 +77,13 @@ def get_pspec(element_factory_name, propname):
     return [prop for prop in element.list_properties() if prop.name == propname][0]
 
 
-class KeyframeCurve(FigureCanvas, Loggable):
+class KeyframeCurve(Gtk.DrawingArea, Loggable):
+    """Widget for editing the keyframes of a property of a clip.
+
+    The keyframes are drawn as diamonds connected by a line, over the
+    entire width of the clip.
+    """
+
     YLIM_OVERRIDES = {}
 
     __YLIM_OVERRIDES_VALUES = [("volume", "volume", (0.0, 0.2))]
@@ -91,8 +101,7 @@ class KeyframeCurve(FigureCanvas, Loggable):
     }
 
     def __init__(self, timeline, binding, ges_elem):
-        figure = Figure()
-        FigureCanvas.__init__(self, figure)
+        Gtk.DrawingArea.__init__(self)
         Loggable.__init__(self)
 
         self._ges_elem = ges_elem
@@ -102,6 +111,10 @@ class KeyframeCurve(FigureCanvas, Loggable):
         self.__property_name = binding.props.name
         self.__paramspec = binding.pspec
         self.get_style_context().add_class("KeyframeCurve")
+        self.add_events(Gdk.EventMask.BUTTON_PRESS_MASK |
+                        Gdk.EventMask.BUTTON_RELEASE_MASK |
+                        Gdk.EventMask.POINTER_MOTION_MASK |
+                        Gdk.EventMask.LEAVE_NOTIFY_MASK)
 
         self.__ylim_min, self.__ylim_max = KeyframeCurve.YLIM_OVERRIDES.get(
             binding.pspec, (0.0, 1.0))
@@ -111,35 +124,6 @@ class KeyframeCurve(FigureCanvas, Loggable):
         # and values.
         self._line_xs = []
         self._line_ys = []
-
-        # facecolor to None for transparency
-        self._ax = figure.add_axes([0, 0, 1, 1], facecolor='None')
-        # Clear the Axes object.
-        self._ax.cla()
-        self._ax.grid(False)
-        self._ax.tick_params(axis='both',
-                             which='both',
-                             bottom=False,
-                             top=False,
-                             right=False,
-                             left=False)
-
-        # This seems to also be necessary for transparency ..
-        figure.patch.set_visible(False)
-
-        # The PathCollection object holding the keyframes dots.
-        sizes = [50]
-        self._keyframes = self._ax.scatter([], [], marker='D', s=sizes,
-                                           c=KEYFRAME_NODE_COLOR, zorder=2)
-
-        # matplotlib weirdness, simply here to avoid a warning ..
-        self._keyframes.set_picker(True)
-
-        # The Line2D object holding the lines between keyframes.
-        self.__line = self._ax.plot([], [],
-                                    alpha=KEYFRAME_LINE_ALPHA,
-                                    c=KEYFRAME_LINE_COLOR,
-                                    linewidth=KEYFRAME_LINE_HEIGHT, zorder=1)[0]
         self._update_plots()
 
         # Drag and drop logic
@@ -154,17 +138,7 @@ class KeyframeCurve(FigureCanvas, Loggable):
 
         self.__hovered = False
 
-        self.connect("motion-notify-event", self.__gtk_motion_event_cb)
-        self.connect("event", self._event_cb)
-        self.connect("notify::height-request", self.__height_request_cb)
-
-        self.mpl_connect('button_press_event', self._mpl_button_press_event_cb)
-        self.mpl_connect('button_release_event', self._mpl_button_release_event_cb)
-        self.mpl_connect('motion_notify_event', self._mpl_motion_event_cb)
-
     def release(self):
-        disconnect_all_by_func(self, self.__height_request_cb)
-        disconnect_all_by_func(self, self.__gtk_motion_event_cb)
         disconnect_all_by_func(self, self._control_source_changed_cb)
 
     def _connect_sources(self):
@@ -187,35 +161,65 @@ class KeyframeCurve(FigureCanvas, Loggable):
         self._populate_lines()
 
     def _populate_lines(self):
-        self._ax.set_xlim(self._line_xs[0], self._line_xs[-1])
-        self.__compute_ylim()
-
-        arr = numpy.array((self._line_xs, self._line_ys))
-        arr = arr.transpose()
-        self._keyframes.set_offsets(arr)
-        self.__line.set_xdata(self._line_xs)
-        self.__line.set_ydata(self._line_ys)
         self.queue_draw()
 
-    # Private methods
-    def __compute_ylim(self):
-        height = self.props.height_request
+    def _has_plot(self):
+        return len(self._line_xs) >= 2
 
-        if height <= 0:
-            return
-
-        ylim_min = -(KEYFRAME_LINE_HEIGHT / height)
-        ylim_max = (self.__ylim_max * height) / (height - KEYFRAME_LINE_HEIGHT)
-        self._ax.set_ylim(ylim_min, ylim_max)
+    def _data_to_pixel(self, xdata, ydata):
+        """Converts timestamps and values to positions in the widget."""
+        width = self.props.width_request
+        height = self.props.height_request
+        x = (xdata - self._line_xs[0]) * width / (self._line_xs[-1] - self._line_xs[0])
+        # Keep the line entirely visible at the limits.
+        y = KEYFRAME_LINE_HEIGHT + (self.__ylim_max - ydata) * \
+            (height - 2 * KEYFRAME_LINE_HEIGHT) / (self.__ylim_max - self.__ylim_min)
+        return x, y
+
+    def _pixel_to_data(self, x, y):
+        """Converts a position in the widget to a timestamp and a value."""
+        width = max(1, self.props.width_request)
+        height = max(1, self.props.height_request - 2 * KEYFRAME_LINE_HEIGHT)
+        xdata = self._line_xs[0] + x * (self._line_xs[-1] - self._line_xs[0]) / width
+        ydata = self.__ylim_max - (y - KEYFRAME_LINE_HEIGHT) * \
+            (self.__ylim_max - self.__ylim_min) / height
+        return int(xdata), ydata
+
+    def _contains(self, x, y):
+        """Checks whether the position is in the widget."""
+        return 0 <= x <= self.props.width_request and \
+            0 <= y <= self.props.height_request
+
+    def _keyframe_at(self, x, y):
+        """Gets the index of the keyframe drawn at the specified position.
 
-    def __height_request_cb(self, unused_self, unused_pspec):
-        self.__compute_ylim()
+        Returns:
+            Optional[int]: The index of the closest keyframe, if any.
+        """
+        xs, ys = self._data_to_pixel(numpy.array(self._line_xs), numpy.array(self._line_ys))
+        distances = numpy.abs(xs - x) + numpy.abs(ys - y)
+        index = int(distances.argmin())
+        if distances[index] > KEYFRAME_NODE_RADIUS:
+            return None
+        return index
+
+    def _line_contains(self, x, y):
+        """Checks whether the line is drawn at the specified position."""
+        xs, ys = self._data_to_pixel(numpy.array(self._line_xs), numpy.array(self._line_ys))
+        x0, y0 = xs[:-1], ys[:-1]
+        dx, dy = xs[1:] - x0, ys[1:] - y0
+        lengths = dx ** 2 + dy ** 2
+        # The projection of the position on each segment.
+        ratios = numpy.clip(((x - x0) * dx + (y - y0) * dy) / numpy.maximum(lengths, 1), 0, 1)
+        distances = numpy.hypot(x0 + ratios * dx - x, y0 + ratios * dy - y)
+        return distances.min() <= KEYFRAME_LINE_PICK_RADIUS
 
-    def __maybe_create_keyframe(self, event):
-        line_contains = self.__line.contains(event)[0]
-        keyframe_existed = self._keyframes.contains(event)[0]
+    # Private methods
+    def __maybe_create_keyframe(self, x, y, xdata):
+        line_contains = self._line_contains(x, y)
+        keyframe_existed = self._keyframe_at(x, y) is not None
         if line_contains and not keyframe_existed:
-            self._create_keyframe(event.xdata)
+            self._create_keyframe(xdata)
 
     def _create_keyframe(self, timestamp):
         res, value = self.__source.control_source_get_value(timestamp)
@@ -254,42 +258,53 @@ class KeyframeCurve(FigureCanvas, Loggable):
             assert res
             self.__source.set(offset, value)
 
+    @staticmethod
+    def _draw_keyframe(cr, x, y, color, radius):
+        cr.move_to(x, y - radius)
+        cr.line_to(x + radius, y)
+        cr.line_to(x, y + radius)
+        cr.line_to(x - radius, y)
+        cr.close_path()
+        cr.set_source_rgb(*hex_to_rgb(color[1:]))
+        cr.fill()
+
     # Callbacks
     def _control_source_changed_cb(self, unused_control_source, unused_timed_value):
         self._update_plots()
         self._timeline.ges_timeline.get_parent().commit_timeline()
 
-    def __gtk_motion_event_cb(self, unused_widget, unused_event):
-        # We need to do this here, because Matplotlib's callbacks can't stop
-        # signal propagation.
-        if self.handling_motion:
-            return True
-        return False
+    def do_draw(self, cr):
+        if not self._has_plot():
+            return
 
-    def _event_cb(self, unused_element, event):
-        if event.type == Gdk.EventType.LEAVE_NOTIFY:
-            cursor = NORMAL_CURSOR
-            self._timeline.get_window().set_cursor(cursor)
+        xs, ys = self._data_to_pixel(numpy.array(self._line_xs), numpy.array(self._line_ys))
+        cr.set_line_width(KEYFRAME_LINE_HEIGHT)
+        cr.set_source_rgba(*hex_to_rgb(KEYFRAME_LINE_COLOR[1:]), KEYFRAME_LINE_ALPHA)
+        cr.move_to(xs[0], ys[0])
+        for x, y in zip(xs[1:], ys[1:]):
+            cr.line_to(x, y)
+        cr.stroke()
+
+        for x, y in zip(xs, ys):
+            self._draw_keyframe(cr, x, y, KEYFRAME_NODE_COLOR, KEYFRAME_NODE_RADIUS)
+
+    def do_leave_notify_event(self, unused_event):
+        self._timeline.get_window().set_cursor(NORMAL_CURSOR)
         return False
 
-    def _mpl_button_press_event_cb(self, event):
-        if event.button != 1:
-            return
+    def do_button_press_event(self, event):
+        if event.button != Gdk.BUTTON_PRIMARY or not self._has_plot():
+            return False
 
-        result = self._keyframes.contains(event)
-        if result[0]:
+        index = self._keyframe_at(event.x, event.y)
+        if index is not None:
             # A keyframe has been clicked.
-            keyframe_index = result[1]['ind'][0]
-            offsets = self._keyframes.get_offsets()
-            offset = offsets[keyframe_index][0]
-
-            # pylint: disable=protected-access
-            if event.guiEvent.type == Gdk.EventType._2BUTTON_PRESS:
-                index = result[1]['ind'][0]
-                # pylint: disable=consider-using-in
-                if index == 0 or index == len(offsets) - 1:
+            offset = self._line_xs[index]
+
+            if event.type == Gdk.EventType.DOUBLE_BUTTON_PRESS:
+                if index in (0, len(self._line_xs) - 1):
                     # It's an edge keyframe. These should not be removed.
-                    return
+                    return False
 
                 # Rollback the last operation if it is "Move keyframe".
                 # This is needed because a double-click also triggers a
@@ -305,48 +320,51 @@ class KeyframeCurve(FigureCanvas, Loggable):
                                                     toplevel=True)
                 self._offset = offset
                 self.handling_motion = True
-            return
+            return False
 
-        result = self.__line.contains(event)
-        if result[0]:
+        if self._line_contains(event.x, event.y):
             # The line has been clicked.
             self.debug("The keyframe curve has been clicked")
             self._timeline.app.action_log.begin("Move keyframe curve segment",
                                                 toplevel=True)
-            x = event.xdata
-            offsets = self._keyframes.get_offsets()
-            keyframes = offsets[:, 0]
-            right = numpy.searchsorted(keyframes, x)
+            xdata, ydata = self._pixel_to_data(event.x, event.y)
+            right = numpy.searchsorted(self._line_xs, xdata)
+            right = max(1, min(right, len(self._line_xs) - 1))
             # Remember the clicked line for drag&drop.
-            self.__clicked_line = (offsets[right - 1], offsets[right])
-            self.__ydata_drag_start = max(self.__ylim_min, min(event.ydata, self.__ylim_max))
+            self.__clicked_line = ((self._line_xs[right - 1], self._line_ys[right - 1]),
+                                   (self._line_xs[right], self._line_ys[right]))
+            self.__ydata_drag_start = max(self.__ylim_min, min(ydata, self.__ylim_max))
             self.handling_motion = True
 
-    def _mpl_motion_event_cb(self, event):
-        if event.ydata is not None and event.xdata is not None:
-            # The mouse event is in the figure boundaries.
+        return False
+
+    def do_motion_notify_event(self, event):
+        if not self._has_plot():
+            return False
+
+        xdata, ydata = self._pixel_to_data(event.x, event.y)
+        if self._contains(event.x, event.y):
             if self._offset is not None:
                 self._dragged = True
-                keyframe_ts = self.__compute_keyframe_new_timestamp(event)
-                ydata = max(self.__ylim_min, min(event.ydata, self.__ylim_max))
+                keyframe_ts = self.__compute_keyframe_new_timestamp(xdata)
+                ydata = max(self.__ylim_min, min(ydata, self.__ylim_max))
 
                 self._move_keyframe(int(self._offset), keyframe_ts, ydata)
                 self._offset = keyframe_ts
-                self._update_tooltip(event)
                 hovering = True
             elif self.__clicked_line:
                 self._dragged = True
-                ydata = max(self.__ylim_min, min(event.ydata, self.__ylim_max))
+                ydata = max(self.__ylim_min, min(ydata, self.__ylim_max))
                 self._move_keyframe_line(self.__clicked_line, ydata, self.__ydata_drag_start)
                 hovering = True
             else:
-                hovering = self.__line.contains(event)[0]
+                hovering = self._line_contains(event.x, event.y)
         else:
             hovering = False
 
         if hovering:
             cursor = DRAG_CURSOR
-            self._update_tooltip(event)
+            self._update_tooltip(xdata)
             if not self.__hovered:
                 self.emit("enter")
                 self.__hovered = True
@@ -359,27 +377,30 @@ class KeyframeCurve(FigureCanvas, Loggable):
 
         self._timeline.get_window().set_cursor(cursor)
 
-    def _mpl_button_release_event_cb(self, event):
-        if event.button != 1:
-            return
+        # Stop the propagation while dragging.
+        return self.handling_motion
+
+    def do_button_release_event(self, event):
+        if event.button != Gdk.BUTTON_PRIMARY:
+            return False
 
         # In order to make sure we seek to the exact position where we added a
-        # new keyframe, we don't use matplotlib's event.xdata, but rather
+        # new keyframe, we don't use the position on the curve, but rather
         # compute it the same way we do for the seek logic.
-        event_widget = Gtk.get_event_widget(event.guiEvent)
+        event_widget = Gtk.get_event_widget(event)
         x, unused_y = event_widget.translate_coordinates(self._timeline.layout.layers_vbox,
                                                          event.x, event.y)
-        event.xdata = Zoomable.pixel_to_ns(x) - self._ges_elem.props.start + self._ges_elem.props.in_point
+        xdata = Zoomable.pixel_to_ns(x) - self._ges_elem.props.start + self._ges_elem.props.in_point
 
         if self._offset is not None:
             # If dragging a keyframe, make sure the keyframe ends up exactly
             # where the mouse was released. Otherwise, the playhead will not
             # seek exactly on the keyframe.
-            if self._dragged:
-                if event.ydata is not None:
-                    keyframe_ts = self.__compute_keyframe_new_timestamp(event)
-                    ydata = max(self.__ylim_min, min(event.ydata, self.__ylim_max))
-                    self._move_keyframe(int(self._offset), keyframe_ts, ydata)
+            if self._dragged and self._contains(event.x, event.y):
+                unused_xdata, ydata = self._pixel_to_data(event.x, event.y)
+                keyframe_ts = self.__compute_keyframe_new_timestamp(xdata)
+                ydata = max(self.__ylim_min, min(ydata, self.__ylim_max))
+                self._move_keyframe(int(self._offset), keyframe_ts, ydata)
             self.debug("Keyframe released")
             self._timeline.app.action_log.commit("Move keyframe")
         elif self.__clicked_line:
@@ -388,24 +409,22 @@ class KeyframeCurve(FigureCanvas, Loggable):
 
             if not self._dragged:
                 # The keyframe line was clicked, but not dragged
-                assert event.guiEvent.type == Gdk.EventType.BUTTON_RELEASE
-                self.__maybe_create_keyframe(event)
+                self.__maybe_create_keyframe(event.x, event.y, xdata)
 
         self.handling_motion = False
         self._offset = None
         self.__clicked_line = ()
         self._dragged = False
+        return False
 
-    def _update_tooltip(self, event):
+    def _update_tooltip(self, xdata):
         """Sets or clears the tooltip showing info about the hovered line."""
         markup = None
-        if event:
-            if not event.xdata:
-                return
+        if xdata is not None:
             if self._offset is not None:
                 xdata = self._offset
             else:
-                xdata = max(self._line_xs[0], min(event.xdata, self._line_xs[-1]))
+                xdata = max(self._line_xs[0], min(xdata, self._line_xs[-1]))
             res, value = self.__source.control_source_get_value(xdata)
             assert res
             pmin = self.__paramspec.minimum
@@ -420,28 +439,28 @@ class KeyframeCurve(FigureCanvas, Loggable):
                 "{:.3f}".format(value))
         self.set_tooltip_markup(markup)
 
-    def __compute_keyframe_new_timestamp(self, event):
+    def __compute_keyframe_new_timestamp(self, xdata):
         # The user can not change the timestamp of the first
         # and last keyframes.
         values = self.__source.get_all()
         if self._offset in (values[0].timestamp, values[-1].timestamp):
             return self._offset
 
-        if event.xdata != self._offset:
+        if xdata != self._offset:
             try:
                 kf = next(kf for kf in values if kf.timestamp == int(self._offset))
             except StopIteration:
-                return event.xdata
+                return xdata
 
             i = values.index(kf)
-            keyframe_timestamp = int(event.xdata)
+            keyframe_timestamp = int(xdata)
             if keyframe_timestamp <= values[i - 1].timestamp:
                 keyframe_timestamp = values[i - 1].timestamp + 1
             if keyframe_timestamp >= values[i + 1].timestamp:
                 keyframe_timestamp = values[i + 1].timestamp - 1
             return keyframe_timestamp
 
-        return event.xdata
+        return xdata
 
 
 class MultipleKeyframeCurve(KeyframeCurve):
@@ -449,19 +468,16 @@ class MultipleKeyframeCurve(KeyframeCurve):
 
     def __init__(self, timeline, bindings, ges_elem):
         self.__bindings = bindings
+        # The offsets of the keyframes drawn highlighted, if any.
+        self.__selected_keyframe = None
+        self.__hovered_keyframe = None
         super().__init__(timeline, bindings[0], ges_elem)
 
         self._timeline = timeline
         self._project = timeline.app.project_manager.current_project
         self._project.pipeline.connect("position", self._position_cb)
 
-        sizes = [80]
-        self.__selected_keyframe = self._ax.scatter([0], [0.5], marker='D', s=sizes,
-                                                    c=SELECTED_KEYFRAME_NODE_COLOR, zorder=3)
-        self.__hovered_keyframe = self._ax.scatter([0], [0.5], marker='D', s=sizes,
-                                                   c=HOVERED_KEYFRAME_NODE_COLOR, zorder=3)
         self.__update_selected_keyframe()
-        self.__hovered_keyframe.set_visible(False)
 
     def release(self):
         super().release()
@@ -517,8 +533,20 @@ class MultipleKeyframeCurve(KeyframeCurve):
     def _move_keyframe_line(self, line, y_dest_value, y_start_value):
         pass
 
-    def _mpl_button_release_event_cb(self, event):
-        if event.button == 1:
+    def do_draw(self, cr):
+        KeyframeCurve.do_draw(self, cr)
+
+        if not self._has_plot():
+            return
+
+        for offset, color in ((self.__selected_keyframe, SELECTED_KEYFRAME_NODE_COLOR),
+                              (self.__hovered_keyframe, HOVERED_KEYFRAME_NODE_COLOR)):
+            if offset is not None:
+                x, y = self._data_to_pixel(offset, 0.5)
+                self._draw_keyframe(cr, x, y, color, SPECIAL_KEYFRAME_NODE_RADIUS)
+
+    def do_button_release_event(self, event):
+        if event.button == Gdk.BUTTON_PRIMARY:
             if self._offset is not None and not self._dragged:
                 # A keyframe was clicked but not dragged, so we
                 # should select it by seeking to its position.
@@ -531,34 +559,27 @@ class MultipleKeyframeCurve(KeyframeCurve):
                 else:
                     self._project.pipeline.simple_seek(position)
 
-        super()._mpl_button_release_event_cb(event)
+        return KeyframeCurve.do_button_release_event(self, event)
 
-    def _mpl_motion_event_cb(self, event):
-        super()._mpl_motion_event_cb(event)
+    def do_motion_notify_event(self, event):
+        res = KeyframeCurve.do_motion_notify_event(self, event)
 
-        result = self._keyframes.contains(event)
-        if result[0]:
-            # A keyframe is hovered
-            keyframe_index = result[1]['ind'][0]
-            offset = self._keyframes.get_offsets()[keyframe_index][0]
-            self.__show_special_keyframe(self.__hovered_keyframe, offset)
-        else:
-            self.__hide_special_keyframe(self.__hovered_keyframe)
+        hovered_keyframe = None
+        if self._has_plot():
+            index = self._keyframe_at(event.x, event.y)
+            if index is not None:
+                # A keyframe is hovered
+                hovered_keyframe = self._line_xs[index]
+        if hovered_keyframe != self.__hovered_keyframe:
+            self.__hovered_keyframe = hovered_keyframe
+            self.queue_draw()
 
-    def __show_special_keyframe(self, keyframe, offset):
-        offsets = numpy.array([[offset, 0.5]])
-        keyframe.set_offsets(offsets)
-        keyframe.set_visible(True)
-        self.queue_draw()
-
-    def __hide_special_keyframe(self, keyframe):
-        keyframe.set_visible(False)
-        self.queue_draw()
+        return res
 
     def _control_source_changed_cb(self, control_source, timed_value):
         super()._control_source_changed_cb(control_source, timed_value)
         self.__update_selected_keyframe()
-        self.__hide_special_keyframe(self.__hovered_keyframe)
+        self.__hovered_keyframe = None
 
     def _position_cb(self, unused_pipeline, unused_position):
         self.__update_selected_keyframe()
@@ -575,21 +596,18 @@ class MultipleKeyframeCurve(KeyframeCurve):
             return
         source_position = position - source.props.start + source.props.in_point
 
-        offsets = self._keyframes.get_offsets()
-        keyframes = offsets[:, 0]
-
+        keyframes = self._line_xs
         index = numpy.searchsorted(keyframes, source_position)
         if 0 <= index < len(keyframes) and keyframes[index] == source_position:
-            self.__show_special_keyframe(self.__selected_keyframe, source_position)
+            self.__selected_keyframe = source_position
         else:
-            self.__hide_special_keyframe(self.__selected_keyframe)
+            self.__selected_keyframe = None
+        self.queue_draw()
 
-    def _update_tooltip(self, event):
+    def _update_tooltip(self, xdata):
         markup = None
-        if event:
-            if not event.xdata:
-                return
-            markup = _("Timestamp: %s") % Gst.TIME_ARGS(event.xdata)
+        if xdata is not None:
+            markup = _("Timestamp: %s") % Gst.TIME_ARGS(xdata)
         self.set_tooltip_markup(markup)
 
 
@@ -622,9 +640,9 @@ class TimelineElement(Gtk.Layout, Zoomable, Loggable):
 
         self.props.vexpand = True
 
-        self.__previewer = self._get_previewer()
-        if self.__previewer:
-            self.add(self.__previewer)
+        # Created only while the element is around the visible area
+        # of the timeline, see set_previewer_enabled.
+        self.__previewer = None
 
         self.__background = self._get_background()
         if self.__background:
@@ -645,10 +663,41 @@ class TimelineElement(Gtk.Layout, Zoomable, Loggable):
             self.__previewer.refresh()
 
     def release(self):
-        if self.__previewer:
-            self.__previewer.release()
+        self.set_previewer_enabled(False)
 
     # Public API
+    def set_previewer_enabled(self, enabled):
+        """Creates or releases the previewer.
+
+        The background stands in for the previewer while disabled.
+
+        Args:
+            enabled (bool): Whether the element should have a previewer.
+        """
+        if enabled == bool(self.__previewer):
+            return
+
+        if not enabled:
+            self.remove(self.__previewer)
+            self.__previewer.release()
+            Previewer.manager.remove_previewer(self.__previewer)
+            self.__previewer = None
+            return
+
+        self.__previewer = self._get_previewer()
+        if not self.__previewer:
+            return
+
+        self.__previewer.set_size_request(self.__width, self.__height)
+        self.__previewer.set_selected(bool(self._ges_elem.selected))
+        self.add(self.__previewer)
+        self.__previewer.show_all()
+
+        if self.keyframe_curve and self.keyframe_curve.get_parent():
+            # Keep the keyframe curve above the previewer.
+            self.remove(self.keyframe_curve)
+            self.add(self.keyframe_curve)
+
     def set_size(self, width, height):
         width = max(0, width)
         self.set_size_request(width, height)
@@ -1015,7 +1064,8 @@ class VideoUriSource(VideoSource):
         if isinstance(self._ges_elem, GES.ImageSource):
             previewer = ImagePreviewer(self._ges_elem, self.timeline.app.settings.previewers_max_cpu)
         else:
-            previewer = VideoPreviewer(self._ges_elem, self.timeline.app.settings.previewers_max_cpu)
+            previewer = VideoPreviewer(self._ges_elem, self.timeline.app.settings.previewers_max_cpu,
+                                       hadj=self.timeline.hadj)
         return previewer
 
     def _get_default_mixing_property(self):
@@ -1128,6 +1178,8 @@ class Clip(Gtk.EventBox, Zoomable, Loggable):
 
         self.audio_widget = None
         self.video_widget = None
+        # Whether the elements have previewers, see set_previewers_enabled.
+        self.previewers_enabled = False
 
         self._setup_widget()
         self.__force_position_update = True
@@ -1209,6 +1261,9 @@ class Clip(Gtk.EventBox, Zoomable, Loggable):
         return None
 
     def update_position(self):
+        if self.timeline.defer_batch_update(self.update_position, self.ges_clip):
+            return
+
         layer = self.layer
         if not layer or layer != self.get_parent():
             # Things are not settled yet.
@@ -1242,6 +1297,8 @@ class Clip(Gtk.EventBox, Zoomable, Loggable):
 
             layer.move(self, x, y)
             self.set_size_request(width, height)
+            # The clip might have got in or out of view.
+            self.timeline.schedule_previewers_update()
 
             elements = self._elements_container.get_children()
             for child in elements:
@@ -1255,6 +1312,17 @@ class Clip(Gtk.EventBox, Zoomable, Loggable):
             self._current_parent_height = parent_height
             self._current_parent = layer
 
+    def set_previewers_enabled(self, enabled):
+        """Creates or releases the previewers of the elements.
+
+        Args:
+            enabled (bool): Whether the elements should have previewers.
+        """
+        self.previewers_enabled = enabled
+        for child in self.ges_clip.get_children(False):
+            if child.ui:
+                child.ui.set_previewer_enabled(enabled)
+
     def _setup_widget(self):
         pass
 
@@ -1380,6 +1448,8 @@ class Clip(Gtk.EventBox, Zoomable, Loggable):
         self.__force_position_update = True
         self._add_child(ges_timeline_element)
         self.__connect_to_child(ges_timeline_element)
+        if self.previewers_enabled and ges_timeline_element.ui:
+            ges_timeline_element.ui.set_previewer_enabled(True)
         self.update_position()
 
     def _remove_child(self, ges_timeline_element):
@@ -25,6 +25,7 @@ from gi.repository import Gtk
 from pitivi.timeline import elements
 from pitivi.undo.timeline import CommitTimelineFinalizingAction
 from pitivi.utils.loggable import Loggable
+from pitivi.utils.timeline import ClipsIndex
 from pitivi.utils.timeline import Zoomable
 from pitivi.utils.ui import LAYER_HEIGHT
 from pitivi.utils.ui import PADDING
@@ -293,7 +294,11 @@ class LayerControls(Gtk.EventBox, Loggable):
 
 
 class Layer(Gtk.Layout, Zoomable, Loggable):
-    """Container for the clips widgets of a layer."""
+    """Container for the clips widgets of a layer.
+
+    Attributes:
+        clips_index (ClipsIndex): The clips of the layer by position.
+    """
 
     __gtype_name__ = "PitiviLayer"
 
@@ -309,6 +314,7 @@ class Layer(Gtk.Layout, Zoomable, Loggable):
 
         self._children = []
         self._changed = False
+        self.clips_index = ClipsIndex(ges_layer)
 
         self.ges_layer.connect("clip-added", self._clip_added_cb)
         self.ges_layer.connect("clip-removed", self._clip_removed_cb)
@@ -350,12 +356,15 @@ class Layer(Gtk.Layout, Zoomable, Loggable):
             self._remove_clip(ges_clip)
         self.ges_layer.disconnect_by_func(self._clip_added_cb)
         self.ges_layer.disconnect_by_func(self._clip_removed_cb)
+        self.clips_index.release()
 
     def check_media_types(self):
         if self.timeline.editing_context:
             self.info("Not updating media types as"
                       " we are editing the timeline")
             return
+        if self.timeline.defer_batch_update(self.check_media_types, self.ges_layer):
+            return
         old_media_types = self.media_types
         self.media_types = GES.TrackType(0)
         ges_clips = self.ges_layer.get_clips()
@@ -15,11 +15,14 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Previewers for the timeline."""
+import collections
 import contextlib
 import hashlib
 import os
 import random
 import sqlite3
+import threading
+import time
 from gettext import gettext as _
 
 import cairo
@@ -34,16 +37,22 @@ from gi.repository import Gtk
 from gi.repository import Pango
 from gi.repository import PangoCairo
 
+from pitivi.dialogs.prefs import PreferencesDialog
 from pitivi.settings import GlobalSettings
 from pitivi.settings import xdg_cache_home
+from pitivi.utils.discoverer import DiscovererCache
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import path_from_uri
 from pitivi.utils.misc import quantize
 from pitivi.utils.misc import quote_uri
 from pitivi.utils.pipeline import MAX_BRINGING_TO_PAUSED_DURATION
+from pitivi.utils.proxy import get_preview_uri
 from pitivi.utils.proxy import get_proxy_target
 from pitivi.utils.proxy import ProxyManager
+from pitivi.utils.system import create_cpu_throttling_clock
 from pitivi.utils.system import CPUUsageTracker
+from pitivi.utils.system import LoadGovernor
+from pitivi.utils.threads import Thread
 from pitivi.utils.timeline import Zoomable
 from pitivi.utils.ui import CLIP_BORDER_WIDTH
 from pitivi.utils.ui import EXPANDED_SIZE
@@ -57,6 +66,9 @@ except ImportError:
 
 
 SAMPLE_DURATION = Gst.SECOND / 100
+# The number of values of a level of the waveform peaks merged into
+# a value of the next level.
+PEAKS_LEVEL_FACTOR = 4
 
 # Horizontal space between thumbs.
 THUMB_MARGIN_PX = 3
@@ -66,6 +78,13 @@ assert Gst.SECOND % THUMB_PERIOD == 0
 # For the waveforms, ensures we always have a little extra surface when
 # scrolling while playing, in pixels.
 WAVEFORM_SURFACE_EXTRA_PX = 500
+# For the thumbnails, the width of the region around the visible area
+# of the timeline for which thumbnails are displayed, in pixels.
+THUMBS_EXTRA_PX = 500
+# The max distance between the positions of thumbnails for which it's cheaper
+# to decode linearly from one to the next instead of doing an accurate seek,
+# which has to decode from the previous keyframe.
+THUMBS_BATCH_MAX_GAP = 5 * Gst.SECOND
 
 PREVIEW_GENERATOR_SIGNALS = {
     "done": (GObject.SignalFlags.RUN_LAST, None, ()),
@@ -79,6 +98,35 @@ GlobalSettings.add_config_option("previewers_max_cpu",
                                  key="max-cpu-usage",
                                  default=90)
 
+GlobalSettings.add_config_option("previewers_num_workers",
+                                 section="previewers",
+                                 key="num-workers",
+                                 default=2,
+                                 notify=True)
+PreferencesDialog.add_numeric_preference("previewers_num_workers",
+                                         description=_("How many thumbnail and waveform generation "
+                                                       "jobs run in parallel, for each of audio and video."),
+                                         section="timeline",
+                                         label=_("Max number of parallel preview jobs"),
+                                         lower=1)
+
+GlobalSettings.add_config_option("previewers_thumbnails_memory",
+                                 section="previewers",
+                                 key="thumbnails-memory-mb",
+                                 default=64,
+                                 notify=True)
+PreferencesDialog.add_numeric_preference("previewers_thumbnails_memory",
+                                         description=_("How much memory the thumbnails "
+                                                       "shown in the timeline can use, in MB."),
+                                         section="timeline",
+                                         label=_("Max memory for thumbnails"),
+                                         lower=1)
+
+GlobalSettings.add_config_option("previewers_cache_max_size",
+                                 section="previewers",
+                                 key="cache-max-size-mb",
+                                 default=2048)
+
 
 class PreviewerBin(Gst.Bin, Loggable):
     """Baseclass for elements gathering data to create previews."""
@@ -159,7 +207,10 @@ class TeedThumbnailBin(PreviewerBin):
 
 
 class WaveformPreviewer(PreviewerBin):
-    """Bin to generate and save waveforms as a .npy file."""
+    """Bin to generate and save waveforms as .npy files.
+
+    Saves the RMS values, and the WaveformPeaks.
+    """
 
     __gproperties__ = {
         "uri": (str,
@@ -184,8 +235,12 @@ class WaveformPreviewer(PreviewerBin):
 
         self.uri = None
         self.wavefile = None
+        self.peaksfile = None
         self.passthrough = False
         self.samples = None
+        # The peak values for each channel.
+        self.max_peaks = None
+        self.waveform_peaks = None
         self.n_samples = 0
         self.duration = 0
         self.prev_pos = 0
@@ -203,6 +258,7 @@ class WaveformPreviewer(PreviewerBin):
         if prop.name == 'uri':
             self.uri = value
             self.wavefile = get_wavefile_location_for_uri(self.uri)
+            self.peaksfile = get_peaksfile_location_for_uri(self.uri)
             self.passthrough = os.path.exists(self.wavefile)
         elif prop.name == 'duration':
             self.duration = value
@@ -223,48 +279,58 @@ class WaveformPreviewer(PreviewerBin):
                 stream_time = struct.get_value("stream-time")
 
                 if self.peaks is None:
-                    self.peaks = []
-                    for unused_channel in peaks:
-                        self.peaks.append([0] * int(self.n_samples))
+                    shape = (len(peaks), int(self.n_samples))
+                    self.peaks = numpy.zeros(shape)
+                    self.max_peaks = numpy.zeros(shape)
 
                 pos = int(stream_time / SAMPLE_DURATION)
-                if pos >= len(self.peaks[0]):
+                if pos >= self.peaks.shape[1]:
                     return False
 
-                for i, val in enumerate(peaks):
-                    if val < 0:
-                        val = 10 ** (val / 20) * 100
-                    else:
-                        val = self.peaks[i][pos - 1]
-
-                    # Linearly joins values between to known samples values.
-                    unknowns = range(self.prev_pos + 1, pos)
-                    if unknowns:
-                        prev_val = self.peaks[i][self.prev_pos]
-                        linear_const = (val - prev_val) / len(unknowns)
-                        for temppos in unknowns:
-                            self.peaks[i][temppos] = self.peaks[i][temppos - 1] + linear_const
-
-                    self.peaks[i][pos] = val
+                self.__add_values(self.peaks, peaks, pos)
+                self.__add_values(self.max_peaks, struct.get_value("peak"), pos)
 
                 self.prev_pos = pos
 
         return Gst.Bin.do_post_message(self, message)
 
+    def __add_values(self, channels, values, pos):
+        """Sets the dB values at pos, interpolating since the previous pos."""
+        # The negative dB values are converted, the others are replaced
+        # with the value of the previous sample.
+        vals = numpy.array([10 ** (val / 20) * 100 if val < 0 else channels[i, pos - 1]
+                            for i, val in enumerate(values)])
+
+        unknowns = pos - self.prev_pos - 1
+        if unknowns > 0:
+            # Linearly joins values between to known samples values.
+            prev_vals = channels[:, self.prev_pos]
+            steps = numpy.empty((len(vals), unknowns + 1))
+            steps[:, 0] = prev_vals
+            steps[:, 1:] = ((vals - prev_vals) / unknowns)[:, numpy.newaxis]
+            channels[:, self.prev_pos + 1:pos] = numpy.cumsum(steps, axis=1)[:, 1:]
+
+        channels[:, pos] = vals
+
     def finalize(self):
         """Finalizes the previewer, saving data to file if needed."""
-        if not self.passthrough and self.peaks:
+        if not self.passthrough and self.peaks is not None:
             # Let's go mono.
             if len(self.peaks) > 1:
-                samples = (numpy.array(self.peaks[0]) + numpy.array(self.peaks[1])) / 2
+                samples = (self.peaks[0] + self.peaks[1]) / 2
             else:
-                samples = numpy.array(self.peaks[0])
+                samples = self.peaks[0]
 
             with open(self.wavefile, 'wb') as wavefile:
                 numpy.save(wavefile, samples)
 
             self.samples = samples
 
+            # The peak of the mix is at most the loudest peak.
+            max_peaks = self.max_peaks.max(axis=0)
+            self.waveform_peaks = WaveformPeaks.from_peaks(max_peaks)
+            self.waveform_peaks.save(self.peaksfile)
+
 
 Gst.Element.register(None, "waveformbin", Gst.Rank.NONE,
                      WaveformPreviewer)
@@ -273,13 +339,23 @@ Gst.Element.register(None, "teedthumbnailbin", Gst.Rank.NONE,
 
 
 class PreviewGeneratorManager(Loggable):
-    """Manager for running the previewers."""
+    """Manager for running the previewers.
+
+    Runs up to `max_workers` previewers at the same time for each
+    GES.TrackType, the others waiting in a FIFO queue.
+    """
 
     def __init__(self):
         Loggable.__init__(self)
 
-        # The current Previewer per GES.TrackType.
-        self._current_previewers = {}
+        # The max number of Previewers running at the same time
+        # per GES.TrackType.
+        self._max_workers = GlobalSettings.previewers_num_workers
+        # The running Previewers per GES.TrackType.
+        self._current_previewers = {
+            GES.TrackType.AUDIO: [],
+            GES.TrackType.VIDEO: []
+        }
         # The queue of Previewers.
         self._previewers = {
             GES.TrackType.AUDIO: [],
@@ -287,6 +363,21 @@ class PreviewGeneratorManager(Loggable):
         }
         self._running = True
 
+    @property
+    def max_workers(self):
+        """The max number of previewers running at once per track type."""
+        return self._max_workers
+
+    def set_max_workers(self, max_workers):
+        """Sets the max number of previewers running at once per track type.
+
+        Args:
+            max_workers (int): The number of workers, at least 1.
+        """
+        self._max_workers = max(1, max_workers)
+        for track_type in self._previewers:
+            self.__start_next_previewers(track_type)
+
     def add_previewer(self, previewer):
         """Adds the specified previewer to the queue.
 
@@ -295,63 +386,75 @@ class PreviewGeneratorManager(Loggable):
         """
         track_type = previewer.track_type
 
-        current = self._current_previewers.get(track_type)
-        if previewer in self._previewers[track_type] or previewer is current:
+        if previewer in self._previewers[track_type] or \
+                previewer in self._current_previewers[track_type]:
             # Already in the queue or already processing.
             return
 
-        if not self._previewers[track_type] and current is None:
-            self._start_previewer(previewer)
-        else:
-            self._previewers[track_type].insert(0, previewer)
+        self._previewers[track_type].insert(0, previewer)
+        self.__start_next_previewers(track_type)
+
+    def remove_previewer(self, previewer):
+        """Removes the specified previewer from the queue, if waiting.
+
+        Args:
+            previewer (Previewer): The previewer not to be started anymore.
+        """
+        queue = self._previewers[previewer.track_type]
+        if previewer in queue:
+            queue.remove(previewer)
 
     def _start_previewer(self, previewer):
-        self._current_previewers[previewer.track_type] = previewer
+        self._current_previewers[previewer.track_type].append(previewer)
         previewer.connect("done", self.__previewer_done_cb)
         previewer.start_generation()
 
     @contextlib.contextmanager
     def paused(self, interrupt=False):
         """Pauses (and flushes if interrupt=True) managed previewers."""
+        self._running = False
         if interrupt:
-            for previewer in list(self._current_previewers.values()):
-                previewer.stop_generation()
+            for previewers in list(self._current_previewers.values()):
+                for previewer in list(previewers):
+                    previewer.stop_generation()
 
             for previewers in self._previewers.values():
                 for previewer in previewers:
                     previewer.stop_generation()
         else:
-            for previewer in list(self._current_previewers.values()):
-                previewer.pause_generation()
+            for previewers in self._current_previewers.values():
+                for previewer in previewers:
+                    previewer.pause_generation()
 
             for previewers in self._previewers.values():
                 for previewer in previewers:
                     previewer.pause_generation()
 
         try:
-            self._running = False
             yield
         except:
             self.warning("An exception occurred while the previewer was paused")
             raise
         finally:
             self._running = True
-            for track_type in self._previewers:
-                self.__start_next_previewer(track_type)
+            for track_type, previewers in self._current_previewers.items():
+                # Resume the previewers which have only been paused.
+                for previewer in list(previewers):
+                    previewer.start_generation()
+                self.__start_next_previewers(track_type)
 
     def __previewer_done_cb(self, previewer):
-        self.__start_next_previewer(previewer.track_type)
-
-    def __start_next_previewer(self, track_type):
-        next_previewer = self._current_previewers.pop(track_type, None)
-        if next_previewer:
-            next_previewer.disconnect_by_func(self.__previewer_done_cb)
+        previewer.disconnect_by_func(self.__previewer_done_cb)
+        self._current_previewers[previewer.track_type].remove(previewer)
+        self.__start_next_previewers(previewer.track_type)
 
+    def __start_next_previewers(self, track_type):
         if not self._running:
             return
 
-        if self._previewers[track_type]:
-            self._start_previewer(self._previewers[track_type].pop())
+        queue = self._previewers[track_type]
+        while queue and len(self._current_previewers[track_type]) < self._max_workers:
+            self._start_previewer(queue.pop())
 
 
 class Previewer(GObject.Object):
@@ -368,6 +471,9 @@ class Previewer(GObject.Object):
         GObject.Object.__init__(self)
         self.track_type = track_type
         self._max_cpu_usage = max_cpu_usage
+        # The clock throttling the pipeline, kept so its CPU usage
+        # follows the budget of the LoadGovernor.
+        self._clock = None
 
     def start_generation(self):
         """Starts preview generation."""
@@ -375,6 +481,12 @@ class Previewer(GObject.Object):
     def stop_generation(self):
         """Stops preview generation."""
 
+    def _release_clock(self):
+        """Stops following the LoadGovernor budget, once the pipeline is gone."""
+        if self._clock:
+            LoadGovernor.get().remove_consumer(self._clock)
+            self._clock = None
+
     def become_controlled(self):
         """Lets the PreviewGeneratorManager control our execution."""
         Previewer.manager.add_previewer(self)
@@ -572,6 +684,11 @@ class AssetPreviewer(Previewer, Loggable):
         self.queue = []
         # The position for which a thumbnail is currently being generated.
         self.position = -1
+        # The positions for which thumbnails are being generated in the
+        # current linear decoding pass, following self.position.
+        self.__batch = []
+        # Whether the pipeline is playing for the current pass.
+        self.__batch_playing = False
         # The positions for which we failed to get a pixbuf.
         self.failures = set()
 
@@ -616,6 +733,9 @@ class AssetPreviewer(Previewer, Loggable):
             # bringing the pipeline back to PAUSED.
             self.pipeline.set_state(Gst.State.PAUSED)
             return
+        uri = get_preview_uri(self.asset)
+        if uri != self.uri:
+            self.debug("Decoding the proxy %s", path_from_uri(uri))
         pipeline = Gst.parse_launch(
             "uridecodebin uri={uri} name=decode ! "
             "videoconvert ! "
@@ -625,7 +745,7 @@ class AssetPreviewer(Previewer, Loggable):
             "capsfilter caps=video/x-raw,format=(string)RGBA,height=(int){height},"
             "pixel-aspect-ratio=(fraction)1/1,framerate={thumbs_per_second}/1 ! "
             "gdkpixbufsink name=gdkpixbufsink".format(
-                uri=self.uri,
+                uri=uri,
                 height=self.thumb_height,
                 thumbs_per_second=int(Gst.SECOND / THUMB_PERIOD)))
 
@@ -635,6 +755,10 @@ class AssetPreviewer(Previewer, Loggable):
         decode = pipeline.get_by_name("decode")
         decode.connect("autoplug-select", self._autoplug_select_cb)
 
+        # The clock is used only when playing the batches.
+        self._clock = create_cpu_throttling_clock(self._max_cpu_usage)
+        pipeline.use_clock(self._clock)
+
         self.__preroll_timeout_id = GLib.timeout_add_seconds(MAX_BRINGING_TO_PAUSED_DURATION,
                                                              self.__preroll_timed_out_cb)
         pipeline.get_bus().add_signal_watch()
@@ -645,8 +769,9 @@ class AssetPreviewer(Previewer, Loggable):
     def _schedule_next_thumb_generation(self):
         """Schedules the generation of the next thumbnail, or stop.
 
-        Checks the CPU usage and adjusts the waiting time at which the next
-        thumbnail will be generated +/- 10%. Even then, it will only
+        Checks the CPU usage against the share of the LoadGovernor budget
+        allowed to this previewer and adjusts
+        the waiting time at which the next thumbnail will be generated +/- 10%. Even then, it will only
         happen when the gobject loop is idle to avoid blocking the UI.
         """
         if self.__thumb_cb_id:
@@ -660,7 +785,7 @@ class AssetPreviewer(Previewer, Loggable):
             return
 
         usage_percent = self.cpu_usage_tracker.usage()
-        if usage_percent < self._max_cpu_usage:
+        if usage_percent < LoadGovernor.get().share(self._clock, self._max_cpu_usage):
             self.interval *= 0.9
             self.log("Thumbnailing sped up to a %.1f ms interval for `%s`",
                      self.interval, path_from_uri(self.uri))
@@ -701,9 +826,13 @@ class AssetPreviewer(Previewer, Loggable):
         return False
 
     def _create_next_thumb_cb(self):
-        """Creates a missing thumbnail."""
+        """Creates a missing thumbnail, or a batch of close thumbnails."""
         self.__thumb_cb_id = 0
 
+        # Skip the positions handled in the meanwhile by a batch.
+        while self.queue and self.queue[0] in self.thumb_cache:
+            self.queue.pop(0)
+
         try:
             self.position = self.queue.pop(0)
         except IndexError:
@@ -712,7 +841,12 @@ class AssetPreviewer(Previewer, Loggable):
             self.stop_generation()
             return False
 
-        self.log("Creating thumb at %s", self.position)
+        self.__batch = self._pop_batch()
+        if self.__batch:
+            self.log("Creating thumbs from %s to %s in one pass",
+                     self.position, self.__batch[-1])
+        else:
+            self.log("Creating thumb at %s", self.position)
         self.pipeline.seek(1.0,
                            Gst.Format.TIME,
                            Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
@@ -721,9 +855,68 @@ class AssetPreviewer(Previewer, Loggable):
 
         # Stop calling me.
         # The seek operation will generate an ASYNC_DONE message on the bus,
-        # and then the next thumbnail generation operation will be scheduled.
+        # and then the next thumbnail generation operation will be scheduled,
+        # or the pipeline will be played to create the batch.
         return False
 
+    def _pop_batch(self):
+        """Takes from the queue the positions to be created after self.position.
+
+        The positions are created while decoding linearly from self.position,
+        so they must be close enough to each other to make this cheaper than
+        seeking to each of them.
+
+        Returns:
+            List[int]: The positions, in increasing order.
+        """
+        batch = []
+        previous = self.position
+        while self.queue:
+            position = self.queue[0]
+            if position in self.thumb_cache:
+                self.queue.pop(0)
+                continue
+            if not 0 < position - previous <= THUMBS_BATCH_MAX_GAP:
+                break
+            batch.append(self.queue.pop(0))
+            previous = position
+        return batch
+
+    def __add_batch_pixbuf(self, struct):
+        """Handles a pixbuf produced while playing a batch."""
+        stream_time = struct.get_value("stream-time")
+        while self.__batch:
+            position = self.__batch[0]
+            if stream_time + THUMB_PERIOD // 2 < position:
+                # Not there yet.
+                break
+            self.__batch.pop(0)
+            if stream_time - THUMB_PERIOD // 2 <= position:
+                pixbuf = struct.get_value("pixbuf")
+                self.thumb_cache[position] = pixbuf
+                self._set_pixbuf(pixbuf, position)
+
+        if not self.__batch:
+            self.__finish_batch()
+
+    def __finish_batch(self):
+        """Stops playing the pipeline and schedules the next thumbnail."""
+        self.__batch_playing = False
+        # The positions which could not be reached.
+        self.failures.update(self.__batch)
+        self.__batch = []
+        if self.pipeline.set_state(Gst.State.PAUSED) != Gst.StateChangeReturn.ASYNC:
+            self._schedule_next_thumb_generation()
+        # Otherwise the next thumbnail generation will be scheduled
+        # when the ASYNC_DONE message is received.
+
+    def __reset_batch(self):
+        """Puts back in the queue the positions of the unfinished batch."""
+        self.queue[0:0] = [position for position in self.__batch
+                           if position not in self.queue]
+        self.__batch = []
+        self.__batch_playing = False
+
     def _set_pixbuf(self, pixbuf, position):
         """Updates the managed UI when a new pixbuf becomes available.
 
@@ -753,17 +946,30 @@ class AssetPreviewer(Previewer, Loggable):
             struct = message.get_structure()
             struct_name = struct.get_name()
             if struct_name == "preroll-pixbuf":
-                pixbuf = struct.get_value("pixbuf")
-                self.thumb_cache[self.position] = pixbuf
-                self._set_pixbuf(pixbuf, self.position)
-                self.position = -1
+                if self.position >= 0:
+                    pixbuf = struct.get_value("pixbuf")
+                    self.thumb_cache[self.position] = pixbuf
+                    self._set_pixbuf(pixbuf, self.position)
+                    self.position = -1
+            elif struct_name == "pixbuf" and self.__batch_playing:
+                self.__add_batch_pixbuf(struct)
         elif message.src == self.pipeline and \
                 message.type == Gst.MessageType.ASYNC_DONE:
             if self.position >= 0:
                 self.warning("Thumbnail generation failed at %s", self.position)
                 self.failures.add(self.position)
                 self.position = -1
-            self._schedule_next_thumb_generation()
+                self.__reset_batch()
+            if self.__batch and not self.__batch_playing:
+                # Decode linearly from the position we just seeked to.
+                self.__batch_playing = True
+                self.pipeline.set_state(Gst.State.PLAYING)
+            else:
+                self._schedule_next_thumb_generation()
+        elif message.src == self.pipeline and \
+                message.type == Gst.MessageType.EOS:
+            if self.__batch_playing:
+                self.__finish_batch()
         elif message.type == Gst.MessageType.STREAM_COLLECTION and isinstance(message.src, GES.Timeline):
             # Make sure we only work with the video track when thumbnailing
             # nested timelines.
@@ -814,16 +1020,24 @@ class AssetPreviewer(Previewer, Loggable):
             self.pipeline.get_state(Gst.CLOCK_TIME_NONE)
             self.pipeline = None
 
+        self._release_clock()
+        self.__reset_batch()
+
         self.emit("done")
 
     def pause_generation(self):
         if self.pipeline:
             self.pipeline.set_state(Gst.State.READY)
+        self.__reset_batch()
 
 
 class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
     """A video previewer widget, drawing thumbnails.
 
+    When a horizontal adjustment is specified, only the thumbnails in the
+    visible region of the timeline plus a margin are managed, the widgets
+    being recycled when scrolling or zooming.
+
     Attributes:
         ges_elem (GES.VideoSource): The previewed element.
         thumbs (dict): Maps (quantized) times to the managed Thumbnail widgets.
@@ -832,7 +1046,7 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
     # We could define them in Previewer, but for some reason they are ignored.
     __gsignals__ = PREVIEW_GENERATOR_SIGNALS
 
-    def __init__(self, ges_elem, max_cpu_usage):
+    def __init__(self, ges_elem, max_cpu_usage, hadj=None):
         Gtk.Layout.__init__(self)
         Zoomable.__init__(self)
         AssetPreviewer.__init__(self, get_proxy_target(ges_elem), max_cpu_usage)
@@ -841,6 +1055,12 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
 
         self.ges_elem = ges_elem
         self.thumbs = {}
+        # The hidden Thumbnail widgets which can be reused.
+        self._unused_thumbs = []
+        self._opacity = 1.0
+
+        # The timeline's horizontal adjustment, for virtualizing the thumbs.
+        self._hadj = hadj
 
         # Connect signals and fire things up
         self.ges_elem.connect("notify::in-point", self._inpoint_changed_cb)
@@ -848,11 +1068,17 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
 
         self.connect("notify::height-request", self._height_changed_cb)
 
+        if self._hadj:
+            self.ges_elem.connect("notify::start", self._start_changed_cb)
+            self._hadj.connect("value-changed", self._hadj_changed_cb)
+            self._hadj.connect("changed", self._hadj_changed_cb)
+
     def set_selected(self, selected):
         if selected:
             opacity = 0.5
         else:
             opacity = 1.0
+        self._opacity = opacity
 
         for thumb in self.get_children():
             thumb.props.opacity = opacity
@@ -861,8 +1087,28 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
         """Recreates the thumbnails cache."""
         self.stop_generation()
         self.thumb_cache = ThumbnailCache.get(self.uri)
+        for thumb in self.thumbs.values():
+            thumb.clear()
         self._update_thumbnails()
 
+    def _visible_range(self):
+        """Gets the range of the asset for which thumbnails are needed.
+
+        Returns:
+            (int, int): The start and end in nanoseconds, in the asset's time.
+        """
+        element_left = self.ges_elem.props.in_point
+        element_right = element_left + self.ges_elem.props.duration
+        if not self._hadj:
+            return element_left, element_right
+
+        clip_x = self.ns_to_pixel(self.ges_elem.props.start)
+        left_x = self._hadj.props.value - THUMBS_EXTRA_PX - clip_x
+        right_x = self._hadj.props.value + self._hadj.props.page_size + THUMBS_EXTRA_PX - clip_x
+        start = max(element_left, element_left + self.pixel_to_ns(left_x))
+        end = min(element_right, element_left + self.pixel_to_ns(right_x))
+        return start, end
+
     def _update_thumbnails(self):
         """Updates the thumbnail widgets for the clip at the current zoom."""
         if not self.thumb_width:
@@ -872,19 +1118,21 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
         thumbs = {}
         queue = []
         interval = self.thumb_interval(self.thumb_width)
-        element_left = quantize(self.ges_elem.props.in_point, interval)
-        element_right = self.ges_elem.props.in_point + self.ges_elem.props.duration
+        start, end = self._visible_range()
+        inpoint_x = self.ns_to_pixel(self.ges_elem.props.in_point)
         y = (self.props.height_request - self.thumb_height) / 2
-        for position in range(element_left, element_right, interval):
-            x = Zoomable.ns_to_pixel(position) - self.ns_to_pixel(self.ges_elem.props.in_point)
-            try:
-                thumb = self.thumbs.pop(position)
+        for position in range(quantize(start, interval), end, interval):
+            x = Zoomable.ns_to_pixel(position) - inpoint_x
+            thumb = self.thumbs.pop(position, None)
+            if thumb:
                 self.move(thumb, x, y)
-            except KeyError:
-                thumb = Thumbnail(self.thumb_width, self.thumb_height)
-                self.put(thumb, x, y)
+            else:
+                thumb = self._get_thumb(x, y)
 
             thumbs[position] = thumb
+            if thumb.get_storage_type() != Gtk.ImageType.EMPTY:
+                # Already showing the pixbuf.
+                continue
             if position in self.thumb_cache:
                 pixbuf = self.thumb_cache[position]
                 thumb.set_from_pixbuf(pixbuf)
@@ -892,13 +1140,30 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
             else:
                 if position not in self.failures and position != self.position:
                     queue.append(position)
+
         for thumb in self.thumbs.values():
-            self.remove(thumb)
+            thumb.clear()
+            thumb.set_visible(False)
+            self._unused_thumbs.append(thumb)
         self.thumbs = thumbs
         self.queue = queue
         if queue:
             self.become_controlled()
 
+    def _get_thumb(self, x, y):
+        """Gets a Thumbnail widget placed at the specified position."""
+        try:
+            thumb = self._unused_thumbs.pop()
+        except IndexError:
+            thumb = Thumbnail(self.thumb_width, self.thumb_height)
+            thumb.props.opacity = self._opacity
+            self.put(thumb, x, y)
+            return thumb
+
+        thumb.set_size_request(self.thumb_width, self.thumb_height)
+        self.move(thumb, x, y)
+        return thumb
+
     def _set_pixbuf(self, pixbuf, position):
         """Sets the pixbuf for the thumbnail at the expected position."""
         try:
@@ -908,10 +1173,18 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
             # updating the thumbnails in _update_thumbnails.
             return
         thumb.set_from_pixbuf(pixbuf)
+        thumb.set_visible(True)
 
     def release(self):
         """Stops preview generation and cleans the object."""
         self.stop_generation()
+        # The previewers are released when scrolled away from, so the
+        # handlers should not keep them alive.
+        self.ges_elem.disconnect_by_func(self._inpoint_changed_cb)
+        self.ges_elem.disconnect_by_func(self._duration_changed_cb)
+        if self._hadj:
+            self.ges_elem.disconnect_by_func(self._start_changed_cb)
+            self._hadj.disconnect_by_func(self._hadj_changed_cb)
         Zoomable.__del__(self)
 
     def _height_changed_cb(self, unused_widget, unused_param_spec):
@@ -925,6 +1198,14 @@ class VideoPreviewer(Gtk.Layout, AssetPreviewer, Zoomable):
         """Handles the changing of the duration of the clip."""
         self._update_thumbnails()
 
+    def _start_changed_cb(self, unused_ges_timeline_element, unused_param_spec):
+        """Handles the moving of the clip, which changes the visible region."""
+        self._update_thumbnails()
+
+    def _hadj_changed_cb(self, unused_hadj):
+        """Handles the scrolling of the timeline."""
+        self._update_thumbnails()
+
     def zoom_changed(self):
         self._update_thumbnails()
 
@@ -941,29 +1222,86 @@ class Thumbnail(Gtk.Image):
         self.props.height_request = height
 
 
+class PixbufsLRUCache:
+    """In-memory cache of decoded pixbufs, bounded by their size in bytes.
+
+    When full, the least recently used pixbufs are discarded.
+
+    Attributes:
+        max_bytes (int): The max total size of the pixbufs.
+        size (int): The total size of the cached pixbufs.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._pixbufs = collections.OrderedDict()
+
+    def set_max_bytes(self, max_bytes):
+        """Sets the max total size of the pixbufs, discarding some if needed."""
+        self.max_bytes = max_bytes
+        self._evict()
+
+    def get(self, key):
+        """Gets the pixbuf for the specified key, or None."""
+        pixbuf = self._pixbufs.get(key)
+        if pixbuf is not None:
+            self._pixbufs.move_to_end(key)
+        return pixbuf
+
+    def __len__(self):
+        return len(self._pixbufs)
+
+    def __setitem__(self, key, pixbuf):
+        previous = self._pixbufs.pop(key, None)
+        if previous is not None:
+            self.size -= previous.get_byte_length()
+        self._pixbufs[key] = pixbuf
+        self.size += pixbuf.get_byte_length()
+        self._evict()
+
+    def _evict(self):
+        while self.size > self.max_bytes and self._pixbufs:
+            unused_key, pixbuf = self._pixbufs.popitem(last=False)
+            self.size -= pixbuf.get_byte_length()
+
+
 class ThumbnailCache(Loggable):
     """Cache for the thumbnails of an asset.
 
-    Uses a separate sqlite3 database for each asset.
+    Uses a separate sqlite3 database for each asset. The decoded thumbnails
+    are kept in memory in `pixbufs`, shared by all the caches.
     """
 
     # The cache of caches.
     caches_by_uri = {}
+    # The recently used pixbufs, keyed by (dbfile, position).
+    pixbufs = PixbufsLRUCache(GlobalSettings.previewers_thumbnails_memory * 1024 * 1024)
 
     def __init__(self, uri):
         Loggable.__init__(self)
         self.uri = uri
         self.dbfile = self.dbfile_name(uri)
         self.log("Caching thumbs for %s in %s", uri, self.dbfile)
+        # Protected before being opened, so it cannot be deleted meanwhile.
+        PreviewsCacheCleaner.protect(self.dbfile)
         self._db = sqlite3.connect(self.dbfile)
+        # Mark the file as recently used.
+        os.utime(self.dbfile)
+        # Readers do not block the writer, and the database is synced
+        # on the disk only at checkpoints.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
         self._cur = self._db.cursor()
         self._cur.execute("CREATE TABLE IF NOT EXISTS Thumbs "
                           "(Time INTEGER NOT NULL PRIMARY KEY, "
                           " Jpeg BLOB NOT NULL)")
         # The cached (width, height) of the images.
         self._image_size = (0, 0)
-        # The cached positions available in the database.
+        # The cached positions available in the database or pending.
         self.positions = self.__existing_positions()
+        # The pixbufs to be written in the database at the next commit.
+        self.__pending = {}
         # The ID of the autosave event.
         self.__autosave_id = None
 
@@ -1033,10 +1371,15 @@ class ThumbnailCache(Loggable):
             List[int]: The width and height of the images in the cache.
         """
         if self._image_size[0] == 0:
-            self._cur.execute("SELECT * FROM Thumbs LIMIT 1")
-            row = self._cur.fetchone()
-            if row:
-                pixbuf = self.__pixbuf_from_row(row)
+            pixbuf = None
+            if self.__pending:
+                pixbuf = next(iter(self.__pending.values()))
+            else:
+                self._cur.execute("SELECT * FROM Thumbs LIMIT 1")
+                row = self._cur.fetchone()
+                if row:
+                    pixbuf = self.__pixbuf_from_row(row)
+            if pixbuf:
                 self._image_size = (pixbuf.get_width(), pixbuf.get_height())
         return self._image_size
 
@@ -1065,23 +1408,25 @@ class ThumbnailCache(Loggable):
 
     def __getitem__(self, position):
         """Gets the GdkPixbuf.Pixbuf for the specified position."""
-        self._cur.execute("SELECT * FROM Thumbs WHERE Time = ?", (position,))
-        row = self._cur.fetchone()
-        if not row:
-            raise KeyError(position)
-        return self.__pixbuf_from_row(row)
+        key = (self.dbfile, position)
+        pixbuf = self.pixbufs.get(key)
+        if pixbuf is not None:
+            return pixbuf
+
+        pixbuf = self.__pending.get(position)
+        if pixbuf is None:
+            self._cur.execute("SELECT * FROM Thumbs WHERE Time = ?", (position,))
+            row = self._cur.fetchone()
+            if not row:
+                raise KeyError(position)
+            pixbuf = self.__pixbuf_from_row(row)
+        self.pixbufs[key] = pixbuf
+        return pixbuf
 
     def __setitem__(self, position, pixbuf):
         """Sets a GdkPixbuf.Pixbuf for the specified position."""
-        success, jpeg = pixbuf.save_to_bufferv(
-            "jpeg", ["quality", None], ["90"])
-        if not success:
-            self.warning("JPEG compression failed")
-            return
-        blob = sqlite3.Binary(jpeg)
-        # Replace if a row with the same time already exists.
-        self._cur.execute("DELETE FROM Thumbs WHERE  time=?", (position,))
-        self._cur.execute("INSERT INTO Thumbs VALUES (?,?)", (position, blob,))
+        self.__pending[position] = pixbuf
+        self.pixbufs[(self.dbfile, position)] = pixbuf
         self.positions.add(position)
         self._schedule_commit()
 
@@ -1106,8 +1451,21 @@ class ThumbnailCache(Loggable):
 
     def commit(self):
         """Saves the cache on disk (in the database)."""
+        rows = []
+        for position, pixbuf in self.__pending.items():
+            success, jpeg = pixbuf.save_to_bufferv(
+                "jpeg", ["quality", None], ["90"])
+            if not success:
+                self.warning("JPEG compression failed")
+                self.positions.discard(position)
+                continue
+            rows.append((position, sqlite3.Binary(jpeg)))
+        self.__pending = {}
+
+        # Replace the rows with the same time, if any.
+        self._cur.executemany("INSERT OR REPLACE INTO Thumbs VALUES (?,?)", rows)
         self._db.commit()
-        self.log("Saved thumbnail cache file")
+        self.log("Saved %d thumbnails in the cache file", len(rows))
 
 
 def delete_all_files_in_dir(path):
@@ -1119,15 +1477,28 @@ def delete_all_files_in_dir(path):
 
 def gen_filename(uri, extension):
     """Generates the cache filename for the specified URI."""
-    uri_hash = hashlib.sha256(uri.encode("UTF-8")).hexdigest()
-    return "{}_{}_{}.{}".format(os.path.basename(uri), uri_hash, os.path.getmtime(uri), extension)
+    return "{}_{}_{}.{}".format(os.path.basename(uri), _path_hash(uri), os.path.getmtime(uri), extension)
+
+
+def _path_hash(path):
+    """Gets the hash identifying the cache files of the specified file."""
+    return hashlib.sha256(path.encode("UTF-8")).hexdigest()
 
 
 def get_wavefile_location_for_uri(uri):
     """Computes the URI where the wave.npy file should be stored."""
+    return _get_waves_cache_location(uri, "wave.npy")
+
+
+def get_peaksfile_location_for_uri(uri):
+    """Computes the URI where the peaks.npy file should be stored."""
+    return _get_waves_cache_location(uri, "peaks.npy")
+
+
+def _get_waves_cache_location(uri, extension):
     if ProxyManager.is_proxy_asset(uri):
         uri = ProxyManager.get_target_uri(uri)
-    filename = gen_filename(Gst.uri_get_location(uri), "wave.npy")
+    filename = gen_filename(Gst.uri_get_location(uri), extension)
     waves_dir = xdg_cache_home("waves")
     cache_dir = os.path.join(waves_dir, "v1")
 
@@ -1135,7 +1506,279 @@ def get_wavefile_location_for_uri(uri):
         os.makedirs(cache_dir)
         GLib.idle_add(delete_all_files_in_dir, waves_dir)
 
-    return os.path.join(cache_dir, filename)
+    wavefile = os.path.join(cache_dir, filename)
+    PreviewsCacheCleaner.protect(wavefile)
+    return wavefile
+
+
+class WaveformPeaks:
+    """Max peaks of a waveform, at multiple resolutions.
+
+    The level 0 has a value for each SAMPLE_DURATION, and each next level
+    has a value for each PEAKS_LEVEL_FACTOR values of the previous level.
+    The levels are stored one after another in a single array, so drawing at
+    any zoom level reads a number of values proportional to the width drawn.
+
+    The level element reports the peaks as absolute values, so there are no
+    signed minimums to keep.
+
+    The peaks loaded from the cache are memory-mapped and shared by all the
+    previewers of an asset, see `get`.
+
+    Attributes:
+        data (numpy.ndarray): The values of all the levels.
+        levels (List[Tuple[int, int]]): The offset and length of each level.
+        path (str): The file from which `data` is mapped, if any.
+    """
+
+    # The shared peaks, by asset URI.
+    peaks_by_uri = {}
+
+    def __init__(self, data, path=None):
+        self.data = data
+        self.path = path
+        self.levels = self.levels_layout(self.base_length(len(data)))
+
+    @staticmethod
+    def levels_layout(base_length):
+        """Gets the offset and length of each level.
+
+        Args:
+            base_length (int): The number of values of the level 0.
+        """
+        levels = []
+        offset = 0
+        length = base_length
+        while True:
+            levels.append((offset, length))
+            offset += length
+            if length <= 1:
+                return levels
+            length = -(-length // PEAKS_LEVEL_FACTOR)
+
+    @classmethod
+    def base_length(cls, total_length):
+        """Gets the number of values of the level 0 given the total."""
+        # The levels after the first one hold about a third of the values.
+        length = max(0, total_length * (PEAKS_LEVEL_FACTOR - 1) // PEAKS_LEVEL_FACTOR - 64)
+        while length <= total_length:
+            offset, last_length = cls.levels_layout(length)[-1]
+            if offset + last_length == total_length:
+                return length
+            length += 1
+        raise ValueError("Invalid waveform peaks length: %s" % total_length)
+
+    @classmethod
+    def from_peaks(cls, peaks):
+        """Creates the levels out of the values for each SAMPLE_DURATION."""
+        levels = [numpy.asarray(peaks, dtype=numpy.float32)]
+        while len(levels[-1]) > 1:
+            padding = -len(levels[-1]) % PEAKS_LEVEL_FACTOR
+            peaks = numpy.pad(levels[-1], (0, padding), mode="edge")
+            levels.append(peaks.reshape(-1, PEAKS_LEVEL_FACTOR).max(axis=1))
+
+        return cls(numpy.concatenate(levels))
+
+    @classmethod
+    def get(cls, uri):
+        """Gets the shared peaks of the specified asset.
+
+        Returns:
+            WaveformPeaks: The peaks, or None if the waveform is not cached.
+        """
+        peaksfile = get_peaksfile_location_for_uri(uri)
+        waveform_peaks = cls.peaks_by_uri.pop(uri, None)
+        if not waveform_peaks or waveform_peaks.path != peaksfile:
+            # The asset changed or the peaks have not been loaded yet.
+            waveform_peaks = cls.load(uri)
+        if waveform_peaks:
+            cls.peaks_by_uri[uri] = waveform_peaks
+        return waveform_peaks
+
+    @classmethod
+    def load(cls, uri):
+        """Maps the peaks of the specified asset from the cache.
+
+        The peaks are created out of the RMS values of the wave.npy file if
+        they have not been saved yet.
+
+        Returns:
+            WaveformPeaks: The peaks, or None if the waveform is not cached.
+        """
+        peaksfile = get_peaksfile_location_for_uri(uri)
+        if not os.path.exists(peaksfile):
+            wavefile = get_wavefile_location_for_uri(uri)
+            if not os.path.exists(wavefile):
+                return None
+            with open(wavefile, "rb") as file:
+                samples = numpy.load(file)
+            cls.from_peaks(samples).save(peaksfile)
+
+        # The pages are read when needed and are shared with the other
+        # processes mapping the same file.
+        return cls(numpy.load(peaksfile, mmap_mode="r"), peaksfile)
+
+    def save(self, path):
+        """Saves the peaks to the specified .npy file."""
+        # The file is replaced rather than overwritten, because it might
+        # be mapped by the previewers.
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            numpy.save(file, self.data)
+        os.replace(tmp_path, path)
+
+        # The shared peaks mapped from the replaced file are outdated.
+        for uri, waveform_peaks in list(self.peaks_by_uri.items()):
+            if waveform_peaks.path == path:
+                del self.peaks_by_uri[uri]
+
+    @property
+    def max_value(self):
+        """The biggest peak."""
+        if not len(self.data):
+            return 0
+        # The last level has a single value.
+        return self.data[-1]
+
+    def level_for(self, duration):
+        """Gets the level with the least values, at least one per duration."""
+        level = 0
+        while level + 1 < len(self.levels) and \
+                SAMPLE_DURATION * PEAKS_LEVEL_FACTOR ** (level + 1) <= duration:
+            level += 1
+        return level
+
+    def get_range(self, level, start_ns, end_ns):
+        """Gets the peaks for the specified range.
+
+        Returns:
+            numpy.ndarray: A view on the peaks.
+        """
+        offset, length = self.levels[level]
+        duration = SAMPLE_DURATION * PEAKS_LEVEL_FACTOR ** level
+        start = min(max(0, int(start_ns / duration)), length)
+        end = min(max(0, int(end_ns / duration)), length)
+        return self.data[offset + start:offset + end]
+
+
+class PreviewsCacheCleaner(Thread):
+    """Thread deleting the least recently used previews and discoverer infos.
+
+    The files are deleted until their total size fits in the specified
+    budget. The files used since the thread has been created and the files
+    of the assets used in this session are never deleted. The thread should
+    be started when a project is loaded, after protecting its assets.
+
+    The temporary files left behind by an interrupted write are deleted.
+
+    Attributes:
+        max_bytes (int): The max total size of the cache files.
+    """
+
+    # The hashes identifying the assets used in this session.
+    protected_hashes = set()
+    # Held while checking whether files are protected and deleting them.
+    _lock = threading.Lock()
+
+    def __init__(self, max_bytes):
+        Thread.__init__(self)
+        self.max_bytes = max_bytes
+        self.cache_dirs = [os.path.join(xdg_cache_home("thumbs"), "v1"),
+                           os.path.join(xdg_cache_home("waves"), "v1"),
+                           xdg_cache_home("discoverer")]
+        self.start_time = time.time()
+        self.stopme = threading.Event()
+
+    @staticmethod
+    def _asset_hash(path):
+        """Gets the hash of the asset URI from the path of a cache file."""
+        parts = os.path.basename(path).rsplit("_", 2)
+        if len(parts) != 3:
+            # A discoverer infos entry.
+            return os.path.basename(path)
+        return parts[1]
+
+    @classmethod
+    def protect(cls, path):
+        """Protects from deletion the cache files of the asset of a cache file.
+
+        Args:
+            path (str): The path of a thumbnails or waveforms cache file.
+        """
+        with cls._lock:
+            cls.protected_hashes.add(cls._asset_hash(path))
+
+    @classmethod
+    def protect_uri(cls, uri):
+        """Protects from deletion the cache files of the specified asset.
+
+        Args:
+            uri (str): The URI of the asset.
+        """
+        path = Gst.uri_get_location(uri)
+        if not path:
+            return
+        with cls._lock:
+            cls.protected_hashes.add(_path_hash(path))
+            cls.protected_hashes.add(DiscovererCache.get_entry_name(uri))
+
+    def _list_files(self):
+        """Lists the cache files, grouping the SQLite WAL files with their db.
+
+        The temporary files are grouped separately.
+
+        Returns:
+            List[List]: The last access time, the size and the paths of
+                each group of files.
+        """
+        groups = {}
+        for cache_dir in self.cache_dirs:
+            if not os.path.isdir(cache_dir):
+                continue
+            for dir_entry in os.scandir(cache_dir):
+                if not dir_entry.is_file():
+                    continue
+                try:
+                    stat = dir_entry.stat()
+                except OSError:
+                    continue
+                path = dir_entry.path
+                for suffix in ("-wal", "-shm"):
+                    if path.endswith(suffix):
+                        path = path[:-len(suffix)]
+                group = groups.setdefault(path, [0, 0, []])
+                group[0] = max(group[0], stat.st_atime, stat.st_mtime)
+                group[1] += stat.st_size
+                group[2].append(dir_entry.path)
+        return list(groups.values())
+
+    def process(self):
+        groups = self._list_files()
+        total = sum(size for unused_time, size, unused_paths in groups)
+        self.debug("The previews cache has %d bytes, the max is %d", total, self.max_bytes)
+        groups.sort(key=lambda group: group[0])
+        for last_access, size, paths in groups:
+            if self.stopme.is_set():
+                break
+            if last_access >= self.start_time:
+                # In use.
+                continue
+            leftover = paths[0].endswith(".tmp")
+            if total <= self.max_bytes and not leftover:
+                continue
+            with self._lock:
+                if not leftover and self._asset_hash(paths[0]) in self.protected_hashes:
+                    continue
+                for path in paths:
+                    try:
+                        os.unlink(path)
+                    except OSError as e:
+                        self.warning("Failed to delete %s: %s", path, e)
+            total -= size
+        self.debug("The previews cache has now %d bytes", total)
+
+    def abort(self):
+        self.stopme.set()
 
 
 class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
@@ -1156,7 +1799,7 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
 
         self.ges_elem = ges_elem
 
-        self.samples = None
+        # The WaveformPeaks of the asset, shared with the other clips.
         self.peaks = None
         self.surface = None
         # The zoom level when self.surface has been created.
@@ -1176,7 +1819,7 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
         """Discards the audio samples so they are recreated."""
         self.stop_generation()
 
-        self.samples = None
+        self.peaks = None
         self.surface = None
         self.queue_draw()
 
@@ -1185,40 +1828,33 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
     def _start_levels_discovery(self):
         filename = get_wavefile_location_for_uri(self._uri)
         if os.path.exists(filename):
-            with open(filename, "rb") as samples:
-                self.samples = self._scale_samples(numpy.load(samples))
+            # Mark the file as recently used.
+            os.utime(filename)
+            self.peaks = WaveformPeaks.get(self._uri)
             self.queue_draw()
         else:
             self.wavefile = filename
             self._launch_pipeline()
 
     @staticmethod
-    def _scale_samples(samples):
-        max_value = max(samples)
+    def _scale_factor(max_value, height):
+        """Gets the factor by which the samples are multiplied when drawn."""
         has_sound = max_value > 0.0001
-        if has_sound:
-            # TODO: The 65 value comes from the height of the widget.
-            #   It should not be hardcoded though. We can fix this
-            #   when we implement a waveform samples cache, because it's
-            #   wasteful if multiple clips backed by the same asset
-            #   keep their own samples copy.
-            factor = 65 / max_value
-            samples = samples * factor
+        if not has_sound:
+            return 1.0
 
-        return list(samples)
+        # The loudest sample of the asset takes the entire height.
+        return height / max_value
 
     def _launch_pipeline(self):
+        uri = get_preview_uri(self.ges_elem)
         self.debug(
-            "Now generating waveforms for: %s", path_from_uri(self._uri))
+            "Now generating waveforms for: %s from %s", path_from_uri(self._uri), path_from_uri(uri))
         self.pipeline = Gst.parse_launch("uridecodebin name=decode uri=" +
-                                         self._uri + " ! waveformbin name=wave"
+                                         uri + " ! waveformbin name=wave"
                                          " ! fakesink qos=false name=faked")
-        # This line is necessary so we can instantiate GstTranscoder's
-        # GstCpuThrottlingClock below.
-        Gst.ElementFactory.make("uritranscodebin", None)
-        clock = GObject.new(GObject.type_from_name("GstCpuThrottlingClock"))
-        clock.props.cpu_usage = self._max_cpu_usage
-        self.pipeline.use_clock(clock)
+        self._clock = create_cpu_throttling_clock(self._max_cpu_usage)
+        self.pipeline.use_clock(self._clock)
         faked = self.pipeline.get_by_name("faked")
         faked.props.sync = True
         self._wavebin = self.pipeline.get_by_name("wave")
@@ -1233,7 +1869,7 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
 
     def _prepare_samples(self):
         self._wavebin.finalize()
-        self.samples = self._scale_samples(self._wavebin.samples)
+        self.peaks = WaveformPeaks.get(self._uri)
 
     def _bus_message_cb(self, bus, message):
         if message.type == Gst.MessageType.EOS:
@@ -1269,7 +1905,7 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
         return False
 
     def do_draw(self, context):
-        if not self.samples:
+        if not self.peaks:
             # Nothing to draw.
             return
 
@@ -1299,11 +1935,13 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
             self._surface_start_ns = max(0, start_ns - extra)
             self._surface_end_ns = min(end_ns + extra, max_duration)
 
-            range_start = min(max(0, int(self._surface_start_ns / SAMPLE_DURATION)), len(self.samples))
-            range_end = min(max(0, int(self._surface_end_ns / SAMPLE_DURATION)), len(self.samples))
-            samples = self.samples[range_start:range_end]
+            level = self.peaks.level_for(self.pixel_to_ns(1))
+            # A view on the peaks, which the renderer reads without copying.
+            samples = self.peaks.get_range(level, self._surface_start_ns, self._surface_end_ns)
+            factor = self._scale_factor(self.peaks.max_value, height)
             surface_width = self.ns_to_pixel(self._surface_end_ns - self._surface_start_ns)
-            self.surface = renderer.fill_surface(samples, surface_width, height)
+            self.surface = renderer.fill_surface(samples, surface_width, height,
+                                                 factor=factor)
 
         # Paint the surface, ignoring the clipped rect.
         # We only have to make sure the offset is correct:
@@ -1341,6 +1979,7 @@ class AudioPreviewer(Gtk.Layout, Previewer, Zoomable, Loggable):
             self.pipeline.get_bus().disconnect_by_func(self._bus_message_cb)
             self.pipeline = None
 
+        self._release_clock()
         self.emit("done")
 
     def release(self):
@@ -15,6 +15,7 @@
 #
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
+import math
 from gettext import gettext as _
 
 import cairo
@@ -79,6 +80,12 @@ FRAME_HEIGHT_PIXELS = 5
 NORMAL_FONT_SIZE = 13
 SMALL_FONT_SIZE = 11
 
+# The width of the parts of the ruler which are rendered and cached.
+TILE_WIDTH_PIXELS = 256
+
+# The half width of the head of the playhead.
+PLAYHEAD_HEAD_SEMI_WIDTH = 4
+
 
 class ScaleRuler(Gtk.DrawingArea, Loggable):
     """Widget for displaying the ruler.
@@ -86,6 +93,9 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
     Displays a series of consecutive intervals. For each interval its beginning
     time is shown. If zoomed in enough, shows the frames in alternate colors.
 
+    The ruler is rendered in tiles which are reused while scrolling, until
+    the zoom level changes. The playhead is drawn over the tiles.
+
     Attributes:
         zoom (pitivi.utils.timeline.Zoomable): Zoom controller.
         settings (pitivi.settings.GlobalSettings): The settings of the app.
@@ -108,11 +118,13 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
                         Gdk.EventMask.BUTTON_PRESS_MASK | Gdk.EventMask.BUTTON_RELEASE_MASK |
                         Gdk.EventMask.SCROLL_MASK)
 
-        self.pixbuf = None
+        # The rendered tiles by their x offset, None until configured.
+        self._tiles = None
+        # What the tiles depend on, other than the offset.
+        self.__tiles_key = None
 
-        # all values are in pixels
+        # The x offset of the displayed part, in pixels.
         self.pixbuf_offset = 0
-        self.pixbuf_offset_painted = 0
 
         self.position = 0  # In nanoseconds
 
@@ -124,8 +136,15 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
         self._pipeline.connect("position", self._pipeline_position_cb)
 
     def _pipeline_position_cb(self, unused_pipeline, position):
+        self.__queue_draw_position()
         self.position = position
-        self.queue_draw()
+        self.__queue_draw_position()
+
+    def __queue_draw_position(self):
+        """Queues redrawing the area of the playhead."""
+        margin = PLAYHEAD_HEAD_SEMI_WIDTH + PLAYHEAD_WIDTH * 2
+        x = self.zoom.ns_to_pixel(self.position) - int(self.pixbuf_offset)
+        self.queue_draw_area(x - margin, 0, margin * 2 + 1, self.get_allocated_height())
 
 # Gtk.Widget overrides
 
@@ -134,13 +153,8 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
         height = self.get_allocated_height()
         self.debug("Configuring, height %d, width %d", width, height)
 
-        # Destroy previous buffer
-        if self.pixbuf is not None:
-            self.pixbuf.finish()
-            self.pixbuf = None
-
-        # Create a new buffer
-        self.pixbuf = cairo.ImageSurface(cairo.FORMAT_ARGB32, width, height)
+        # The tiles have to be rendered with the new height and colors.
+        self._tiles = {}
 
         # pylint: disable=attribute-defined-outside-init
         context = self.get_style_context()
@@ -165,24 +179,48 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
         return False
 
     def do_draw(self, context):
-        if self.pixbuf is None:
+        if self._tiles is None:
             self.info("No buffer to paint")
             return False
 
-        pixbuf = self.pixbuf
-
-        # Draw on a temporary context and then copy everything.
-        drawing_context = cairo.Context(pixbuf)
-        self.draw_background(drawing_context)
-        self.draw_ruler(drawing_context)
-        self.draw_position(drawing_context)
-        pixbuf.flush()
-
-        context.set_source_surface(self.pixbuf, 0.0, 0.0)
-        context.paint()
+        tiles_key = (self.zoom.zoomratio, self.get_allocated_height(),
+                     self.ges_timeline.get_frame_time(1) if self.ges_timeline else None)
+        if tiles_key != self.__tiles_key:
+            self._tiles = {}
+            self.__tiles_key = tiles_key
+
+        offset = int(self.pixbuf_offset)
+        clip_x1, unused_y1, clip_x2, unused_y2 = context.clip_extents()
+        clip_x1 = math.floor(clip_x1)
+        clip_x2 = math.ceil(clip_x2)
+        first_tile = (offset + clip_x1) // TILE_WIDTH_PIXELS * TILE_WIDTH_PIXELS
+        for tile_x in range(first_tile, offset + clip_x2, TILE_WIDTH_PIXELS):
+            tile = self._tiles.get(tile_x)
+            if tile is None:
+                tile = self.__render_tile(tile_x)
+                self._tiles[tile_x] = tile
+            context.set_source_surface(tile, tile_x - offset, 0)
+            context.paint()
+
+        # Forget the tiles scrolled out of view.
+        width = max(self.get_allocated_width(), clip_x2)
+        for tile_x in list(self._tiles.keys()):
+            if tile_x + TILE_WIDTH_PIXELS <= offset or tile_x >= offset + width:
+                del self._tiles[tile_x]
+
+        self.draw_position(context)
 
         return False
 
+    def __render_tile(self, tile_x):
+        self.log("Rendering the tile at %d", tile_x)
+        tile = cairo.ImageSurface(cairo.FORMAT_ARGB32, TILE_WIDTH_PIXELS, self.get_allocated_height())
+        context = cairo.Context(tile)
+        self.draw_background(context)
+        self.draw_ruler(context, tile_x)
+        tile.flush()
+        return tile
+
     def do_button_press_event(self, event):
         if not self._pipeline:
             return False
@@ -239,15 +277,21 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
         height = context.get_target().get_height()
         Gtk.render_background(self.style_context, context, 0, 0, width, height)
 
-    def draw_ruler(self, context):
+    def draw_ruler(self, context, x):
+        """Draws the part of the ruler starting at the specified offset.
+
+        Args:
+            context (cairo.Context): The context of the tile.
+            x (int): The offset of the tile, in pixels.
+        """
         context.set_font_face(NORMAL_FONT)
         context.set_font_size(NORMAL_FONT_SIZE)
 
         spacing, interval_seconds, ticks = self._get_spacing(context)
-        offset = self.pixbuf_offset % spacing
-        self.draw_frame_boundaries(context)
+        offset = x % spacing
+        self.draw_frame_boundaries(context, x)
         self.draw_ticks(context, offset, spacing, interval_seconds, ticks)
-        self.draw_times(context, offset, spacing, interval_seconds)
+        self.draw_times(context, x, offset, spacing, interval_seconds)
 
     def _get_spacing(self, context):
         # The longest timestamp we display is 0:00:00 because
@@ -289,14 +333,18 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
         context.close_path()
         context.stroke()
 
-    def draw_times(self, context, offset, spacing, interval_seconds):
+    def draw_times(self, context, x, offset, spacing, interval_seconds):
         # figure out what the optimal offset is
         interval = int(Gst.SECOND * interval_seconds)
-        current_time = self.zoom.pixel_to_ns(self.pixbuf_offset)
+        current_time = self.zoom.pixel_to_ns(x)
         paintpos = TIMES_LEFT_MARGIN_PIXELS
         if offset > 0:
             current_time = current_time - (current_time % interval) + interval
             paintpos += spacing - offset
+        if current_time >= interval:
+            # Start with the time overflowing from the previous tile.
+            current_time -= interval
+            paintpos -= spacing
 
         set_cairo_color(context, self._color_normal)
         y_bearing = context.text_extents("0")[1]
@@ -345,7 +393,7 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
             if small:
                 context.set_font_size(NORMAL_FONT_SIZE)
 
-    def draw_frame_boundaries(self, context):
+    def draw_frame_boundaries(self, context, x):
         """Draws the alternating rectangles that represent the project frames.
 
         These are drawn only at high zoom levels.
@@ -361,19 +409,19 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
         if frame_width < FRAME_MIN_WIDTH_PIXELS:
             return
 
-        offset = self.pixbuf_offset % frame_width
+        offset = x % frame_width
         height = context.get_target().get_height()
         y = int(height - FRAME_HEIGHT_PIXELS)
 
-        frame_num = self.ges_timeline.get_frame_at(self.zoom.pixel_to_ns(self.pixbuf_offset))
-        paintpos = self.pixbuf_offset - offset
-        max_pos = context.get_target().get_width() + self.pixbuf_offset
+        frame_num = self.ges_timeline.get_frame_at(self.zoom.pixel_to_ns(x))
+        paintpos = x - offset
+        max_pos = context.get_target().get_width() + x
         while paintpos < max_pos:
             paintpos = self.zoom.ns_to_pixel(self.ges_timeline.get_frame_time(frame_num))
             if frame_num % 2:
                 set_cairo_color(context, self._color_frame)
                 context.rectangle(
-                    0.5 + paintpos - self.pixbuf_offset, y, frame_width, height)
+                    0.5 + paintpos - x, y, frame_width, height)
                 context.fill()
             frame_num += 1
 
@@ -383,15 +431,15 @@ class ScaleRuler(Gtk.DrawingArea, Loggable):
         This should be in sync with the playhead drawn by the timeline.
         See Timeline.__draw_playhead().
         """
-        height = self.pixbuf.get_height()
+        height = self.get_allocated_height()
 
-        semi_width = 4
+        semi_width = PLAYHEAD_HEAD_SEMI_WIDTH
         semi_height = int(semi_width * 1.61803)
         y = int(3 * height / 4)
 
         # Add 0.5 so that the line center is at the middle of the pixel,
         # without this the line appears blurry.
-        xpos = self.zoom.ns_to_pixel(self.position) - self.pixbuf_offset + 0.5
+        xpos = self.zoom.ns_to_pixel(self.position) - int(self.pixbuf_offset) + 0.5
         set_cairo_color(context, PLAYHEAD_COLOR)
 
         context.set_line_width(PLAYHEAD_WIDTH)
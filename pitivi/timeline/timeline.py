@@ -15,6 +15,7 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 import os
+from contextlib import contextmanager
 from gettext import gettext as _
 
 from gi.repository import Gdk
@@ -40,10 +41,13 @@ from pitivi.timeline.layer import LayerControls
 from pitivi.timeline.layer import SpacedSeparator
 from pitivi.timeline.markers import MarkersBox
 from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import ThumbnailCache
 from pitivi.timeline.ruler import TimelineScaleRuler
 from pitivi.undo.timeline import CommitTimelineFinalizingAction
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import asset_get_duration
+from pitivi.utils.proxy import get_proxy_target
+from pitivi.utils.proxy import ProxyJobPriority
 from pitivi.utils.timeline import EditingContext
 from pitivi.utils.timeline import SELECT
 from pitivi.utils.timeline import Selection
@@ -69,6 +73,14 @@ from pitivi.utils.widgets import ZoomBox
 # Creates new layer if a clip is held at layers separator after this time interval
 SEPARATOR_ACCEPTING_DROP_INTERVAL_MS = 1000
 
+# The proxies of the clips this close to the playhead are created first.
+PROXIES_PLAYHEAD_WINDOW = 30 * Gst.SECOND
+
+# The width of the region around the visible area of the timeline in which
+# the clips have previewers, in pixels. The previewers are released only when
+# the clips get twice as far, so scrolling back and forth does not recreate them.
+PREVIEWERS_EXTRA_PX = 1000
+
 
 GlobalSettings.add_config_option('edgeSnapDeadband',
                                  section="user-interface",
@@ -317,6 +329,8 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         self.add(hbox)
 
         self.layout = LayersLayout(self)
+        # The layout is shown as long as the timeline is.
+        Zoomable.set_tick_widget(self.layout)
         self.layout.props.can_focus = True
         self.layout.props.can_default = True
         self.hadj = self.layout.get_hadjustment()
@@ -357,6 +371,9 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         # Whether the entire timeline content is in view and
         # it should be kept that way if it makes sense.
         self.zoomed_fitted = True
+        # The zoom level set for having the entire timeline content in view,
+        # to recognize its notification which comes on the next frame.
+        self.__fitted_zoom_level = None
 
         # A list of (controls separator, layers separator) tuples.
         self._separators = []
@@ -366,6 +383,12 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         self._separator_accepting_drop = False
         self._separator_accepting_drop_id = 0
         self.__last_position = 0
+        # The ID of the idle update of the proxying jobs priorities.
+        self.__proxies_priorities_id = 0
+        # The Clip widgets having previewers, see update_previewers.
+        self.__previewed_clips = set()
+        # The ID of the idle update of the previewers.
+        self.__previewers_update_id = 0
         self.scrubbing = False
         self._scrolling = False
         # The parameters for the delayed scroll to be performed after
@@ -390,6 +413,9 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         self.__clicked_handle = None
         # The GES object for controlling the operation.
         self.editing_context = None
+        # The updates of the Layer and Clip widgets deferred until the end
+        # of the current batch edit, or None. See batch_edit.
+        self.batch_updates = None
         # Whether dragging_element really got dragged.
         self.__got_dragged = False
         # The x of the event which starts the drag operation.
@@ -428,14 +454,80 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         self.app.settings.connect("edgeSnapDeadbandChanged",
                                   self.__snap_distance_changed_cb)
 
+        Previewer.manager.set_max_workers(self.app.settings.previewers_num_workers)
+        ThumbnailCache.pixbufs.set_max_bytes(self.app.settings.previewers_thumbnails_memory * 1024 * 1024)
+        self.app.settings.connect("previewers_num_workersChanged",
+                                  self.__previewers_num_workers_changed_cb)
+        self.app.settings.connect("previewers_thumbnails_memoryChanged",
+                                  self.__previewers_thumbnails_memory_changed_cb)
+
         self.layout.layers_vbox.connect_after("size-allocate", self.__size_allocate_cb)
 
         self.hadj.connect("value-changed", self.__hadj_value_changed_cb)
+        self.hadj.connect("changed", self.__adjustment_changed_cb)
+        self.vadj.connect("value-changed", self.__adjustment_changed_cb)
+        self.vadj.connect("changed", self.__adjustment_changed_cb)
 
     def __size_allocate_cb(self, unused_widget, unused_allocation):
         """Handles the layers vbox size allocations."""
         if self.delayed_scroll:
             self.scroll_to_playhead(**self.delayed_scroll)
+        self.schedule_previewers_update()
+
+    def __adjustment_changed_cb(self, unused_adjustment):
+        self.schedule_previewers_update()
+
+    def schedule_previewers_update(self):
+        """Schedules updating which clips have previewers."""
+        if not self.__previewers_update_id:
+            self.__previewers_update_id = GLib.idle_add(self.update_previewers,
+                                                        priority=GLib.PRIORITY_LOW)
+
+    def update_previewers(self):
+        """Creates the previewers of the clips around the visible area.
+
+        The previewers of the clips far from the visible area are released,
+        so the cost of the previews follows the viewport and not the size
+        of the project.
+        """
+        self.__previewers_update_id = 0
+        if not self.ges_timeline:
+            return False
+
+        shown_clips = self.__get_clips_around_visible_area(PREVIEWERS_EXTRA_PX)
+        kept_clips = self.__get_clips_around_visible_area(2 * PREVIEWERS_EXTRA_PX)
+
+        for clip in self.__previewed_clips - kept_clips:
+            if clip.ges_clip.ui is clip:
+                clip.set_previewers_enabled(False)
+        for clip in shown_clips - self.__previewed_clips:
+            clip.set_previewers_enabled(True)
+        self.__previewed_clips = (self.__previewed_clips & kept_clips) | shown_clips
+        self.log("%d clips have previewers", len(self.__previewed_clips))
+        return False
+
+    def __get_clips_around_visible_area(self, extra_px):
+        """Gets the Clip widgets in the visible area extended by extra_px."""
+        left = self.hadj.get_value() - extra_px
+        right = self.hadj.get_value() + self.hadj.get_page_size() + extra_px
+        top = self.vadj.get_value() - extra_px
+        bottom = self.vadj.get_value() + self.vadj.get_page_size() + extra_px
+        start = self.pixel_to_ns(max(0, left))
+        end = self.pixel_to_ns(right)
+
+        clips = set()
+        for ges_layer in self.ges_timeline.get_layers():
+            layer = ges_layer.ui
+            allocation = layer.get_allocation()
+            if allocation.height > 1 and \
+                    (allocation.y + allocation.height < top or allocation.y > bottom):
+                # The layer is far from the visible area.
+                continue
+
+            for ges_clip in layer.clips_index.get_clips_in_interval(start, end):
+                if ges_clip.ui:
+                    clips.add(ges_clip.ui)
+        return clips
 
     @property
     def media_types(self):
@@ -469,6 +561,7 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
             self.ges_timeline.disconnect_by_func(self.__snapping_ended_cb)
             for ges_layer in self.ges_timeline.get_layers():
                 self._remove_layer(ges_layer)
+            self.__previewed_clips = set()
 
             self.ges_timeline.ui = None
             self.ges_timeline = None
@@ -554,6 +647,36 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         if not pipeline.playing():
             self.update_visible_overlays()
             self.editor_state.set_value("playhead-position", position)
+            self.__schedule_proxies_priorities_update()
+
+    def __schedule_proxies_priorities_update(self):
+        if not self.__proxies_priorities_id:
+            self.__proxies_priorities_id = GLib.idle_add(self.__update_proxies_priorities)
+
+    def __update_proxies_priorities(self):
+        """Prioritizes the proxies of the clips around the playhead or visible."""
+        self.__proxies_priorities_id = 0
+        if not self.ges_timeline:
+            return False
+
+        visible_start = self.pixel_to_ns(self.hadj.get_value())
+        visible_end = visible_start + self.pixel_to_ns(self.hadj.get_page_size())
+        ranges = ((self.__last_position - PROXIES_PLAYHEAD_WINDOW,
+                   self.__last_position + PROXIES_PLAYHEAD_WINDOW),
+                  (visible_start, visible_end))
+
+        assets = set()
+        for ges_clip in self.ges_timeline.iter_clips():
+            if not isinstance(ges_clip, GES.UriClip):
+                continue
+            start = ges_clip.props.start
+            end = start + ges_clip.props.duration
+            if any(start < range_end and end > range_start
+                   for range_start, range_end in ranges):
+                assets.add(get_proxy_target(ges_clip))
+
+        self.app.proxy_manager.set_prioritized_assets(ProxyJobPriority.TIMELINE, assets)
+        return False
 
     def __snapping_started_cb(self, unused_timeline, unused_obj1, unused_obj2, position):
         """Handles a clip snap update operation."""
@@ -577,6 +700,14 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         """Handles the change of the snapping distance by the user."""
         self.update_snapping_distance()
 
+    def __previewers_num_workers_changed_cb(self, unused_settings):
+        """Handles the change of the number of previewer workers by the user."""
+        Previewer.manager.set_max_workers(self.app.settings.previewers_num_workers)
+
+    def __previewers_thumbnails_memory_changed_cb(self, unused_settings):
+        """Handles the change of the thumbnails memory by the user."""
+        ThumbnailCache.pixbufs.set_max_bytes(self.app.settings.previewers_thumbnails_memory * 1024 * 1024)
+
     # Gtk.Widget virtual methods implementation
 
     def do_get_preferred_height(self):
@@ -645,6 +776,9 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
                 Zoomable.zoom_out()
             else:
                 Zoomable.zoom_in()
+            # The widgets are notified about the zoom on the next frame, but
+            # the new width is needed right away for scrolling far enough.
+            self.layout.update_width()
             # Scroll so position remains in place.
             x, unused_y = event_widget.translate_coordinates(self.layout, event.x, event.y)
             self.hadj.set_value(self.ns_to_pixel(position) - x)
@@ -686,15 +820,10 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         """
         sources = []
         for layer in self.ges_timeline.layers:
-            clips = layer.get_clips()
-            for clip in clips:
-                start = clip.get_start()
-                duration = clip.get_duration()
-                if start <= position <= duration + start:
-                    source = clip.find_track_element(None, GES.VideoSource)
-                    if source:
-                        sources.append(source)
-                    continue
+            for clip in layer.ui.clips_index.get_clips_at(position):
+                source = clip.find_track_element(None, GES.VideoSource)
+                if source:
+                    sources.append(source)
         return sources
 
     def update_visible_overlays(self):
@@ -833,7 +962,7 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         clips = set()
         for layer_pos in layers_pos:
             layer = layers[layer_pos]
-            clips.update(layer.get_clips_in_interval(start, end))
+            clips.update(layer.ui.clips_index.get_clips_in_interval(start, end))
 
         grouped_clips = set()
         # Also include those clips which are grouped with currently selected clips.
@@ -918,11 +1047,65 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
 
     def __hadj_value_changed_cb(self, hadj):
         self.editor_state.set_value("scroll", hadj.get_value())
+        self.__schedule_proxies_priorities_update()
+        self.schedule_previewers_update()
 
     def update_position(self):
         for ges_layer in self.ges_timeline.get_layers():
             ges_layer.ui.update_position()
 
+    @contextmanager
+    def batch_edit(self, action_group_name, toplevel=False):
+        """Gets a context manager for editing many clips at once.
+
+        The edits are recorded as a single undoable operation and the
+        timeline is committed only once, at the end of the outermost batch
+        edit. The layers check their media types and the clips update their
+        position only once, also at the end.
+
+        Args:
+            action_group_name (str): The name of the operation.
+            toplevel (bool): Whether the operation is initiated by the user.
+        """
+        outermost = self.batch_updates is None
+        if outermost:
+            self.batch_updates = {}
+        pipeline = self._project.pipeline
+        # Undoing or redoing the nested operations is part of the outermost
+        # operation, which commits the timeline once when finished.
+        finalizing_action = CommitTimelineFinalizingAction(pipeline) if outermost else None
+        try:
+            with pipeline.commit_timeline_after():
+                with self.app.action_log.started(action_group_name,
+                                                 finalizing_action=finalizing_action,
+                                                 toplevel=toplevel):
+                    yield
+        finally:
+            if outermost:
+                updates = self.batch_updates
+                self.batch_updates = None
+                for update, ges_object in updates.items():
+                    # Skip the widgets removed during the batch edit.
+                    if ges_object.ui is update.__self__:
+                        update()
+
+    def defer_batch_update(self, update, ges_object):
+        """Defers a widget update until the end of the batch edit, if any.
+
+        Args:
+            update (function): The bound method updating the widget.
+            ges_object (GObject.Object): The object represented by the
+                widget, whose `ui` is checked before updating the widget.
+
+        Returns:
+            bool: Whether the update has been deferred.
+        """
+        if self.batch_updates is None:
+            return False
+        # Keeps the order, and calls each update once.
+        self.batch_updates[update] = ges_object
+        return True
+
     def add_clip_to_layer(self, ges_layer, asset, start):
         if asset.is_image():
             clip_duration = self.app.settings.imageClipLength * \
@@ -941,6 +1124,9 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         # so it has the proper information when doing timeline editing.
         if max_duration and ges_clip.props.max_duration > max_duration:
             ges_clip.props.max_duration = max_duration
+
+        # The proxy of the new clip is needed before the others.
+        self.__schedule_proxies_priorities_update()
         return ges_clip
 
     def __create_clips(self, x, y):
@@ -1058,10 +1244,7 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
         self.clean_drop_data()
         if target == URI_TARGET_ENTRY.target:
             if self.__last_clips_on_leave:
-                pipeline = self._project.pipeline
-                with self.app.action_log.started("add clip",
-                                                 finalizing_action=CommitTimelineFinalizingAction(pipeline),
-                                                 toplevel=True):
+                with self.batch_edit("add clip", toplevel=True):
                     if self.__on_separators:
                         priority = self.separator_priority(self.__on_separators[1])
                         created_layer = self.create_layer(priority)
@@ -1215,7 +1398,8 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
             return
 
         self.update_snapping_distance()
-        self.zoomed_fitted = False
+        if Zoomable.get_current_zoom_level() != self.__fitted_zoom_level:
+            self.zoomed_fitted = False
 
         self.update_position()
         self.editor_state.set_value("zoom-level", Zoomable.get_current_zoom_level())
@@ -1244,6 +1428,7 @@ class Timeline(Gtk.EventBox, Zoomable, Loggable):
                 return
 
         Zoomable.set_zoom_level(nearest_zoom_level)
+        self.__fitted_zoom_level = nearest_zoom_level
         self.update_snapping_distance()
 
         # Only do this at the very end, after updating the other widgets.
@@ -1496,8 +1681,7 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
 
     def insert_clips_on_first_layer(self, clips, position=None):
         """Adds clips to the timeline on the first layer."""
-        with self.app.action_log.started("insert on first layer",
-                                         finalizing_action=CommitTimelineFinalizingAction(self._project.pipeline)):
+        with self.timeline.batch_edit("insert on first layer"):
             layers = self.ges_timeline.get_layers()
             first_layer = layers[0]
             start = self.__get_insert_position(position)
@@ -1519,8 +1703,7 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
         initial_position = self.__get_insert_position(position)
         clip_position = initial_position
 
-        with self.app.action_log.started("add asset",
-                                         finalizing_action=CommitTimelineFinalizingAction(self._project.pipeline)):
+        with self.timeline.batch_edit("add asset"):
             for obj in objs:
                 if isinstance(obj, GES.Clip):
                     obj.set_start(clip_position)
@@ -1997,9 +2180,7 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
             return
 
         position = self._project.pipeline.get_position()
-        with self.app.action_log.started("paste",
-                                         finalizing_action=CommitTimelineFinalizingAction(self._project.pipeline),
-                                         toplevel=True):
+        with self.timeline.batch_edit("paste", toplevel=True):
             copied_group_shallow_copy = self.__copied_group.paste(position)
             if not copied_group_shallow_copy:
                 self.info("The paste is not possible at position: %s", position)
@@ -2024,27 +2205,21 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
         if after is not None:
             start = after
             end = self.ges_timeline.props.duration
-            edges = [end]
         else:
             start = 0
             end = before
-            edges = [start]
 
         if start >= end:
             return None
 
-        for layer in self.ges_timeline.layers:
-            clips = layer.get_clips_in_interval(start, end)
-            for clip in clips:
-                if clip.start > start:
-                    edges.append(clip.start)
-                if clip.start + clip.duration < end:
-                    edges.append(clip.start + clip.duration)
-
         if after is not None:
-            return min(edges)
+            edges = [layer.ui.clips_index.get_next_edge(start)
+                     for layer in self.ges_timeline.layers]
+            return min([edge for edge in edges if edge is not None and edge < end], default=end)
         else:
-            return max(edges)
+            edges = [layer.ui.clips_index.get_previous_edge(end)
+                     for layer in self.ges_timeline.layers]
+            return max([edge for edge in edges if edge is not None and edge > start], default=start)
 
     def _seek_forward_clip_cb(self, unused_action, unused_parameter):
         """Seeks to the first clip edge at the right of the playhead."""
@@ -2093,8 +2268,7 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
         If clips are selected, split them at the current playhead position.
         Otherwise, split all clips at the playhead position.
         """
-        with self.app.action_log.started("split clip", toplevel=True,
-                                         finalizing_action=CommitTimelineFinalizingAction(self._project.pipeline)):
+        with self.timeline.batch_edit("split clip", toplevel=True):
             self._split_elements(self.timeline.selection.selected)
 
     def _split_elements(self, clips=None):
@@ -2107,7 +2281,7 @@ class TimelineContainer(Gtk.Grid, Zoomable, Loggable):
         position = self._project.pipeline.get_position()
         splitted = False
 
-        with self._project.pipeline.commit_timeline_after():
+        with self.timeline.batch_edit("split clips"):
             for clip in clips:
                 start = clip.get_start()
                 end = start + clip.get_duration()
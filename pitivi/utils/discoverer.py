@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Persistence of the discoverer infos of the media files."""
+import hashlib
+import os
+
+from gi.repository import GLib
+from gi.repository import GstPbutils
+
+from pitivi.settings import xdg_cache_home
+from pitivi.utils.loggable import Loggable
+from pitivi.utils.misc import path_from_uri
+
+
+class DiscovererCache(Loggable):
+    """On-disk cache of the discoverer infos, by URI.
+
+    An entry holds the serialized streams info, duration and tags of a file,
+    and is invalidated when the size or the modification time of the file
+    change.
+
+    Attributes:
+        path (str): The directory containing the entries.
+    """
+
+    def __init__(self, path=None):
+        Loggable.__init__(self)
+        self.path = path or xdg_cache_home("discoverer")
+
+    @staticmethod
+    def get_entry_name(uri):
+        """Gets the name of the file holding the entry of the URI."""
+        return hashlib.sha256(uri.encode("UTF-8")).hexdigest()
+
+    def __get_entry_path(self, uri):
+        return os.path.join(self.path, self.get_entry_name(uri))
+
+    @staticmethod
+    def __get_stamp(uri):
+        """Gets the size and the modification time of the file, if local."""
+        if not uri.startswith("file://"):
+            return None
+
+        try:
+            stat = os.stat(path_from_uri(uri))
+        except OSError:
+            return None
+        return [str(stat.st_size), str(stat.st_mtime_ns)]
+
+    def __read_entry(self, uri):
+        """Reads the header and the data of the entry of the URI."""
+        try:
+            with open(self.__get_entry_path(uri), "rb") as entry:
+                header = entry.readline().decode("UTF-8").split()
+                data = entry.read()
+        except (OSError, UnicodeDecodeError):
+            return None, None
+
+        if len(header) != 3:
+            return None, None
+        return header, data
+
+    def load(self, uri):
+        """Gets the discoverer info of the file, if the entry is valid.
+
+        Args:
+            uri (str): The URI of the file.
+
+        Returns:
+            Optional[GstPbutils.DiscovererInfo]: The cached info.
+        """
+        stamp = self.__get_stamp(uri)
+        if not stamp:
+            return None
+
+        header, data = self.__read_entry(uri)
+        if not header:
+            return None
+
+        if header[:2] != stamp:
+            self.debug("Invalidating the discoverer info of %s", uri)
+            try:
+                os.remove(self.__get_entry_path(uri))
+            except OSError:
+                pass
+            return None
+
+        try:
+            variant = GLib.Variant.new_from_bytes(GLib.VariantType.new(header[2]),
+                                                  GLib.Bytes.new(data), False)
+            info = GstPbutils.DiscovererInfo.from_variant(variant)
+        except (GLib.Error, TypeError) as e:
+            self.warning("Failed loading the discoverer info of %s: %s", uri, e)
+            return None
+
+        self.log("Loaded the discoverer info of %s", uri)
+        return info
+
+    def save(self, info):
+        """Stores the discoverer info of a file which has been discovered.
+
+        Args:
+            info (GstPbutils.DiscovererInfo): The info to be cached.
+        """
+        if info.get_result() != GstPbutils.DiscovererResult.OK:
+            return
+
+        uri = info.get_uri()
+        stamp = self.__get_stamp(uri)
+        if not stamp:
+            return
+
+        header, unused_data = self.__read_entry(uri)
+        if header and header[:2] == stamp:
+            # Most probably the info has just been loaded from the cache.
+            return
+
+        variant = info.to_variant(GstPbutils.DiscovererSerializeFlags.ALL)
+        header = " ".join(stamp + [variant.get_type_string()]) + "\n"
+        entry_path = self.__get_entry_path(uri)
+        tmp_path = entry_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as entry:
+                entry.write(header.encode("UTF-8"))
+                entry.write(variant.get_data_as_bytes().get_data())
+            os.replace(tmp_path, entry_path)
+        except OSError as e:
+            self.warning("Failed saving the discoverer info of %s: %s", uri, e)
@@ -14,6 +14,12 @@
 #
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
+import bisect
+import collections
+import fcntl
+import hashlib
+import itertools
+import json
 import os
 import time
 from fractions import Fraction
@@ -30,9 +36,14 @@ from gi.repository import GstTranscoder
 from pitivi.configure import get_gstpresets_dir
 from pitivi.dialogs.prefs import PreferencesDialog
 from pitivi.settings import GlobalSettings
+from pitivi.settings import xdg_cache_home
 from pitivi.utils.loggable import Loggable
 from pitivi.utils.misc import ASSET_DURATION_META
 from pitivi.utils.misc import asset_get_duration
+from pitivi.utils.misc import path_from_uri
+from pitivi.utils.misc import quote_uri
+from pitivi.utils.system import create_cpu_throttling_clock
+from pitivi.utils.system import LoadGovernor
 
 # Make sure gst knowns about our own GstPresets
 Gst.preset_set_app_dir(get_gstpresets_dir())
@@ -44,6 +55,16 @@ class ProxyingStrategy:
     NOTHING = "nothing"
 
 
+class ProxyJobPriority:
+    """The priorities of the proxying jobs, the most urgent first."""
+
+    # The asset is used close to the playhead or in the visible timeline.
+    TIMELINE = 0
+    # The asset is visible in the media library.
+    MEDIA_LIBRARY = 1
+    DEFAULT = 2
+
+
 GlobalSettings.add_config_section("proxy")
 GlobalSettings.add_config_option('proxying_strategy',
                                  section='proxy',
@@ -73,6 +94,22 @@ PreferencesDialog.add_numeric_preference('max_cpu_usage',
                                          lower=1,
                                          upper=100)
 
+GlobalSettings.add_config_option("num_proxying_segments",
+                                 section="proxy",
+                                 key="num-proxying-segments",
+                                 default=1,
+                                 notify=True)
+PreferencesDialog.add_numeric_preference("num_proxying_segments",
+                                         description=_("Long assets are split in this many segments, "
+                                                       "transcoded in parallel."),
+                                         section="_proxies",
+                                         label=_("Number of segments of long assets"),
+                                         lower=1,
+                                         upper=64)
+
+# The assets shorter than this are not split in segments when transcoding.
+SEGMENTED_PROXYING_MIN_DURATION = 10 * 60 * Gst.SECOND
+
 
 GlobalSettings.add_config_option("auto_scaling_enabled",
                                  section="proxy",
@@ -109,8 +146,483 @@ def create_encoding_profile_simple(container_caps, audio_caps, video_caps):
     return container_profile
 
 
+class JobsQueue:
+    """Queue of jobs, FIFO within each ProxyJobPriority.
+
+    Each job keeps the position in which it has been pushed, so when its
+    priority changes it takes its original place among the jobs having
+    the new priority.
+    """
+
+    def __init__(self):
+        # The (sequence, job) items of each priority, sorted.
+        self.__queues = collections.defaultdict(list)
+        self.__priorities = {}
+        self.__sequences = {}
+        self.__sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.__priorities)
+
+    def __contains__(self, job):
+        return job in self.__priorities
+
+    def __iter__(self):
+        """Iterates over the jobs, in the order they would be popped."""
+        for priority in sorted(self.__queues):
+            for unused_sequence, job in list(self.__queues[priority]):
+                yield job
+
+    def push(self, job, priority=ProxyJobPriority.DEFAULT):
+        """Queues a job after the jobs having the same priority."""
+        self.__sequences[job] = next(self.__sequence)
+        self.__insert(job, priority)
+
+    def __insert(self, job, priority):
+        self.__priorities[job] = priority
+        self.__queues[priority].insert(self.__index(job, priority), (self.__sequences[job], job))
+
+    def __index(self, job, priority):
+        sequences = [sequence for sequence, unused_job in self.__queues[priority]]
+        return bisect.bisect_left(sequences, self.__sequences[job])
+
+    def __discard(self, job):
+        priority = self.__priorities.pop(job)
+        del self.__queues[priority][self.__index(job, priority)]
+
+    def pop(self):
+        """Removes and returns the oldest job with the most urgent priority.
+
+        Raises:
+            IndexError: When the queue is empty.
+        """
+        for priority in sorted(self.__queues):
+            queue = self.__queues[priority]
+            if queue:
+                unused_sequence, job = queue.pop(0)
+                del self.__priorities[job]
+                del self.__sequences[job]
+                return job
+        raise IndexError("pop from an empty queue")
+
+    def remove(self, job):
+        """Removes a job from the queue."""
+        self.__discard(job)
+        del self.__sequences[job]
+
+    def get_priority(self, job):
+        return self.__priorities[job]
+
+    def set_priority(self, job, priority):
+        """Moves a job among the jobs having the new priority, if it changed."""
+        if self.__priorities[job] != priority:
+            self.__discard(job)
+            self.__insert(job, priority)
+
+
+class ProxySegment(GObject.Object, Loggable):
+    """Transcodes a time range of an asset into a separate file.
+
+    Attributes:
+        start (int): The start of the range, in nanoseconds.
+        stop (int): The end of the range, in nanoseconds.
+        location (str): The path of the file being written.
+        done (bool): Whether the range has been transcoded entirely.
+    """
+
+    __gsignals__ = {
+        "done": (GObject.SignalFlags.RUN_LAST, None, ()),
+        "error": (GObject.SignalFlags.RUN_LAST, None, (object,)),
+    }
+
+    def __init__(self, src_uri, location, profile, start, stop, max_cpu_usage):
+        GObject.Object.__init__(self)
+        Loggable.__init__(self)
+        self.start = start
+        self.stop = stop
+        self.location = location
+        self.done = False
+        self.__running = False
+        self.__max_cpu_usage = max_cpu_usage
+        # The clock throttling the pipeline while it runs.
+        self.__clock = None
+
+        # The decoded pads blocked until the decoder seeks to the start.
+        self.__blocked_pads = {}
+
+        self.pipeline = Gst.Pipeline.new(None)
+        self.__decode = Gst.ElementFactory.make("uridecodebin", None)
+        self.__decode.props.uri = src_uri
+        self.__decode.connect("pad-added", self.__pad_added_cb)
+        self.__decode.connect("no-more-pads", self.__no_more_pads_cb)
+        self.__encodebin = Gst.ElementFactory.make("encodebin", None)
+        self.__encodebin.props.profile = profile
+        filesink = Gst.ElementFactory.make("filesink", None)
+        filesink.props.location = location
+        for element in (self.__decode, self.__encodebin, filesink):
+            self.pipeline.add(element)
+        self.__encodebin.link(filesink)
+
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.__bus_message_cb)
+
+    def run(self):
+        self.__running = True
+        # The pending segments do not take a share of the CPU budget.
+        self.__clock = create_cpu_throttling_clock(self.__max_cpu_usage)
+        self.pipeline.use_clock(self.__clock)
+        self.pipeline.set_state(Gst.State.PLAYING)
+
+    def cancel(self):
+        if not self.__running:
+            return
+        self.__running = False
+        self.pipeline.get_bus().remove_signal_watch()
+        self.pipeline.set_state(Gst.State.NULL)
+        LoadGovernor.get().remove_consumer(self.__clock)
+        self.__clock = None
+
+    def get_position(self):
+        """Gets how much of the range has been transcoded, in nanoseconds."""
+        if self.done:
+            return self.stop - self.start
+
+        res, position = self.pipeline.query_position(Gst.Format.TIME)
+        if not res:
+            return 0
+        return max(0, min(position, self.stop) - self.start)
+
+    def __pad_added_cb(self, unused_decode, pad):
+        # Called in a streaming thread.
+        probe_id = pad.add_probe(Gst.PadProbeType.BLOCK_DOWNSTREAM, self.__pad_blocked_cb)
+        self.__blocked_pads[pad] = probe_id
+
+    def __pad_blocked_cb(self, unused_pad, unused_info):
+        return Gst.PadProbeReturn.OK
+
+    def __no_more_pads_cb(self, unused_decode):
+        GLib.idle_add(self.__seek_and_link)
+
+    def __seek_and_link(self):
+        # Seek before any data reaches the encoders, so the file
+        # starts exactly at the start of the range.
+        pad = next(iter(self.__blocked_pads))
+        seek = Gst.Event.new_seek(1.0, Gst.Format.TIME,
+                                  Gst.SeekFlags.FLUSH | Gst.SeekFlags.ACCURATE,
+                                  Gst.SeekType.SET, self.start,
+                                  Gst.SeekType.SET, self.stop)
+        if not pad.send_event(seek):
+            self.emit("error", GLib.Error("Failed seeking %s to %s" % (
+                self.location, Gst.TIME_ARGS(self.start))))
+            return False
+
+        for pad, probe_id in self.__blocked_pads.items():
+            sinkpad = self.__encodebin.emit("request-pad", pad.query_caps(None))
+            if not sinkpad:
+                # The stream is not part of the profile.
+                fakesink = Gst.ElementFactory.make("fakesink", None)
+                self.pipeline.add(fakesink)
+                fakesink.sync_state_with_parent()
+                sinkpad = fakesink.get_static_pad("sink")
+            pad.link(sinkpad)
+            pad.remove_probe(probe_id)
+        self.__blocked_pads = {}
+        return False
+
+    def __bus_message_cb(self, unused_bus, message):
+        if message.type == Gst.MessageType.EOS:
+            self.cancel()
+            self.done = True
+            self.emit("done")
+        elif message.type == Gst.MessageType.ERROR:
+            error, unused_details = message.parse_error()
+            self.cancel()
+            self.emit("error", error)
+
+
+class SegmentedTranscoder(GObject.Object, Loggable):
+    """Transcodes segments of an asset in parallel and concatenates them.
+
+    Has the parts of the GstTranscoder.Transcoder API used by the
+    ProxyManager. The proxying formats have only keyframes, so the segments
+    are concatenated without reencoding.
+    """
+
+    __gsignals__ = {
+        "done": (GObject.SignalFlags.RUN_LAST, None, ()),
+        "error": (GObject.SignalFlags.RUN_LAST, None, (object, object)),
+        "position-updated": (GObject.SignalFlags.RUN_LAST, None, (GObject.TYPE_UINT64,)),
+    }
+
+    src_uri = GObject.Property(type=str)
+    dest_uri = GObject.Property(type=str)
+    duration = GObject.Property(type=GObject.TYPE_UINT64)
+    position = GObject.Property(type=GObject.TYPE_UINT64)
+    position_update_interval = GObject.Property(type=int, default=1000)
+
+    def __init__(self, asset, dest_uri, profile, num_segments, max_cpu_usage):
+        GObject.Object.__init__(self, src_uri=asset.get_id(), dest_uri=dest_uri,
+                                duration=asset.get_duration())
+        Loggable.__init__(self)
+        self.__profile = profile
+        self.__position_id = 0
+        self.__concat_pipeline = None
+
+        framerate = None
+        video_streams = asset.get_info().get_video_streams()
+        if video_streams and video_streams[0].get_framerate_num():
+            framerate = Fraction(video_streams[0].get_framerate_num(),
+                                 video_streams[0].get_framerate_denom())
+        self.__stream_types = []
+        if video_streams:
+            self.__stream_types.append("video")
+        if asset.get_info().get_audio_streams():
+            self.__stream_types.append("audio")
+
+        self.segments = []
+        location = Gst.uri_get_location(dest_uri)
+        boundaries = self.get_boundaries(self.props.duration, num_segments, framerate)
+        # The segments share the CPU usage allowed to the transcoder.
+        segment_cpu_usage = max(1, max_cpu_usage // (len(boundaries) - 1))
+        for index, (start, stop) in enumerate(zip(boundaries, boundaries[1:])):
+            segment = ProxySegment(self.props.src_uri, "%s.%d" % (location, index),
+                                   profile, start, stop, segment_cpu_usage)
+            segment.connect("done", self.__segment_done_cb)
+            segment.connect("error", self.__segment_error_cb)
+            self.segments.append(segment)
+
+    @staticmethod
+    def get_boundaries(duration, num_segments, framerate=None):
+        """Splits the duration in segments starting on frames.
+
+        Args:
+            duration (int): The duration to be split, in nanoseconds.
+            num_segments (int): The number of segments.
+            framerate (Optional[Fraction]): The framerate of the video.
+
+        Returns:
+            List[int]: The positions where the segments start, followed by
+            the duration.
+        """
+        boundaries = [0]
+        for index in range(1, num_segments):
+            position = duration * index // num_segments
+            if framerate:
+                frame = position * framerate // Gst.SECOND
+                position = int(frame * Gst.SECOND / framerate)
+            if position > boundaries[-1]:
+                boundaries.append(position)
+        boundaries.append(duration)
+        return boundaries
+
+    def run_async(self):
+        for segment in self.segments:
+            segment.run()
+        self.__position_id = GLib.timeout_add(self.props.position_update_interval,
+                                              self.__update_position_cb)
+
+    def cancel(self):
+        """Stops the transcoding and removes the files being written."""
+        self.__stop_updating_position()
+        for segment in self.segments:
+            segment.cancel()
+        if self.__concat_pipeline:
+            self.__concat_pipeline.get_bus().remove_signal_watch()
+            self.__concat_pipeline.set_state(Gst.State.NULL)
+            self.__concat_pipeline = None
+        self.__remove_segments_files()
+
+    def __stop_updating_position(self):
+        if self.__position_id:
+            GLib.source_remove(self.__position_id)
+            self.__position_id = 0
+
+    def __update_position_cb(self):
+        self.props.position = sum(segment.get_position() for segment in self.segments)
+        self.emit("position-updated", self.props.position)
+        return True
+
+    def __remove_segments_files(self):
+        for segment in self.segments:
+            try:
+                os.remove(segment.location)
+            except OSError:
+                pass
+
+    def __segment_error_cb(self, unused_segment, error):
+        self.cancel()
+        self.emit("error", error, None)
+
+    def __segment_done_cb(self, segment):
+        self.debug("Transcoded %s", segment.location)
+        if all(other.done for other in self.segments):
+            self.__stop_updating_position()
+            self.__concatenate()
+
+    def __concatenate(self):
+        factories = Gst.ElementFactory.list_filter(
+            Gst.ElementFactory.list_get_elements(Gst.ELEMENT_FACTORY_TYPE_MUXER,
+                                                 Gst.Rank.MARGINAL),
+            self.__profile.get_format(), Gst.PadDirection.SRC, False)
+        if not factories:
+            self.__segment_error_cb(None, GLib.Error("No muxer for %s" % self.__profile.get_format()))
+            return
+        factories.sort(key=lambda factory: factory.get_rank(), reverse=True)
+
+        pipeline = Gst.Pipeline.new(None)
+        muxer = factories[0].create(None)
+        filesink = Gst.ElementFactory.make("filesink", None)
+        filesink.props.location = Gst.uri_get_location(self.props.dest_uri)
+        pipeline.add(muxer)
+        pipeline.add(filesink)
+        muxer.link(filesink)
+
+        # The pads of the concat elements, by stream type, in the order
+        # of the segments.
+        concat_pads = {}
+        for stream_type in self.__stream_types:
+            concat = Gst.ElementFactory.make("concat", None)
+            pipeline.add(concat)
+            concat_pads[stream_type] = [concat.get_request_pad("sink_%u")
+                                        for unused_segment in self.segments]
+            concat.get_static_pad("src").link(muxer.get_request_pad("%s_%%u" % stream_type))
+
+        for index, segment in enumerate(self.segments):
+            filesrc = Gst.ElementFactory.make("filesrc", None)
+            filesrc.props.location = segment.location
+            parsebin = Gst.ElementFactory.make("parsebin", None)
+            parsebin.connect("pad-added", self.__parsebin_pad_added_cb, concat_pads, index)
+            pipeline.add(filesrc)
+            pipeline.add(parsebin)
+            filesrc.link(parsebin)
+
+        bus = pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message", self.__concat_bus_message_cb)
+        self.__concat_pipeline = pipeline
+        pipeline.set_state(Gst.State.PLAYING)
+
+    def __parsebin_pad_added_cb(self, unused_parsebin, pad, concat_pads, index):
+        caps_name = pad.query_caps(None).get_structure(0).get_name()
+        stream_type = "audio" if caps_name.startswith("audio/") else "video"
+        pad.link(concat_pads[stream_type][index])
+
+    def __concat_bus_message_cb(self, unused_bus, message):
+        if message.type == Gst.MessageType.EOS:
+            self.__concat_pipeline.get_bus().remove_signal_watch()
+            self.__concat_pipeline.set_state(Gst.State.NULL)
+            self.__concat_pipeline = None
+            self.__remove_segments_files()
+            self.props.position = self.props.duration
+            self.emit("done")
+        elif message.type == Gst.MessageType.ERROR:
+            error, unused_details = message.parse_error()
+            self.__segment_error_cb(None, error)
+
+
+class ProxyStore(Loggable):
+    """Index of the proxies by the fingerprints of their targets.
+
+    Allows using a proxy for all the copies of a file.
+
+    Attributes:
+        path (str): The directory containing the entries.
+    """
+
+    # The size of the data hashed at the start and at the end of a file.
+    FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, path=None):
+        Loggable.__init__(self)
+        self.path = path or xdg_cache_home("proxies")
+
+    @classmethod
+    def get_fingerprint(cls, path):
+        """Gets a hash of the size and of the start and end of a file.
+
+        Raises:
+            OSError: When the file cannot be read.
+        """
+        size = os.path.getsize(path)
+        fingerprint = hashlib.sha256(str(size).encode("UTF-8"))
+        with open(path, "rb") as file:
+            fingerprint.update(file.read(cls.FINGERPRINT_CHUNK_SIZE))
+            if size > cls.FINGERPRINT_CHUNK_SIZE:
+                file.seek(max(cls.FINGERPRINT_CHUNK_SIZE, size - cls.FINGERPRINT_CHUNK_SIZE))
+                fingerprint.update(file.read(cls.FINGERPRINT_CHUNK_SIZE))
+        return fingerprint.hexdigest()
+
+    def __get_entry_path(self, target_uri, proxy_uri):
+        fingerprint = self.get_fingerprint(path_from_uri(target_uri))
+        # The kind of proxy, including the scaled proxy resolution.
+        suffix = proxy_uri[len(target_uri):]
+        return os.path.join(self.path, fingerprint + suffix)
+
+    def add(self, target_uri, proxy_uri):
+        """Records the proxy created for the target.
+
+        Args:
+            target_uri (str): The URI of the original file.
+            proxy_uri (str): The URI of the proxy file.
+        """
+        try:
+            entry_path = self.__get_entry_path(target_uri, proxy_uri)
+            with open(entry_path, "w") as entry:
+                entry.write(proxy_uri)
+        except OSError as e:
+            self.warning("Failed recording the proxy %s: %s", proxy_uri, e)
+
+    def reuse(self, target_uri, proxy_uri):
+        """Creates the proxy by linking the proxy of a copy of the target.
+
+        Args:
+            target_uri (str): The URI of the original file.
+            proxy_uri (str): The URI of the missing proxy file.
+
+        Returns:
+            bool: True if the proxy file has been created.
+        """
+        try:
+            entry_path = self.__get_entry_path(target_uri, proxy_uri)
+            with open(entry_path, "r") as entry:
+                existing_uri = entry.read()
+        except OSError:
+            return False
+
+        if existing_uri == proxy_uri:
+            return False
+
+        existing_path = path_from_uri(existing_uri)
+        if not os.path.isfile(existing_path):
+            self.debug("The proxy %s does not exist anymore", existing_uri)
+            os.remove(entry_path)
+            return False
+
+        proxy_path = path_from_uri(proxy_uri)
+        try:
+            os.link(existing_path, proxy_path)
+        except OSError:
+            # Most probably on different file systems.
+            try:
+                os.symlink(existing_path, proxy_path)
+            except OSError as e:
+                self.warning("Failed reusing the proxy %s: %s", existing_uri, e)
+                return False
+
+        self.info("Reusing %s as proxy of %s", existing_uri, target_uri)
+        return True
+
+
 class ProxyManager(GObject.Object, Loggable):
-    """Transcodes assets and manages proxies."""
+    """Transcodes assets and manages proxies.
+
+    Args:
+        app (Pitivi): The app.
+        save_jobs (bool): Whether the unfinished jobs are saved so they can
+            be resumed at the next start. Only the first running Pitivi
+            process saves the jobs, because they are saved in the same file.
+    """
 
     __gsignals__ = {
         "progress": (GObject.SignalFlags.RUN_LAST, None, (object, int, int)),
@@ -128,23 +640,18 @@ class ProxyManager(GObject.Object, Loggable):
                             "video/x-raw", "video/x-vp8",
                             "video/x-theora"]
 
-    WHITELIST_FORMATS = []
-    for container in WHITELIST_CONTAINER_CAPS:
-        for audio in WHITELIST_AUDIO_CAPS:
-            for video in WHITELIST_VIDEO_CAPS:
-                WHITELIST_FORMATS.append(create_encoding_profile_simple(
-                    container, audio, video))
-
-    for audio in WHITELIST_AUDIO_CAPS:
-        a = GstPbutils.EncodingAudioProfile.new(Gst.Caps(audio), None, None, 0)
-        WHITELIST_FORMATS.append(a)
+    # The profiles of the formats not needing to be proxied, created
+    # the first time they are needed.
+    _whitelist_formats = None
 
     hq_proxy_extension = "proxy.mov"
     scaled_proxy_extension = "scaledproxy.mov"
     # Suffix for filenames of proxies being created.
     part_suffix = ".part"
+    # The locked file marking the process owning the saved jobs.
+    _jobs_lock_file = None
 
-    def __init__(self, app):
+    def __init__(self, app, save_jobs=True):
         GObject.Object.__init__(self)
         Loggable.__init__(self)
 
@@ -155,11 +662,30 @@ class ProxyManager(GObject.Object, Loggable):
         self._transcoded_durations = {}
         self._start_proxying_time = 0
         self.__running_transcoders = []
-        self.__pending_transcoders = []
+        self.__pending_transcoders = JobsQueue()
+        # The URIs of the assets having a priority other than DEFAULT.
+        self.__prioritized_uris = {}
         # The scaled proxy transcoders waiting for their corresponding shadow
         # HQ proxy transcoder to finish.
         self.__waiting_transcoders = []
 
+        self.__proxy_store = ProxyStore()
+
+        # The jobs are saved so they can be resumed when Pitivi exits before
+        # they finish.
+        self.__jobs_file_path = None
+        if save_jobs and self._lock_jobs():
+            self.__jobs_file_path = os.path.join(xdg_cache_home(), "proxy-jobs.json")
+        self.__jobs_saving_id = 0
+        # The jobs not finished when Pitivi exited, in the order they were
+        # to be processed, waiting for their assets to be loaded.
+        self.__interrupted_jobs = self.__load_interrupted_jobs()
+
+        # The encoding profiles by target file, proxy size and audio channels.
+        self.__encoding_profiles = {}
+        # Whether the assets are well supported, by the caps of their streams.
+        self.__format_verdicts = {}
+
         self.__encoding_target_file = None
         self.proxying_unsupported = False
         for encoding_format in [ENCODING_FORMAT_JPEG, ENCODING_FORMAT_PRORES]:
@@ -198,6 +724,39 @@ class ProxyManager(GObject.Object, Loggable):
 
         return width, height
 
+    @classmethod
+    def _get_whitelist_formats(cls):
+        """Gets the profiles of the formats not needing to be proxied."""
+        if cls._whitelist_formats is None:
+            formats = []
+            for container in cls.WHITELIST_CONTAINER_CAPS:
+                for audio in cls.WHITELIST_AUDIO_CAPS:
+                    for video in cls.WHITELIST_VIDEO_CAPS:
+                        formats.append(create_encoding_profile_simple(
+                            container, audio, video))
+
+            for audio in cls.WHITELIST_AUDIO_CAPS:
+                formats.append(GstPbutils.EncodingAudioProfile.new(Gst.Caps(audio), None, None, 0))
+
+            cls._whitelist_formats = formats
+        return cls._whitelist_formats
+
+    @staticmethod
+    def _get_format_key(asset):
+        """Gets a key identifying the format of the asset's streams.
+
+        Two assets with the same key match the same encoding profiles.
+        """
+        info = asset.get_info()
+        stream_info = info.get_stream_info()
+        container_caps = None
+        if stream_info:
+            container_caps = stream_info.get_caps().to_string()
+        return (isinstance(stream_info, GstPbutils.DiscovererContainerInfo),
+                container_caps,
+                tuple(stream.get_caps().to_string() for stream in info.get_audio_streams()),
+                tuple(stream.get_caps().to_string() for stream in info.get_video_streams()))
+
     def _asset_matches_encoding_format(self, asset, encoding_profile):
         def caps_match(info, profile):
             return not info.get_caps().intersect(profile.get_format()).is_empty()
@@ -233,6 +792,24 @@ class ProxyManager(GObject.Object, Loggable):
 
     def __get_encoding_profile(self, encoding_target_file, asset=None, width=None,
                                height=None):
+        """Gets the profile for transcoding the asset, created at most once."""
+        channels = None
+        if asset:
+            audio_streams = asset.get_info().get_audio_streams()
+            if audio_streams:
+                channels = audio_streams[0].get_channels()
+
+        key = (encoding_target_file, width, height, channels)
+        try:
+            return self.__encoding_profiles[key]
+        except KeyError:
+            pass
+
+        encoding_profile = self.__create_encoding_profile(encoding_target_file, width, height, channels)
+        self.__encoding_profiles[key] = encoding_profile
+        return encoding_profile
+
+    def __create_encoding_profile(self, encoding_target_file, width, height, channels):
         encoding_target = GstPbutils.EncodingTarget.load_from_file(
             os.path.join(get_gstpresets_dir(), encoding_target_file))
         encoding_profile = encoding_target.get_profile("default")
@@ -262,16 +839,13 @@ class ProxyManager(GObject.Object, Loggable):
                     profile_format, Gst.PadDirection.SINK, False):
                 return None
 
-        if asset:
-            # If we have an asset, we force audioconvert to keep
+        if channels:
+            # If the asset has audio, we force audioconvert to keep
             # the number of channels
             # TODO: remove once https://bugzilla.gnome.org/show_bug.cgi?id=767226
             # is fixed
-            info = asset.get_info()
             try:
                 # TODO Be smarter about multiple streams
-                audio_stream = info.get_audio_streams()[0]
-                channels = audio_stream.get_channels()
                 audio_profile = [
                     profile for profile in encoding_profile.get_profiles()
                     if isinstance(profile, GstPbutils.EncodingAudioProfile)][0]
@@ -361,12 +935,17 @@ class ProxyManager(GObject.Object, Loggable):
                                  self.hq_proxy_extension)
 
     def is_asset_format_well_supported(self, asset):
-        for encoding_format in self.WHITELIST_FORMATS:
-            if self._asset_matches_encoding_format(asset, encoding_format):
-                self.info("Automatically not proxying")
-                return True
+        key = self._get_format_key(asset)
+        try:
+            supported = self.__format_verdicts[key]
+        except KeyError:
+            supported = any(self._asset_matches_encoding_format(asset, encoding_format)
+                            for encoding_format in self._get_whitelist_formats())
+            self.__format_verdicts[key] = supported
 
-        return False
+        if supported:
+            self.info("Automatically not proxying")
+        return supported
 
     def asset_matches_target_res(self, asset):
         """Returns whether the asset's size <= the scaled proxy size."""
@@ -425,6 +1004,10 @@ class ProxyManager(GObject.Object, Loggable):
         self.debug("Starting %s", transcoder.props.src_uri)
         if self._start_proxying_time == 0:
             self._start_proxying_time = time.time()
+        if not isinstance(transcoder, SegmentedTranscoder):
+            # The pending transcoders do not take a share of the CPU budget.
+            LoadGovernor.get().add_consumer(transcoder, self.app.settings.max_cpu_usage,
+                                            GstTranscoder.Transcoder.set_cpu_usage)
         transcoder.run_async()
         self.__running_transcoders.append(transcoder)
 
@@ -457,8 +1040,9 @@ class ProxyManager(GObject.Object, Loggable):
                 self.__create_transcoder(asset)
                 return
         else:
-            transcoder.props.pipeline.props.video_filter.finalize()
-            transcoder.props.pipeline.props.audio_filter.finalize()
+            if not isinstance(transcoder, SegmentedTranscoder):
+                transcoder.props.pipeline.props.video_filter.finalize()
+                transcoder.props.pipeline.props.audio_filter.finalize()
 
             del transcoder
 
@@ -511,10 +1095,12 @@ class ProxyManager(GObject.Object, Loggable):
         self.debug("Transcoder done with %s", asset.get_id())
 
         self.__running_transcoders.remove(transcoder)
+        LoadGovernor.get().remove_consumer(transcoder)
 
         proxy_uri = transcoder.props.dest_uri.rstrip(ProxyManager.part_suffix)
         os.rename(Gst.uri_get_location(transcoder.props.dest_uri),
                   Gst.uri_get_location(proxy_uri))
+        self.__proxy_store.add(transcoder.props.src_uri, proxy_uri)
 
         shadow = self._is_shadow_transcoder(transcoder)
         second_transcoder = self._get_second_transcoder(transcoder)
@@ -549,6 +1135,7 @@ class ProxyManager(GObject.Object, Loggable):
                 self._transcoded_durations = {}
                 self._total_time_to_transcode = 0
                 self._start_proxying_time = 0
+        self.__schedule_jobs_saving()
 
     def __emit_progress(self, asset, creation_progress):
         """Handles the transcoding progress of the specified asset."""
@@ -587,7 +1174,7 @@ class ProxyManager(GObject.Object, Loggable):
 
     def _get_second_transcoder(self, transcoder):
         """Gets the shadow of a scaled proxy or the other way around."""
-        all_transcoders = self.__running_transcoders + self.__pending_transcoders
+        all_transcoders = self.__running_transcoders + list(self.__pending_transcoders)
         for transcoder2 in all_transcoders:
             if transcoder2.props.position_update_interval == transcoder.props.position_update_interval:
                 # Both transcoders are of the same type.
@@ -612,7 +1199,7 @@ class ProxyManager(GObject.Object, Loggable):
         Returns:
             bool: True if the asset is being transcoded or pending.
         """
-        all_transcoders = self.__running_transcoders + self.__pending_transcoders
+        all_transcoders = self.__running_transcoders + list(self.__pending_transcoders)
         is_queued = False
         for transcoder in all_transcoders:
             transcoder_uri = transcoder.props.dest_uri
@@ -638,7 +1225,8 @@ class ProxyManager(GObject.Object, Loggable):
         asset_uri = asset.get_id()
         proxy_uri = self.get_proxy_uri(asset, scaled=scaled)
 
-        if Gio.File.new_for_uri(proxy_uri).query_exists(None):
+        if Gio.File.new_for_uri(proxy_uri).query_exists(None) or \
+                self.__proxy_store.reuse(asset_uri, proxy_uri):
             self.debug("Using proxy already generated: %s", proxy_uri)
             GES.Asset.request_async(GES.UriClip,
                                     proxy_uri, None,
@@ -661,14 +1249,31 @@ class ProxyManager(GObject.Object, Loggable):
                 project.scaled_proxy_height = h
             width, height = self._scale_asset_resolution(asset, w, h)
 
-        dispatcher = GstTranscoder.TranscoderGMainContextSignalDispatcher.new()
-
         enc_profile = self.__get_encoding_profile(self.__encoding_target_file,
                                                   asset, width, height)
 
-        transcoder = GstTranscoder.Transcoder.new_full(
-            asset_uri, proxy_uri + ProxyManager.part_suffix, enc_profile,
-            dispatcher)
+        num_segments = self.app.settings.num_proxying_segments
+        if num_segments > 1 and asset.get_duration() >= SEGMENTED_PROXYING_MIN_DURATION:
+            # The thumbnails and the waveforms cannot be generated while
+            # transcoding, as the segments are transcoded in parallel.
+            transcoder = SegmentedTranscoder(asset, proxy_uri + ProxyManager.part_suffix,
+                                             enc_profile, num_segments,
+                                             self.app.settings.max_cpu_usage)
+        else:
+            dispatcher = GstTranscoder.TranscoderGMainContextSignalDispatcher.new()
+            transcoder = GstTranscoder.Transcoder.new_full(
+                asset_uri, proxy_uri + ProxyManager.part_suffix, enc_profile,
+                dispatcher)
+
+            thumbnailbin = Gst.ElementFactory.make("teedthumbnailbin")
+            thumbnailbin.props.uri = asset.get_id()
+
+            waveformbin = Gst.ElementFactory.make("waveformbin")
+            waveformbin.props.uri = asset.get_id()
+            waveformbin.props.duration = asset.get_duration()
+
+            transcoder.props.pipeline.props.video_filter = thumbnailbin
+            transcoder.props.pipeline.props.audio_filter = waveformbin
 
         if shadow:
             # Used to identify shadow transcoder
@@ -676,17 +1281,6 @@ class ProxyManager(GObject.Object, Loggable):
         else:
             transcoder.props.position_update_interval = 1000
 
-        thumbnailbin = Gst.ElementFactory.make("teedthumbnailbin")
-        thumbnailbin.props.uri = asset.get_id()
-
-        waveformbin = Gst.ElementFactory.make("waveformbin")
-        waveformbin.props.uri = asset.get_id()
-        waveformbin.props.duration = asset.get_duration()
-
-        transcoder.props.pipeline.props.video_filter = thumbnailbin
-        transcoder.props.pipeline.props.audio_filter = waveformbin
-
-        transcoder.set_cpu_usage(self.app.settings.max_cpu_usage)
         transcoder.connect("position-updated",
                            self.__proxying_position_changed_cb,
                            asset)
@@ -697,7 +1291,147 @@ class ProxyManager(GObject.Object, Loggable):
         if len(self.__running_transcoders) < self.app.settings.num_transcoding_jobs:
             self.__start_transcoder(transcoder)
         else:
-            self.__pending_transcoders.append(transcoder)
+            self.__pending_transcoders.push(transcoder, self.__get_priority(asset_uri))
+        self.__schedule_jobs_saving()
+
+    def __get_priority(self, asset_uri):
+        priorities = [priority
+                      for priority, uris in self.__prioritized_uris.items()
+                      if asset_uri in uris]
+        return min(priorities, default=ProxyJobPriority.DEFAULT)
+
+    def has_pending_jobs(self):
+        """Returns whether transcoding jobs are waiting to be started."""
+        return bool(self.__pending_transcoders)
+
+    def set_prioritized_assets(self, priority, assets):
+        """Sets the assets whose pending jobs have the specified priority.
+
+        The assets previously set for the priority lose it.
+
+        Args:
+            priority (int): The ProxyJobPriority.
+            assets (Iterable[GES.Asset]): The original assets.
+        """
+        self.__prioritized_uris[priority] = {asset.props.id for asset in assets}
+        for transcoder in list(self.__pending_transcoders):
+            self.__pending_transcoders.set_priority(
+                transcoder, self.__get_priority(transcoder.props.src_uri))
+
+    def _lock_jobs(self):
+        """Makes sure the saved jobs are not used by other Pitivi processes.
+
+        The lock is kept until the process exits, so the partial proxies
+        of a running process are not removed by another one.
+
+        Returns:
+            bool: Whether this process owns the saved jobs.
+        """
+        if ProxyManager._jobs_lock_file:
+            return True
+
+        lock_path = os.path.join(xdg_cache_home(), "proxy-jobs.lock")
+        try:
+            lock_file = open(lock_path, "w")
+        except OSError as e:
+            self.warning("The proxy jobs could not be locked: %s", e)
+            return False
+
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.info("The proxy jobs are saved by another Pitivi process")
+            lock_file.close()
+            return False
+
+        ProxyManager._jobs_lock_file = lock_file
+        return True
+
+    def __load_interrupted_jobs(self):
+        """Loads the jobs saved when Pitivi exited, removing their partial proxies."""
+        if not self.__jobs_file_path:
+            return []
+
+        try:
+            with open(self.__jobs_file_path, "r") as file:
+                jobs = json.load(file)
+        except FileNotFoundError:
+            return []
+        except (json.decoder.JSONDecodeError, ValueError) as e:
+            self.warning("The proxy jobs could not be read: %s", e)
+            return []
+
+        for job in jobs:
+            # The transcoding cannot continue from where it stopped.
+            part_path = Gst.uri_get_location(job["proxy_uri"] + ProxyManager.part_suffix)
+            try:
+                os.remove(part_path)
+                self.debug("Removed the partial proxy %s", part_path)
+            except OSError:
+                pass
+
+        return jobs
+
+    def __schedule_jobs_saving(self):
+        if not self.__jobs_file_path:
+            return
+
+        if self.__jobs_saving_id:
+            GLib.source_remove(self.__jobs_saving_id)
+        self.__jobs_saving_id = GLib.timeout_add(500, self.__jobs_not_changing_anymore_cb,
+                                                 priority=GLib.PRIORITY_LOW)
+
+    def __jobs_not_changing_anymore_cb(self):
+        self.__jobs_saving_id = 0
+        self.save_jobs()
+        return False
+
+    def save_jobs(self):
+        """Saves the unfinished jobs so they can be resumed at the next start."""
+        if not self.__jobs_file_path:
+            return
+
+        jobs = []
+        for transcoder in self.__running_transcoders + list(self.__pending_transcoders):
+            if self._is_shadow_transcoder(transcoder):
+                # Recreated by the scaled proxy job.
+                continue
+            proxy_uri = transcoder.props.dest_uri[:-len(ProxyManager.part_suffix)]
+            jobs.append({"uri": transcoder.props.src_uri,
+                         "proxy_uri": proxy_uri,
+                         "scaled": self.is_scaled_proxy(proxy_uri)})
+        # Keep the jobs of the assets which have not been loaded since.
+        jobs.extend(self.__interrupted_jobs)
+
+        self.log("Saving %d proxy jobs", len(jobs))
+        try:
+            with open(self.__jobs_file_path, "w") as file:
+                json.dump(jobs, file)
+        except OSError as e:
+            self.warning("The proxy jobs could not be saved: %s", e)
+
+    def take_interrupted_jobs(self, assets):
+        """Gets the jobs of the assets which were not finished when Pitivi exited.
+
+        Args:
+            assets (List[GES.Asset]): The loaded assets.
+
+        Returns:
+            List[Tuple[GES.Asset, bool]]: The assets to be transcoded and
+            whether their proxy is scaled, in their original order.
+        """
+        assets_by_uri = {asset.props.id: asset for asset in assets}
+        resumed_jobs = []
+        remaining_jobs = []
+        for job in self.__interrupted_jobs:
+            asset = assets_by_uri.get(job["uri"])
+            if not asset:
+                remaining_jobs.append(job)
+            elif not asset.get_proxy() and not self.is_asset_queued(asset):
+                resumed_jobs.append((asset, job["scaled"]))
+        self.__interrupted_jobs = remaining_jobs
+
+        return resumed_jobs
 
     def cancel_job(self, asset):
         """Cancels the transcoding job for the specified asset, if any.
@@ -708,15 +1442,18 @@ class ProxyManager(GObject.Object, Loggable):
         if not self.is_asset_queued(asset):
             return
 
-        for transcoder in self.__running_transcoders:
+        for transcoder in list(self.__running_transcoders):
             if asset.props.id == transcoder.props.src_uri:
                 self.info("Cancelling running transcoder %s %s",
                           transcoder.props.src_uri,
                           transcoder.__grefcount__)
+                if isinstance(transcoder, SegmentedTranscoder):
+                    transcoder.cancel()
                 self.__running_transcoders.remove(transcoder)
+                LoadGovernor.get().remove_consumer(transcoder)
                 self.emit("asset-preparing-cancelled", asset)
 
-        for transcoder in self.__pending_transcoders:
+        for transcoder in list(self.__pending_transcoders):
             if asset.props.id == transcoder.props.src_uri:
                 self.info("Cancelling pending transcoder %s",
                           transcoder.props.src_uri)
@@ -726,6 +1463,8 @@ class ProxyManager(GObject.Object, Loggable):
                 self.__pending_transcoders.remove(transcoder)
                 self.emit("asset-preparing-cancelled", asset)
 
+        self.__schedule_jobs_saving()
+
     def add_job(self, asset, scaled=False, shadow=False):
         """Adds a transcoding job for the specified asset if needed.
 
@@ -784,3 +1523,28 @@ def get_proxy_target(obj):
             asset = target
 
     return asset
+
+
+def get_preview_uri(obj):
+    """Gets the URI of the file to be decoded for previewing the object.
+
+    The proxies are much cheaper to decode than the original files, so they
+    are used when available, preferably the scaled ones. The previews are
+    cached by target URI, so they are valid whichever file they come from.
+
+    Args:
+        obj (GES.UriClip|GES.TrackElement|GES.Asset): The previewed object.
+
+    Returns:
+        str: The URI of the original file or of one of its proxies.
+    """
+    target = get_proxy_target(obj)
+    proxies = [proxy for proxy in target.list_proxies()
+               if proxy.get_error() is None and ProxyManager.is_proxy_asset(proxy)]
+    proxies.sort(key=ProxyManager.is_scaled_proxy, reverse=True)
+    for proxy in proxies:
+        uri = proxy.props.id
+        if os.path.exists(Gst.uri_get_location(uri)):
+            return quote_uri(uri)
+
+    return quote_uri(target.props.id)
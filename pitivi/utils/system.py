@@ -20,8 +20,12 @@ import multiprocessing
 import os
 import resource
 import sys
+import time
+import weakref
 
+from gi.repository import GLib
 from gi.repository import GObject
+from gi.repository import Gst
 
 from pitivi.check import MISSING_SOFT_DEPS
 from pitivi.configure import APPNAME
@@ -152,3 +156,260 @@ class CPUUsageTracker:
     def reset(self):
         self.last_moment = datetime.datetime.now()
         self.last_usage = resource.getrusage(resource.RUSAGE_SELF)
+
+
+class LoadGovernor(Loggable):
+    """Computes the CPU budget of the background work from the system load.
+
+    The thumbnails, waveforms and proxies generation all draw from the same
+    budget, which is what is left of the machine after the other processes
+    take their share. The budget is divided among the consumers in
+    proportion to their max CPU usage.
+
+    The load is measured from the CPU time spent by the whole system, so the
+    processes waiting for I/O are not considered busy. When the CPU time of
+    the cgroup is limited, as in containers, the limit caps the budget.
+
+    Attributes:
+        cpu_count (int): The number of CPUs on the system.
+        capacity (float): How many CPUs can be used by this process.
+        spare (float): How many CPUs are not used by other processes.
+    """
+
+    # The interval between two measures of the system load, in millis.
+    SAMPLING_INTERVAL_MS = 1000
+    # The background work is never entirely stopped.
+    MIN_CPU_USAGE = 1
+
+    _instance = None
+
+    def __init__(self, proc_path="/proc", cgroup_path="/sys/fs/cgroup"):
+        Loggable.__init__(self)
+        self._proc_path = proc_path
+        self._cgroup_path = cgroup_path
+
+        self.cpu_count = multiprocessing.cpu_count()
+        self.capacity = float(self.cpu_count)
+        # Until the load has been measured, nothing is known to be busy.
+        self.spare = self.capacity
+
+        self.__last_sample = None
+        self.__sampling_id = 0
+        self.__shares_update_id = 0
+        # The objects adjusting their CPU usage to the budget, mapped to
+        # their max CPU usage and the function setting their CPU usage.
+        self.__consumers = weakref.WeakKeyDictionary()
+        # The CPU usage last allowed to each consumer, in percents.
+        self.__shares = weakref.WeakKeyDictionary()
+
+    @classmethod
+    def get(cls):
+        """Gets the load governor shared by all the background work."""
+        if not cls._instance:
+            cls._instance = cls()
+        return cls._instance
+
+    def budget(self, max_cpu_usage):
+        """Gets the CPU usage the background work can use all together.
+
+        Args:
+            max_cpu_usage (int): The max CPU usage, in percents.
+
+        Returns:
+            int: The CPU usage, in percents of all the CPUs, as expected by
+            GstCpuThrottlingClock.
+        """
+        spare_percent = self.spare * 100 / self.cpu_count
+        return int(max(self.MIN_CPU_USAGE, min(max_cpu_usage, spare_percent)))
+
+    def share(self, consumer, max_cpu_usage):
+        """Gets the CPU usage allowed to a consumer.
+
+        Args:
+            consumer (object): An object passed to `add_consumer`, or None.
+            max_cpu_usage (int): The max CPU usage of the consumer, used
+                when it's not known.
+
+        Returns:
+            int: The CPU usage, in percents of all the CPUs.
+        """
+        share = self.__shares.get(consumer) if consumer is not None else None
+        if share is None:
+            return self.budget(max_cpu_usage)
+        return share
+
+    def add_consumer(self, consumer, max_cpu_usage, set_cpu_usage):
+        """Keeps the CPU usage of the consumer within its share of the budget.
+
+        The consumer is forgotten when it's removed or garbage collected.
+
+        Args:
+            consumer (object): The object consuming CPU.
+            max_cpu_usage (int): The max CPU usage of the consumer.
+            set_cpu_usage (function): Called with the consumer and the
+                allowed CPU usage, in percents, when its share changes.
+        """
+        if not self.__sampling_id:
+            self.sample()
+            self.__sampling_id = GLib.timeout_add(self.SAMPLING_INTERVAL_MS,
+                                                  self.__sampling_cb,
+                                                  priority=GLib.PRIORITY_LOW)
+
+        self.__consumers[consumer] = (max_cpu_usage, set_cpu_usage)
+        finalizer = weakref.finalize(consumer, self.__schedule_shares_update)
+        finalizer.atexit = False
+        self.update_shares()
+
+    def remove_consumer(self, consumer):
+        """Stops adjusting the CPU usage of the consumer.
+
+        Args:
+            consumer (object): An object passed to `add_consumer`.
+        """
+        if self.__consumers.pop(consumer, None):
+            self.__shares.pop(consumer, None)
+            self.update_shares()
+
+    def __schedule_shares_update(self):
+        # Called when a consumer is garbage collected.
+        if not self.__shares_update_id:
+            self.__shares_update_id = GLib.idle_add(self.__update_shares_cb)
+
+    def __update_shares_cb(self):
+        self.__shares_update_id = 0
+        self.update_shares()
+        return False
+
+    def update_shares(self):
+        """Divides the budget among the consumers and notifies them."""
+        consumers = list(self.__consumers.items())
+        if not consumers:
+            return
+
+        max_cpu_usages = [max_cpu_usage for unused_consumer, (max_cpu_usage, unused_set) in consumers]
+        weights = sum(max_cpu_usages)
+        budget = self.budget(max(max_cpu_usages))
+        for consumer, (max_cpu_usage, set_cpu_usage) in consumers:
+            share = max(self.MIN_CPU_USAGE, int(budget * max_cpu_usage / weights))
+            if self.__shares.get(consumer) != share:
+                self.__shares[consumer] = share
+                set_cpu_usage(consumer, share)
+
+    def __sampling_cb(self):
+        self.sample()
+        self.update_shares()
+
+        if not self.__consumers:
+            self.__sampling_id = 0
+            self.__last_sample = None
+            return False
+
+        return True
+
+    def sample(self):
+        """Measures the load since the previous call and updates the budget."""
+        sample = self._read_sample()
+        if sample is None:
+            return
+
+        if self.__last_sample:
+            self._update(self.__last_sample, sample)
+        self.__last_sample = sample
+
+    def _update(self, previous, current):
+        elapsed = current["time"] - previous["time"]
+        if elapsed <= 0:
+            return
+
+        own = (current["self"] - previous["self"]) / elapsed
+
+        total = current["total"] - previous["total"]
+        idle = current["idle"] - previous["idle"]
+        busy = self.cpu_count * (total - idle) / total if total > 0 else 0
+        others = max(0.0, busy - own)
+        capacity = float(self.cpu_count)
+        spare = capacity - others
+
+        if "quota" in current and "usage" in previous:
+            # The other processes in the cgroup use its CPU time too.
+            capacity = current["quota"]
+            cgroup_busy = (current["usage"] - previous["usage"]) / elapsed
+            spare = min(spare, capacity - max(0.0, cgroup_busy - own))
+
+        self.capacity = capacity
+        self.spare = min(capacity, max(0.0, spare))
+        self.log("%.2f of the %.2f CPUs available are not used by other processes",
+                 self.spare, capacity)
+
+    def _read_sample(self):
+        """Reads the counters the load is computed from.
+
+        Returns:
+            dict: The counters, or None if the system does not provide them.
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        sample = {"time": time.monotonic(),
+                  "self": usage.ru_utime + usage.ru_stime}
+        try:
+            with open(os.path.join(self._proc_path, "stat"), encoding="UTF-8") as stat:
+                # The first line has the CPU times summed for all the CPUs:
+                # cpu user nice system idle iowait irq softirq steal ...
+                times = [int(value) for value in stat.readline().split()[1:9]]
+            sample["total"] = sum(times)
+            # Waiting for I/O does not use the CPU.
+            sample["idle"] = times[3] + times[4]
+
+            quota = self._read_cgroup_quota()
+            if quota:
+                sample["quota"] = quota
+                sample["usage"] = self._read_cgroup_usage()
+        except (OSError, ValueError, IndexError) as e:
+            self.debug("Cannot measure the system load: %s", e)
+            return None
+
+        return sample
+
+    def _read_cgroup_quota(self):
+        """Gets how many CPUs the cgroup is allowed to use, if limited."""
+        try:
+            with open(os.path.join(self._cgroup_path, "cpu.max"), encoding="UTF-8") as cpu_max:
+                quota, period = cpu_max.read().split()
+        except (OSError, ValueError):
+            return None
+
+        if quota == "max":
+            return None
+        return min(float(self.cpu_count), int(quota) / int(period))
+
+    def _read_cgroup_usage(self):
+        """Gets the CPU time used by the cgroup, in seconds."""
+        with open(os.path.join(self._cgroup_path, "cpu.stat"), encoding="UTF-8") as cpu_stat:
+            for line in cpu_stat:
+                key, value = line.split()
+                if key == "usage_usec":
+                    return int(value) / 1000000
+        raise ValueError("No usage_usec in cpu.stat")
+
+
+def create_cpu_throttling_clock(max_cpu_usage):
+    """Creates a clock for limiting the CPU usage of a pipeline.
+
+    The CPU usage follows the share of the LoadGovernor budget for as long
+    as the returned clock object is referenced.
+
+    Args:
+        max_cpu_usage (int): The max CPU usage, in percents.
+
+    Returns:
+        Gst.Clock: The GstCpuThrottlingClock of GstTranscoder.
+    """
+    # This line is necessary so we can instantiate GstTranscoder's
+    # GstCpuThrottlingClock below.
+    Gst.ElementFactory.make("uritranscodebin", None)
+    clock = GObject.new(GObject.type_from_name("GstCpuThrottlingClock"))
+    LoadGovernor.get().add_consumer(clock, max_cpu_usage, _set_clock_cpu_usage)
+    return clock
+
+
+def _set_clock_cpu_usage(clock, cpu_usage):
+    clock.props.cpu_usage = cpu_usage
@@ -15,7 +15,12 @@
 #
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
+import bisect
+import itertools
+import weakref
+
 from gi.repository import GES
+from gi.repository import GLib
 from gi.repository import GObject
 from gi.repository import Gst
 from gi.repository import Gtk
@@ -349,6 +354,157 @@ class EditingContext(GObject.Object, Loggable):
                         self.focus, self.focus.props.duration + self.focus.props.in_point)
 
 
+class ClipsIndex(Loggable):
+    """Index of the clips of a layer by position.
+
+    The clips are kept sorted by start, along with the running maximum of
+    their ends, so the clips at a position or in an interval are found with
+    a binary search followed by a short walk. A layer allows only a few
+    clips to overlap at any position, so the walk visits the found clips and
+    at most a few more.
+
+    The index is marked as outdated when the clips are added, removed,
+    moved or trimmed, and is rebuilt by the next query.
+
+    Attributes:
+        ges_layer (GES.Layer): The indexed layer.
+    """
+
+    def __init__(self, ges_layer):
+        Loggable.__init__(self)
+        self.ges_layer = ges_layer
+
+        self.__clips = []
+        self.__starts = []
+        self.__ends = []
+        # The maximum of the ends of the clips up to each index.
+        self.__max_ends = []
+        self.__sorted_ends = []
+        self.__outdated = True
+
+        self.ges_layer.connect("clip-added", self._clip_added_cb)
+        self.ges_layer.connect("clip-removed", self._clip_removed_cb)
+        for ges_clip in self.ges_layer.get_clips():
+            self.__connect_clip(ges_clip)
+
+    def release(self):
+        """Disconnects from the layer and its clips."""
+        for ges_clip in self.ges_layer.get_clips():
+            self.__disconnect_clip(ges_clip)
+        self.ges_layer.disconnect_by_func(self._clip_added_cb)
+        self.ges_layer.disconnect_by_func(self._clip_removed_cb)
+
+    def __connect_clip(self, ges_clip):
+        ges_clip.connect("notify::start", self._clip_moved_cb)
+        ges_clip.connect("notify::duration", self._clip_moved_cb)
+
+    def __disconnect_clip(self, ges_clip):
+        ges_clip.disconnect_by_func(self._clip_moved_cb)
+
+    def _clip_added_cb(self, unused_ges_layer, ges_clip):
+        self.__connect_clip(ges_clip)
+        self.__outdated = True
+
+    def _clip_removed_cb(self, unused_ges_layer, ges_clip):
+        self.__disconnect_clip(ges_clip)
+        self.__outdated = True
+
+    def _clip_moved_cb(self, unused_ges_clip, unused_pspec):
+        self.__outdated = True
+
+    def __update(self):
+        if not self.__outdated:
+            return
+
+        self.__clips = sorted(self.ges_layer.get_clips(), key=lambda clip: clip.props.start)
+        self.__starts = [clip.props.start for clip in self.__clips]
+        self.__ends = [clip.props.start + clip.props.duration for clip in self.__clips]
+        self.__max_ends = list(itertools.accumulate(self.__ends, max))
+        self.__sorted_ends = sorted(self.__ends)
+        self.__outdated = False
+        self.log("Indexed %d clips", len(self.__clips))
+
+    def get_clips_at(self, position):
+        """Gets the clips at the specified position, edges included.
+
+        Args:
+            position (int): The position in the timeline, in nanoseconds.
+
+        Returns:
+            List[GES.Clip]: The clips sorted by start.
+        """
+        self.__update()
+        clips = []
+        index = bisect.bisect_right(self.__starts, position) - 1
+        while index >= 0 and self.__max_ends[index] >= position:
+            if self.__ends[index] >= position:
+                clips.append(self.__clips[index])
+            index -= 1
+        clips.reverse()
+        return clips
+
+    def get_clips_in_interval(self, start, end):
+        """Gets the clips overlapping the specified interval.
+
+        Similar to `GES.Layer.get_clips_in_interval`, touching an edge of
+        the interval does not count as overlapping.
+
+        Args:
+            start (int): The start of the interval, in nanoseconds.
+            end (int): The end of the interval, in nanoseconds.
+
+        Returns:
+            List[GES.Clip]: The clips sorted by start.
+        """
+        self.__update()
+        clips = []
+        index = bisect.bisect_left(self.__starts, end) - 1
+        while index >= 0 and self.__max_ends[index] > start:
+            if self.__ends[index] > start:
+                clips.append(self.__clips[index])
+            index -= 1
+        clips.reverse()
+        return clips
+
+    def get_next_edge(self, position):
+        """Gets the first clip edge after the specified position.
+
+        Args:
+            position (int): The position in the timeline, in nanoseconds.
+
+        Returns:
+            Optional[int]: The position of the edge, if any.
+        """
+        self.__update()
+        edges = []
+        index = bisect.bisect_right(self.__starts, position)
+        if index < len(self.__starts):
+            edges.append(self.__starts[index])
+        index = bisect.bisect_right(self.__sorted_ends, position)
+        if index < len(self.__sorted_ends):
+            edges.append(self.__sorted_ends[index])
+        return min(edges, default=None)
+
+    def get_previous_edge(self, position):
+        """Gets the last clip edge before the specified position.
+
+        Args:
+            position (int): The position in the timeline, in nanoseconds.
+
+        Returns:
+            Optional[int]: The position of the edge, if any.
+        """
+        self.__update()
+        edges = []
+        index = bisect.bisect_left(self.__starts, position)
+        if index > 0:
+            edges.append(self.__starts[index - 1])
+        index = bisect.bisect_left(self.__sorted_ends, position)
+        if index > 0:
+            edges.append(self.__sorted_ends[index - 1])
+        return max(edges, default=None)
+
+
 # -------------------------- Interfaces ----------------------------------------#
 
 
@@ -372,10 +528,31 @@ class Zoomable:
     . set_zoom_ratio
     Instance Methods
     . zoom_changed()
+
+    The conversions use the new zoom ratio right away, while the instances
+    are notified once per frame of the tick widget, so a burst of zoom
+    changes results in a single relayout. Only the widgets shown are
+    notified right away. The widgets not mapped or outside the visible area
+    of the tick widget are notified when they are mapped, allocated or
+    scrolled into view.
     """
 
     sigid = None
-    _instances = []
+    _instances = weakref.WeakSet()
+    # The instances not shown, which have not been notified about the
+    # current zoom ratio yet, by the IDs of the handlers notifying them
+    # when they are mapped or allocated.
+    _outdated_instances = weakref.WeakKeyDictionary()
+    # The zoom ratio the instances have been notified about.
+    _notified_zoomratio = None
+    # The widget whose frame clock is used to notify the instances,
+    # see `set_tick_widget`.
+    _tick_widget = None
+    # The adjustments of the tick widget and the IDs of the handlers notifying
+    # the instances scrolled into view.
+    _scroll_handlers = []
+    # Whether the instances are notified on the next frame of the tick widget.
+    _notification_scheduled = False
     max_zoom = 1000.0
     min_zoom = 0.25
     zoom_steps = 100
@@ -392,25 +569,128 @@ class Zoomable:
             Zoomable.zoomratio = self.compute_zoom_ratio(self._cur_zoom)
 
     def __del__(self):
-        if self in Zoomable._instances:
-            # FIXME: ideally we should deprecate this and spit a warning here
-            self._instances.remove(self)
+        # FIXME: ideally we should deprecate this and spit a warning here
+        Zoomable.remove_instance(self)
 
     @classmethod
     def add_instance(cls, instance):
-        cls._instances.append(instance)
+        cls._instances.add(instance)
 
     @classmethod
     def remove_instance(cls, instance):
-        cls._instances.remove(instance)
+        cls._instances.discard(instance)
+        cls.__forget_outdated(instance)
+
+    @classmethod
+    def __forget_outdated(cls, instance):
+        for handler_id in cls._outdated_instances.pop(instance, []):
+            instance.disconnect(handler_id)
+
+    @classmethod
+    def set_tick_widget(cls, widget):
+        """Sets the widget whose frame clock is used to notify the instances.
+
+        The instances inside the widget are notified right away only when
+        they are in its visible area.
+
+        Args:
+            widget (Gtk.Widget): A widget mapped as long as the zoom can be
+                changed, such as the timeline layout.
+        """
+        for adjustment, handler_id in cls._scroll_handlers:
+            adjustment.disconnect(handler_id)
+        cls._scroll_handlers = []
+
+        cls._tick_widget = widget
+        cls._notification_scheduled = False
+        if isinstance(widget, Gtk.Scrollable):
+            for adjustment in (widget.get_hadjustment(), widget.get_vadjustment()):
+                if adjustment:
+                    handler_id = adjustment.connect("value-changed", cls.__scrolled_cb)
+                    cls._scroll_handlers.append((adjustment, handler_id))
 
     @classmethod
     def set_zoom_ratio(cls, ratio):
         ratio = min(max(cls.min_zoom, ratio), cls.max_zoom)
         if cls.zoomratio != ratio:
             cls.zoomratio = ratio
-            for inst in cls._instances:
-                inst.zoom_changed()
+            cls.__schedule_zoom_notification()
+
+    @classmethod
+    def __schedule_zoom_notification(cls):
+        if cls._notification_scheduled:
+            return
+
+        if cls._tick_widget and cls._tick_widget.get_mapped():
+            cls._notification_scheduled = True
+            cls._tick_widget.add_tick_callback(cls.__tick_cb)
+            return
+
+        # Nothing is shown, for example when starting up.
+        cls.notify_zoom_changed(lazily=False)
+
+    @classmethod
+    def __tick_cb(cls, unused_widget, unused_frame_clock):
+        cls.notify_zoom_changed()
+        return GLib.SOURCE_REMOVE
+
+    @classmethod
+    def notify_zoom_changed(cls, lazily=True):
+        """Notifies the instances if the zoom ratio changed since last time.
+
+        Args:
+            lazily (Optional[bool]): Whether to delay notifying the widgets
+                until they are shown.
+        """
+        cls._notification_scheduled = False
+        if cls._notified_zoomratio == cls.zoomratio:
+            return
+
+        cls._notified_zoomratio = cls.zoomratio
+        for instance in list(cls._instances):
+            if lazily and not cls.__is_shown(instance):
+                if instance not in cls._outdated_instances:
+                    cls._outdated_instances[instance] = [
+                        instance.connect("map", cls.__exposed_cb),
+                        instance.connect("size-allocate", cls.__exposed_cb)]
+                continue
+
+            cls.__forget_outdated(instance)
+            instance.zoom_changed()
+
+    @classmethod
+    def __is_shown(cls, instance):
+        """Checks whether the instance is mapped and not scrolled out of view."""
+        if not isinstance(instance, Gtk.Widget):
+            return True
+
+        if not instance.get_mapped():
+            return False
+
+        tick_widget = cls._tick_widget
+        if not tick_widget or not instance.is_ancestor(tick_widget):
+            return True
+
+        coords = instance.translate_coordinates(tick_widget, 0, 0)
+        if not coords:
+            return True
+
+        x, y = coords
+        return (x < tick_widget.get_allocated_width() and
+                x + instance.get_allocated_width() > 0 and
+                y < tick_widget.get_allocated_height() and
+                y + instance.get_allocated_height() > 0)
+
+    @classmethod
+    def __exposed_cb(cls, instance, *unused_args):
+        if cls.__is_shown(instance):
+            cls.__forget_outdated(instance)
+            instance.zoom_changed()
+
+    @classmethod
+    def __scrolled_cb(cls, unused_adjustment):
+        for instance in list(cls._outdated_instances):
+            cls.__exposed_cb(instance)
 
     @classmethod
     def set_zoom_level(cls, level):
@@ -337,7 +337,10 @@ class TestCase(unittest.TestCase, Loggable):
 
     def setUp(self):
         # TODO: Get rid of Zoomable._instances.
-        del Zoomable._instances[:]
+        Zoomable._instances.clear()
+        Zoomable._outdated_instances.clear()
+        Zoomable._notified_zoomratio = None
+        Zoomable.set_tick_widget(None)
 
         self._result = None
         self._num_failures = len(getattr(self._result, 'failures', []))
@@ -345,7 +348,8 @@ class TestCase(unittest.TestCase, Loggable):
         if detect_leaks:
             self.gctrack()
 
-        self.__zoom_level = Zoomable.get_current_zoom_level()
+        # Restore the zoom even when the test fails.
+        self.addCleanup(Zoomable.set_zoom_level, Zoomable.get_current_zoom_level())
 
         # TODO: Get rid of Previewer.manager.
         assert hasattr(Previewer, "manager")
@@ -360,7 +364,6 @@ class TestCase(unittest.TestCase, Loggable):
         if detect_leaks:
             self.gccollect()
             self.gcverify()
-        Zoomable.set_zoom_level(self.__zoom_level)
 
     # override run() to save a reference to the test result object
     def run(self, result=None):
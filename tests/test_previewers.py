@@ -16,6 +16,7 @@
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Tests for the timeline.previewers module."""
 # pylint: disable=protected-access
+import hashlib
 import os
 import tempfile
 from unittest import mock
@@ -25,12 +26,23 @@ from gi.repository import GdkPixbuf
 from gi.repository import GES
 from gi.repository import Gst
 
+from pitivi.timeline.previewers import AssetPreviewer
 from pitivi.timeline.previewers import delete_all_files_in_dir
 from pitivi.timeline.previewers import get_wavefile_location_for_uri
+from pitivi.timeline.previewers import PEAKS_LEVEL_FACTOR
+from pitivi.timeline.previewers import PixbufsLRUCache
+from pitivi.timeline.previewers import PREVIEW_GENERATOR_SIGNALS
+from pitivi.timeline.previewers import PreviewsCacheCleaner
+from pitivi.timeline.previewers import PreviewGeneratorManager
 from pitivi.timeline.previewers import Previewer
+from pitivi.timeline.previewers import SAMPLE_DURATION
 from pitivi.timeline.previewers import THUMB_HEIGHT
 from pitivi.timeline.previewers import THUMB_PERIOD
+from pitivi.timeline.previewers import THUMBS_BATCH_MAX_GAP
 from pitivi.timeline.previewers import ThumbnailCache
+from pitivi.timeline.previewers import THUMBS_EXTRA_PX
+from pitivi.timeline.previewers import WaveformPeaks
+from pitivi.utils.discoverer import DiscovererCache
 from tests import common
 from tests.test_medialibrary import BaseTestMediaLibrary
 
@@ -97,6 +109,66 @@ class TestAudioPreviewer(BaseTestMediaLibrary):
         self.assertEqual(samples, SIMPSON_WAVFORM_VALUES)
 
 
+class TestWaveformPeaks(common.TestCase):
+    """Tests for the `WaveformPeaks` class."""
+
+    def test_levels(self):
+        """Checks the levels are computed and found back."""
+        for length in (0, 1, 2, 5, 16, 17, 1000):
+            values = numpy.random.rand(length)
+            peaks = WaveformPeaks.from_peaks(values)
+            offset, last_length = peaks.levels[-1]
+            self.assertEqual(offset + last_length, len(peaks.data))
+            self.assertEqual(WaveformPeaks(peaks.data).levels, peaks.levels)
+            if length:
+                self.assertEqual(last_length, 1)
+                self.assertAlmostEqual(peaks.max_value, values.max(), places=5)
+
+    def test_get_range(self):
+        """Checks the values are read from the level matching the zoom."""
+        values = numpy.arange(100)
+        peaks = WaveformPeaks.from_peaks(values)
+
+        self.assertEqual(peaks.level_for(SAMPLE_DURATION), 0)
+        self.assertEqual(peaks.level_for(SAMPLE_DURATION * PEAKS_LEVEL_FACTOR - 1), 0)
+        self.assertEqual(peaks.level_for(SAMPLE_DURATION * PEAKS_LEVEL_FACTOR), 1)
+        self.assertEqual(peaks.level_for(Gst.SECOND * 1000), len(peaks.levels) - 1)
+
+        maxs = peaks.get_range(0, SAMPLE_DURATION * 10, SAMPLE_DURATION * 12)
+        self.assertEqual(list(maxs), [10, 11])
+
+        duration = SAMPLE_DURATION * PEAKS_LEVEL_FACTOR
+        maxs = peaks.get_range(1, 0, duration * 2)
+        self.assertEqual(list(maxs), [3, 7])
+
+    def test_get(self):
+        """Checks the peaks are mapped once and shared."""
+        sample_name = "1sec_simpsons_trailer.mp4"
+        with common.cloned_sample(sample_name):
+            uri = common.get_sample_uri(sample_name)
+            self.assertIsNone(WaveformPeaks.get(uri))
+
+            with open(get_wavefile_location_for_uri(uri), "wb") as wavefile:
+                numpy.save(wavefile, numpy.arange(100, dtype=numpy.float64))
+            peaks = WaveformPeaks.get(uri)
+            self.assertIsInstance(peaks.data, numpy.memmap)
+            self.assertEqual(peaks.max_value, 99)
+            self.assertIs(WaveformPeaks.get(uri), peaks)
+
+            # The peaks are mapped again when the file is replaced.
+            WaveformPeaks.from_peaks(numpy.arange(50)).save(peaks.path)
+            new_peaks = WaveformPeaks.get(uri)
+            self.assertIsNot(new_peaks, peaks)
+            self.assertEqual(new_peaks.max_value, 49)
+
+            # The peaks are mapped again when the asset changes.
+            with mock.patch("pitivi.timeline.previewers.get_peaksfile_location_for_uri") as location:
+                location.return_value = peaks.path + ".changed"
+                with mock.patch.object(WaveformPeaks, "load") as load:
+                    WaveformPeaks.get(uri)
+                    load.assert_called_once_with(uri)
+
+
 class TestPreviewer(common.TestCase):
     """Tests for the `Previewer` class."""
 
@@ -117,6 +189,191 @@ class TestPreviewer(common.TestCase):
         self.assertEqual(run_thumb_interval(2 * THUMB_PERIOD), 2 * THUMB_PERIOD)
 
 
+class TestAssetPreviewer(common.TestCase):
+    """Tests for the `AssetPreviewer` class."""
+
+    def test_pop_batch(self):
+        """Checks the positions close to each other are created in one pass."""
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home, \
+                mock.patch.object(Previewer, "become_controlled"), \
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.return_value = temp_dir
+            asset = GES.UriClipAsset.request_sync(common.get_sample_uri("tears_of_steel.webm"))
+            previewer = AssetPreviewer(asset, 90)
+
+        previewer.position = 0
+        previewer.queue = [THUMB_PERIOD, 2 * THUMB_PERIOD,
+                           2 * THUMB_PERIOD + THUMBS_BATCH_MAX_GAP,
+                           4 * THUMB_PERIOD + 2 * THUMBS_BATCH_MAX_GAP]
+        self.assertEqual(previewer._pop_batch(),
+                         [THUMB_PERIOD, 2 * THUMB_PERIOD,
+                          2 * THUMB_PERIOD + THUMBS_BATCH_MAX_GAP])
+        self.assertEqual(previewer.queue, [4 * THUMB_PERIOD + 2 * THUMBS_BATCH_MAX_GAP])
+
+        # Positions already cached are skipped.
+        previewer.position = 0
+        previewer.queue = [THUMB_PERIOD, 2 * THUMB_PERIOD]
+        with mock.patch.object(previewer, "thumb_cache", {THUMB_PERIOD}):
+            self.assertEqual(previewer._pop_batch(), [2 * THUMB_PERIOD])
+        self.assertEqual(previewer.queue, [])
+
+    def test_stop_generation(self):
+        """Checks the throttling clock stops following the budget."""
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home, \
+                mock.patch.object(Previewer, "become_controlled"), \
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.return_value = temp_dir
+            asset = GES.UriClipAsset.request_sync(common.get_sample_uri("tears_of_steel.webm"))
+            previewer = AssetPreviewer(asset, 90)
+
+        clock = mock.Mock()
+        previewer._clock = clock
+        with mock.patch("pitivi.timeline.previewers.LoadGovernor") as load_governor:
+            previewer.stop_generation()
+            load_governor.get.return_value.remove_consumer.assert_called_once_with(clock)
+        self.assertIsNone(previewer._clock)
+
+
+class TestVideoPreviewer(common.TestCase):
+    """Tests for the `VideoPreviewer` class."""
+
+    def test_thumbnails_virtualization(self):
+        """Checks only the thumbnails around the visible area are managed."""
+        timeline_container = common.create_timeline_container()
+        timeline = timeline_container.timeline
+        layer = timeline.ges_timeline.append_layer()
+        asset = GES.UriClipAsset.request_sync(common.get_sample_uri("tears_of_steel.webm"))
+        ges_clip = layer.add_asset(asset, 0, 0, asset.get_duration(), GES.TrackType.VIDEO)
+        ges_video_source = ges_clip.find_track_element(None, GES.VideoSource)
+        timeline.update_previewers()
+        previewer = ges_video_source.ui._TimelineElement__previewer
+        previewer.thumb_width = 10
+        interval = previewer.thumb_interval(previewer.thumb_width)
+
+        with mock.patch.object(previewer, "thumb_cache", ()), \
+                mock.patch.object(previewer, "become_controlled"):
+            timeline.hadj.props.page_size = 100
+            timeline.hadj.props.upper = previewer.ns_to_pixel(asset.get_duration())
+            timeline.hadj.props.value = 0
+            previewer._update_thumbnails()
+            visible_end = previewer.pixel_to_ns(100 + THUMBS_EXTRA_PX)
+            self.assertEqual(sorted(previewer.thumbs),
+                             list(range(0, min(visible_end, asset.get_duration()), interval)))
+            self.assertEqual(previewer.queue, sorted(previewer.thumbs))
+
+            # Scroll away from the clip.
+            num_thumbs = len(previewer.get_children())
+            timeline.hadj.props.upper = previewer.ns_to_pixel(asset.get_duration()) * 10
+            timeline.hadj.props.value = previewer.ns_to_pixel(asset.get_duration()) * 5
+            self.assertEqual(previewer.thumbs, {})
+            self.assertEqual(len(previewer.get_children()), num_thumbs)
+
+        # The released previewer does not follow the clip anymore.
+        previewer.release()
+        with mock.patch.object(previewer, "_update_thumbnails") as update_thumbnails:
+            ges_clip.props.start = 10
+            ges_clip.props.in_point = 10
+            timeline.hadj.props.value = 0
+            update_thumbnails.assert_not_called()
+
+
+class FakePreviewer(Previewer):
+    """Previewer which only records how it has been controlled."""
+
+    __gsignals__ = PREVIEW_GENERATOR_SIGNALS
+
+    def __init__(self, track_type=GES.TrackType.VIDEO):
+        Previewer.__init__(self, track_type, None)
+        self.state = None
+
+    def start_generation(self):
+        self.state = "started"
+
+    def pause_generation(self):
+        self.state = "paused"
+
+    def stop_generation(self):
+        self.state = "stopped"
+        self.emit("done")
+
+
+class TestPreviewGeneratorManager(common.TestCase):
+    """Tests for the `PreviewGeneratorManager` class."""
+
+    def test_max_workers(self):
+        """Checks the number of previewers running at the same time."""
+        manager = PreviewGeneratorManager()
+        manager.set_max_workers(2)
+        previewers = [FakePreviewer() for unused_i in range(4)]
+        for previewer in previewers:
+            manager.add_previewer(previewer)
+        self.assertEqual([p.state for p in previewers],
+                         ["started", "started", None, None])
+
+        # Audio previewers have their own workers.
+        audio_previewer = FakePreviewer(GES.TrackType.AUDIO)
+        manager.add_previewer(audio_previewer)
+        self.assertEqual(audio_previewer.state, "started")
+
+        # The queue is FIFO.
+        previewers[1].stop_generation()
+        self.assertEqual([p.state for p in previewers],
+                         ["started", "stopped", "started", None])
+
+        manager.set_max_workers(3)
+        self.assertEqual(previewers[3].state, "started")
+
+    def test_paused(self):
+        """Checks no previewer is started while paused."""
+        manager = PreviewGeneratorManager()
+        manager.set_max_workers(1)
+        previewer1 = FakePreviewer()
+        previewer2 = FakePreviewer()
+        manager.add_previewer(previewer1)
+
+        with manager.paused():
+            self.assertEqual(previewer1.state, "paused")
+            manager.add_previewer(previewer2)
+            self.assertIsNone(previewer2.state)
+        self.assertEqual(previewer1.state, "started")
+        self.assertIsNone(previewer2.state)
+
+        with manager.paused(interrupt=True):
+            self.assertEqual(previewer1.state, "stopped")
+            self.assertEqual(previewer2.state, "stopped")
+        self.assertEqual(previewer2.state, "started")
+
+
+class TestPixbufsLRUCache(common.TestCase):
+    """Tests for the `PixbufsLRUCache` class."""
+
+    def test_eviction(self):
+        """Checks the least recently used pixbufs are discarded first."""
+        def pixbuf(size):
+            return mock.Mock(**{"get_byte_length.return_value": size})
+
+        cache = PixbufsLRUCache(10)
+        pixbuf_a = pixbuf(4)
+        cache["a"] = pixbuf_a
+        cache["b"] = pixbuf(4)
+        self.assertEqual(cache.size, 8)
+
+        # Use "a", so "b" is the least recently used.
+        self.assertIs(cache.get("a"), pixbuf_a)
+        cache["c"] = pixbuf(4)
+        self.assertIsNone(cache.get("b"))
+        self.assertIs(cache.get("a"), pixbuf_a)
+        self.assertEqual(cache.size, 8)
+
+        # Replacing a pixbuf updates the size.
+        cache["a"] = pixbuf(2)
+        self.assertEqual(cache.size, 6)
+
+        cache.set_max_bytes(3)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.size, 2)
+
+
 class TestThumbnailCache(BaseTestMediaLibrary):
     """Tests for the ThumbnailCache class."""
 
@@ -173,6 +430,80 @@ class TestThumbnailCache(BaseTestMediaLibrary):
                 self.assertIsNotNone(thumb_cache[Gst.SECOND])
 
 
+class TestPreviewsCacheCleaner(common.TestCase):
+    """Tests for the `PreviewsCacheCleaner` class."""
+
+    def test_process(self):
+        """Checks the least recently used files are deleted."""
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home, \
+                mock.patch.object(PreviewsCacheCleaner, "protected_hashes", set()), \
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.side_effect = lambda subdir: os.path.join(temp_dir, subdir)
+            cleaner = PreviewsCacheCleaner(25)
+            thumbs_dir, waves_dir, discoverer_dir = cleaner.cache_dirs
+            os.makedirs(thumbs_dir)
+            os.makedirs(waves_dir)
+            os.makedirs(discoverer_dir)
+
+            def create_file(cache_dir, name, size, last_access):
+                path = os.path.join(cache_dir, name)
+                with open(path, "wb") as file:
+                    file.write(b"x" * size)
+                os.utime(path, (last_access, last_access))
+                return path
+
+            now = cleaner.start_time
+            oldest_db = create_file(thumbs_dir, "a_hash1_1.0.db", 10, now - 400)
+            oldest_wal = create_file(thumbs_dir, "a_hash1_1.0.db-wal", 5, now - 400)
+            protected = create_file(waves_dir, "b_hash2_1.0.wave.npy", 10, now - 300)
+            old = create_file(waves_dir, "c_hash3_1.0.wave.npy", 10, now - 200)
+            recent = create_file(thumbs_dir, "d_hash4_1.0.db", 10, now - 100)
+            in_use = create_file(thumbs_dir, "e_hash5_1.0.db", 10, now + 1)
+            PreviewsCacheCleaner.protect(protected)
+            # The previews of the assets of the loaded project.
+            path_hash = hashlib.sha256("/tmp/f.mov".encode("UTF-8")).hexdigest()
+            project_asset = create_file(thumbs_dir, "f.mov_%s_1.0.db" % path_hash, 10, now - 500)
+            info_name = DiscovererCache.get_entry_name("file:///tmp/f.mov")
+            project_asset_info = create_file(discoverer_dir, info_name, 10, now - 600)
+            PreviewsCacheCleaner.protect_uri("file:///tmp/f.mov")
+            info = create_file(discoverer_dir, "hash6", 10, now - 50)
+            # Left behind by an interrupted write.
+            leftover = create_file(waves_dir, "c_hash3_1.0.peaks.npy.tmp", 5, now - 50)
+
+            cleaner.process()
+
+            self.assertFalse(os.path.exists(oldest_db))
+            self.assertFalse(os.path.exists(oldest_wal))
+            self.assertTrue(os.path.exists(protected))
+            self.assertTrue(os.path.exists(project_asset))
+            self.assertTrue(os.path.exists(project_asset_info))
+            self.assertFalse(os.path.exists(info))
+            self.assertFalse(os.path.exists(leftover))
+            self.assertFalse(os.path.exists(old))
+            self.assertFalse(os.path.exists(recent))
+            self.assertTrue(os.path.exists(in_use))
+
+    def test_process_within_budget(self):
+        """Checks only the leftover temporary files are deleted."""
+        with mock.patch("pitivi.timeline.previewers.xdg_cache_home") as xdg_cache_home, \
+                tempfile.TemporaryDirectory() as temp_dir:
+            xdg_cache_home.side_effect = lambda subdir: os.path.join(temp_dir, subdir)
+            cleaner = PreviewsCacheCleaner(100)
+            waves_dir = cleaner.cache_dirs[1]
+            os.makedirs(waves_dir)
+            wavefile = os.path.join(waves_dir, "a_hash1_1.0.wave.npy")
+            leftover = wavefile + ".tmp"
+            for path in (wavefile, leftover):
+                with open(path, "wb") as file:
+                    file.write(b"x" * 10)
+                os.utime(path, (cleaner.start_time - 10, cleaner.start_time - 10))
+
+            cleaner.process()
+
+            self.assertTrue(os.path.exists(wavefile))
+            self.assertFalse(os.path.exists(leftover))
+
+
 class TestFunctions(BaseTestMediaLibrary):
     """Tests for the standalone functions."""
 
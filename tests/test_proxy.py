@@ -16,13 +16,83 @@
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Tests for the utils.proxy module."""
 # pylint: disable=protected-access
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+from fractions import Fraction
 from unittest import mock
 
 from gi.repository import GES
+from gi.repository import Gst
 
+from pitivi.settings import xdg_cache_home
+from pitivi.utils.proxy import get_preview_uri
+from pitivi.utils.proxy import JobsQueue
+from pitivi.utils.proxy import ProxyJobPriority
+from pitivi.utils.proxy import ProxyManager
+from pitivi.utils.proxy import ProxyStore
+from pitivi.utils.proxy import SegmentedTranscoder
 from tests import common
 
 
+class TestJobsQueue(common.TestCase):
+    """Tests for the JobsQueue class."""
+
+    def test_pop(self):
+        queue = JobsQueue()
+        with self.assertRaises(IndexError):
+            queue.pop()
+
+        queue.push("a")
+        queue.push("b")
+        queue.push("c", ProxyJobPriority.MEDIA_LIBRARY)
+        queue.push("d", ProxyJobPriority.TIMELINE)
+        self.assertEqual(len(queue), 4)
+        self.assertEqual(list(queue), ["d", "c", "a", "b"])
+
+        self.assertEqual([queue.pop() for unused_i in range(4)], ["d", "c", "a", "b"])
+        self.assertEqual(len(queue), 0)
+        with self.assertRaises(IndexError):
+            queue.pop()
+
+    def test_set_priority(self):
+        queue = JobsQueue()
+        for job in "abc":
+            queue.push(job)
+
+        queue.set_priority("c", ProxyJobPriority.TIMELINE)
+        self.assertEqual(queue.get_priority("c"), ProxyJobPriority.TIMELINE)
+        self.assertEqual(list(queue), ["c", "a", "b"])
+
+        # Setting the same priority keeps the position.
+        queue.set_priority("a", ProxyJobPriority.DEFAULT)
+        self.assertEqual(list(queue), ["c", "a", "b"])
+
+        # Changing the priority puts the job back in its original place.
+        queue.set_priority("a", ProxyJobPriority.TIMELINE)
+        self.assertEqual(list(queue), ["a", "c", "b"])
+        queue.set_priority("a", ProxyJobPriority.DEFAULT)
+        self.assertEqual(list(queue), ["c", "a", "b"])
+        queue.set_priority("c", ProxyJobPriority.DEFAULT)
+        self.assertEqual(list(queue), ["a", "b", "c"])
+
+        # Pushing a removed job again puts it after the others.
+        queue.remove("a")
+        queue.push("a")
+        self.assertEqual(list(queue), ["b", "c", "a"])
+
+    def test_remove(self):
+        queue = JobsQueue()
+        queue.push("a")
+        queue.push("b", ProxyJobPriority.TIMELINE)
+        queue.remove("b")
+        self.assertNotIn("b", queue)
+        self.assertIn("a", queue)
+        self.assertEqual(list(queue), ["a"])
+
+
 class TestProxyManager(common.TestCase):
     """Tests for the ProxyManager class."""
 
@@ -95,6 +165,97 @@ class TestProxyManager(common.TestCase):
                                   "file:///home/file.name.mp4.10.1280x720.scaledproxy.mov",
                                   scaled=True)
 
+    def test_interrupted_jobs(self):
+        """Checks the jobs saved when exiting are resumed at the next start."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            uri1 = "file://%s/a.webm" % tmpdir
+            uri2 = "file://%s/b.webm" % tmpdir
+            uri3 = "file://%s/c.webm" % tmpdir
+            jobs = [{"uri": uri1, "proxy_uri": uri1 + ".10.proxy.mov", "scaled": False},
+                    {"uri": uri2, "proxy_uri": uri2 + ".10.320x240.scaledproxy.mov", "scaled": True},
+                    {"uri": uri3, "proxy_uri": uri3 + ".10.proxy.mov", "scaled": False}]
+            part_path = os.path.join(tmpdir, "a.webm.10.proxy.mov.part")
+            with open(part_path, "w"):
+                pass
+            jobs_file_path = os.path.join(xdg_cache_home(), "proxy-jobs.json")
+            with open(jobs_file_path, "w") as file:
+                json.dump(jobs, file)
+
+            try:
+                manager = common.create_pitivi_mock().proxy_manager
+                # The partial proxies cannot be continued.
+                self.assertFalse(os.path.exists(part_path))
+
+                assets = []
+                for uri in (uri3, uri2):
+                    asset = mock.Mock()
+                    asset.props.id = uri
+                    asset.get_proxy.return_value = None
+                    assets.append(asset)
+                with mock.patch.object(manager, "is_asset_queued", return_value=False):
+                    resumed_jobs = manager.take_interrupted_jobs(assets)
+                self.assertEqual(resumed_jobs, [(assets[1], True), (assets[0], False)])
+
+                # The job of the asset not loaded yet is kept.
+                manager.save_jobs()
+                with open(jobs_file_path, "r") as file:
+                    self.assertEqual(json.load(file), jobs[:1])
+            finally:
+                os.remove(jobs_file_path)
+
+    def test_jobs_locked(self):
+        """Checks the jobs saved by another process are left alone."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            uri = "file://%s/a.webm" % tmpdir
+            jobs = [{"uri": uri, "proxy_uri": uri + ".10.proxy.mov", "scaled": False}]
+            part_path = os.path.join(tmpdir, "a.webm.10.proxy.mov.part")
+            with open(part_path, "w"):
+                pass
+            jobs_file_path = os.path.join(tmpdir, "proxy-jobs.json")
+            with open(jobs_file_path, "w") as file:
+                json.dump(jobs, file)
+
+            # Another Pitivi process owns the saved jobs.
+            with open(os.path.join(tmpdir, "proxy-jobs.lock"), "w") as lock_file, \
+                    mock.patch("pitivi.utils.proxy.xdg_cache_home", return_value=tmpdir), \
+                    mock.patch.object(ProxyManager, "_jobs_lock_file", None):
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                manager = common.create_pitivi_mock().proxy_manager
+                self.assertIsNone(ProxyManager._jobs_lock_file)
+
+                # The partial proxy is still being written.
+                self.assertTrue(os.path.exists(part_path))
+                asset = mock.Mock()
+                asset.props.id = uri
+                asset.get_proxy.return_value = None
+                with mock.patch.object(manager, "is_asset_queued", return_value=False):
+                    self.assertEqual(manager.take_interrupted_jobs([asset]), [])
+
+                manager.save_jobs()
+                with open(jobs_file_path, "r") as file:
+                    self.assertEqual(json.load(file), jobs)
+
+    def test_is_asset_format_well_supported(self):
+        """Checks the support verdicts are cached by the caps of the streams."""
+        app = common.create_pitivi_mock()
+        manager = app.proxy_manager
+
+        uri = common.get_sample_uri("30fps_numeroted_frames_blue.webm")
+        webm = GES.UriClipAsset.request_sync(uri)
+        uri = common.get_sample_uri("1sec_simpsons_trailer.mp4")
+        mp4 = GES.UriClipAsset.request_sync(uri)
+
+        with mock.patch.object(manager, "_asset_matches_encoding_format",
+                               wraps=manager._asset_matches_encoding_format) as matches:
+            self.assertTrue(manager.is_asset_format_well_supported(webm))
+            self.assertFalse(manager.is_asset_format_well_supported(mp4))
+            self.assertTrue(matches.called)
+
+            matches.reset_mock()
+            self.assertTrue(manager.is_asset_format_well_supported(webm))
+            self.assertFalse(manager.is_asset_format_well_supported(mp4))
+            matches.assert_not_called()
+
     def test_asset_matches_target_res(self):
         """Checks the asset_matches_target_res method."""
         uri = common.get_sample_uri("tears_of_steel.webm")
@@ -144,3 +305,92 @@ class TestProxyManager(common.TestCase):
                 matches.return_value = True
                 self.assertTrue(manager.asset_can_be_proxied(video, scaled=True))
                 self.assertTrue(manager.asset_can_be_proxied(video))
+
+    def test_get_preview_uri(self):
+        """Checks the proxies are decoded for previewing when available."""
+        app = common.create_pitivi_mock()
+        with common.cloned_sample("30fps_numeroted_frames_blue.webm"):
+            uri = common.get_sample_uri("30fps_numeroted_frames_blue.webm")
+            asset = GES.UriClipAsset.request_sync(uri)
+            self.assertEqual(get_preview_uri(asset), uri)
+
+            proxy_uri = app.proxy_manager.get_proxy_uri(asset)
+            shutil.copyfile(Gst.uri_get_location(uri), Gst.uri_get_location(proxy_uri))
+            proxy = GES.UriClipAsset.request_sync(proxy_uri)
+            self.assertTrue(asset.set_proxy(proxy))
+            self.assertEqual(get_preview_uri(asset), proxy_uri)
+            self.assertEqual(get_preview_uri(proxy), proxy_uri)
+
+            os.remove(Gst.uri_get_location(proxy_uri))
+            self.assertEqual(get_preview_uri(asset), uri)
+
+
+class TestSegmentedTranscoder(common.TestCase):
+    """Tests for the SegmentedTranscoder class."""
+
+    def test_get_boundaries(self):
+        get_boundaries = SegmentedTranscoder.get_boundaries
+        self.assertEqual(get_boundaries(90, 1), [0, 90])
+        self.assertEqual(get_boundaries(90, 3), [0, 30, 60, 90])
+        # Too many segments for the duration.
+        self.assertEqual(get_boundaries(2, 4), [0, 1, 2])
+
+        # The segments start on frames.
+        duration = 10 * Gst.SECOND
+        boundaries = get_boundaries(duration, 3, Fraction(30000, 1001))
+        self.assertEqual(len(boundaries), 4)
+        self.assertEqual(boundaries[-1], duration)
+        framerate = Fraction(30000, 1001)
+        for index, position in enumerate(boundaries[1:-1], 1):
+            frame = round(position * framerate / Gst.SECOND)
+            self.assertEqual(position, int(frame * Gst.SECOND / framerate))
+            self.assertLess(duration * index // 3 - position, Gst.SECOND / framerate)
+
+    def test_segments_cpu_usage(self):
+        asset = mock.Mock()
+        asset.get_id.return_value = "file:///tmp/a.mov"
+        asset.get_duration.return_value = 10 * Gst.SECOND
+        asset.get_info.return_value.get_video_streams.return_value = []
+        asset.get_info.return_value.get_audio_streams.return_value = [mock.Mock()]
+        with mock.patch("pitivi.utils.proxy.ProxySegment") as proxy_segment:
+            transcoder = SegmentedTranscoder(asset, "file:///tmp/a.mov.part", None, 4, 90)
+        self.assertEqual(len(transcoder.segments), 4)
+        # The segments together do not exceed the max CPU usage.
+        self.assertListEqual([args[5] for args, unused_kwargs in proxy_segment.call_args_list],
+                             [22, 22, 22, 22])
+
+
+class TestProxyStore(common.TestCase):
+    """Tests for the ProxyStore class."""
+
+    def _write(self, path, content):
+        with open(path, "wb") as file:
+            file.write(content)
+        return "file://" + path
+
+    def test_reuse(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            store = ProxyStore(tmpdir)
+            content = bytes(range(256)) * 10000
+            uri1 = self._write(os.path.join(tmpdir, "a.mov"), content)
+            uri2 = self._write(os.path.join(tmpdir, "b.mov"), content)
+            uri3 = self._write(os.path.join(tmpdir, "c.mov"), content[:-1] + b"x")
+
+            suffix = ".%d.proxy.mov" % len(content)
+            proxy_uri1 = self._write(os.path.join(tmpdir, "a.mov" + suffix), b"proxy")
+            self.assertFalse(store.reuse(uri2, uri2 + suffix))
+            store.add(uri1, proxy_uri1)
+
+            self.assertFalse(store.reuse(uri1, proxy_uri1))
+            self.assertFalse(store.reuse(uri3, uri3 + suffix))
+            # A scaled proxy cannot be used instead of the HQ proxy.
+            self.assertFalse(store.reuse(uri2, uri2 + ".%d.640x360.scaledproxy.mov" % len(content)))
+
+            self.assertTrue(store.reuse(uri2, uri2 + suffix))
+            with open(os.path.join(tmpdir, "b.mov" + suffix), "rb") as proxy:
+                self.assertEqual(proxy.read(), b"proxy")
+
+            # The entry is dropped when the proxy is deleted.
+            os.remove(os.path.join(tmpdir, "a.mov" + suffix))
+            os.remove(os.path.join(tmpdir, "b.mov" + suffix))
+            self.assertFalse(store.reuse(uri2, uri2 + suffix))
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Tests for the pitivi.proxygenerator module."""
+# pylint: disable=protected-access
+import json
+import os
+import tempfile
+
+from gi.repository import GES
+from gi.repository import Gio
+
+from pitivi.proxygenerator import ProxiesGenerator
+from pitivi.settings import GlobalSettings
+from pitivi.settings import xdg_cache_home
+from tests import common
+
+
+class TestProxiesGenerator(common.TestCase):
+    """Tests for the ProxiesGenerator class."""
+
+    def test_list_uris(self):
+        with common.cloned_sample("30fps_numeroted_frames_blue.webm", "mp3_sample.mp3") as tmpdir:
+            for name in ("30fps_numeroted_frames_blue.webm.1A2B3C.proxy.mov",
+                         "mp3_sample.mp3.1A2B3C.proxy.opus.part"):
+                with open(os.path.join(tmpdir, name), "w"):
+                    pass
+
+            uris = ProxiesGenerator.list_uris([tmpdir])
+            self.assertListEqual(uris, [common.get_sample_uri("30fps_numeroted_frames_blue.webm"),
+                                        common.get_sample_uri("mp3_sample.mp3")])
+
+            uri = common.get_sample_uri("mp3_sample.mp3")
+            self.assertListEqual(ProxiesGenerator.list_uris([uri]), [uri])
+
+    def test_run(self):
+        with common.cloned_sample("30fps_numeroted_frames_blue.webm"):
+            uri = common.get_sample_uri("30fps_numeroted_frames_blue.webm")
+            generator = ProxiesGenerator(GlobalSettings(), force=True)
+            self.assertTrue(generator.run([uri]))
+            self.assertListEqual(generator.errors, [])
+
+            asset = GES.UriClipAsset.request_sync(uri)
+            proxy_uri = generator.proxy_manager.get_proxy_uri(asset)
+            self.assertTrue(Gio.File.new_for_uri(proxy_uri).query_exists(None))
+
+            missing_uri = uri + ".missing"
+            self.assertFalse(generator.run([missing_uri]))
+            self.assertListEqual(generator.errors, [missing_uri])
+
+    def test_app_jobs_left_alone(self):
+        """Checks the jobs of the app are not touched."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            uri = "file://%s/a.webm" % tmpdir
+            jobs = [{"uri": uri, "proxy_uri": uri + ".10.proxy.mov", "scaled": False}]
+            part_path = os.path.join(tmpdir, "a.webm.10.proxy.mov.part")
+            with open(part_path, "w"):
+                pass
+            jobs_file_path = os.path.join(xdg_cache_home(), "proxy-jobs.json")
+            with open(jobs_file_path, "w") as file:
+                json.dump(jobs, file)
+
+            try:
+                generator = ProxiesGenerator(GlobalSettings())
+                self.assertTrue(generator.run([]))
+                self.assertTrue(os.path.exists(part_path))
+                with open(jobs_file_path, "r") as file:
+                    self.assertEqual(json.load(file), jobs)
+            finally:
+                os.remove(jobs_file_path)
@@ -82,6 +82,13 @@ class TestGlobalSettings(common.TestCase):
         with self.assertRaises(ConfigError):
             add_option()
 
+    def test_add_config_option_notify(self):
+        GlobalSettings.add_config_section("section-a")
+        GlobalSettings.add_config_option("optionA2", section="section-a",
+                                         key="option-a-2", default=2, notify=True)
+        # The default value can be read from the class.
+        self.assertEqual(GlobalSettings.optionA2, 2)
+
     def test_read_config_file(self):
         GlobalSettings.add_config_section("section-1")
         GlobalSettings.add_config_option("section1OptionA", section="section-1",
@@ -15,8 +15,12 @@
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
 """Tests for the utils.system module."""
+import os
+import tempfile
+from unittest import mock
 from unittest import TestCase
 
+from pitivi.utils.system import LoadGovernor
 from pitivi.utils.system import System
 
 
@@ -31,3 +35,107 @@ class TestSystem(TestCase):
         self.assertNotEqual(system.get_unique_filename("a%/b"),
                             system.get_unique_filename("a%37%3747b"))
         self.assertEqual("a b", system.get_unique_filename("a b"))
+
+
+class TestLoadGovernor(TestCase):
+
+    def _write(self, path, content):
+        with open(path, "w", encoding="UTF-8") as file:
+            file.write(content)
+
+    def _sample(self, governor, directory, now, own, stat, cgroup_usage=None):
+        # The user, idle and iowait CPU times.
+        user, idle, iowait = stat + (0,) * (3 - len(stat))
+        self._write(os.path.join(directory, "stat"),
+                    "cpu  %d 0 0 %d %d 0 0 0 0 0\ncpu0 0 0 0 0\n" % (user, idle, iowait))
+        if cgroup_usage is not None:
+            self._write(os.path.join(directory, "cpu.stat"),
+                        "usage_usec %d\nuser_usec 0\n" % cgroup_usage)
+        usage = mock.Mock(ru_utime=own, ru_stime=0)
+        with mock.patch("time.monotonic", return_value=now), \
+                mock.patch("resource.getrusage", return_value=usage):
+            governor.sample()
+
+    def test_system_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch("multiprocessing.cpu_count", return_value=4):
+                governor = LoadGovernor(proc_path=directory, cgroup_path=directory)
+            self.assertEqual(governor.budget(90), 90)
+
+            # The whole system is busy, but only because of us.
+            self._sample(governor, directory, now=0, own=0, stat=(0, 0))
+            self._sample(governor, directory, now=1, own=4, stat=(400, 0))
+            self.assertEqual(governor.spare, 4)
+            self.assertEqual(governor.budget(90), 90)
+
+            # Other processes use three of the four CPUs.
+            self._sample(governor, directory, now=2, own=4, stat=(700, 100))
+            self.assertEqual(governor.spare, 1)
+            self.assertEqual(governor.budget(90), 25)
+            self.assertEqual(governor.budget(10), 10)
+
+            # Other processes use all the CPUs.
+            self._sample(governor, directory, now=3, own=4, stat=(1100, 100))
+            self.assertEqual(governor.spare, 0)
+            self.assertEqual(governor.budget(90), LoadGovernor.MIN_CPU_USAGE)
+
+            # Waiting for I/O does not use the CPUs.
+            self._sample(governor, directory, now=4, own=4, stat=(1100, 100, 400))
+            self.assertEqual(governor.spare, 4)
+            self.assertEqual(governor.budget(90), 90)
+
+    def test_cgroup_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch("multiprocessing.cpu_count", return_value=4):
+                governor = LoadGovernor(proc_path=directory, cgroup_path=directory)
+            # The container can use two CPUs.
+            self._write(os.path.join(directory, "cpu.max"), "200000 100000\n")
+
+            self._sample(governor, directory, now=0, own=0, stat=(0, 0), cgroup_usage=0)
+            self._sample(governor, directory, now=1, own=0.5, stat=(100, 300), cgroup_usage=1000000)
+            self.assertEqual(governor.capacity, 2)
+            self.assertEqual(governor.spare, 1.5)
+            self.assertEqual(governor.budget(90), 37)
+
+            # The system is busier than the cgroup.
+            self._sample(governor, directory, now=2, own=1, stat=(450, 350), cgroup_usage=2000000)
+            self.assertEqual(governor.spare, 1)
+
+    def test_shares(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with mock.patch("multiprocessing.cpu_count", return_value=4):
+                governor = LoadGovernor(proc_path=os.path.join(directory, "missing"),
+                                        cgroup_path=directory)
+            # Half of the CPUs are not used by other processes.
+            governor.spare = 2
+
+            cpu_usages = {}
+
+            def set_cpu_usage(consumer, cpu_usage):
+                cpu_usages[consumer] = cpu_usage
+
+            consumer1 = mock.Mock()
+            consumer2 = mock.Mock()
+            with mock.patch("gi.repository.GLib.timeout_add"):
+                self.assertEqual(governor.share(consumer1, 90), 50)
+                governor.add_consumer(consumer1, 90, set_cpu_usage)
+                self.assertDictEqual(cpu_usages, {consumer1: 50})
+
+                # The consumers share the budget.
+                governor.add_consumer(consumer2, 30, set_cpu_usage)
+                self.assertDictEqual(cpu_usages, {consumer1: 37, consumer2: 12})
+                self.assertEqual(governor.share(consumer2, 30), 12)
+
+                governor.remove_consumer(consumer2)
+                self.assertEqual(cpu_usages[consumer1], 50)
+                # Unknown consumers get the whole budget.
+                self.assertEqual(governor.share(consumer2, 30), 30)
+                self.assertEqual(governor.share(None, 90), 50)
+
+    def test_unavailable(self):
+        with tempfile.TemporaryDirectory() as directory:
+            governor = LoadGovernor(proc_path=os.path.join(directory, "missing"),
+                                    cgroup_path=directory)
+            governor.sample()
+            governor.sample()
+            self.assertEqual(governor.spare, governor.cpu_count)
@@ -23,9 +23,9 @@ from gi.repository import Gdk
 from gi.repository import GES
 from gi.repository import Gst
 from gi.repository import Gtk
-from matplotlib.backend_bases import MouseEvent
 
 from pitivi.timeline.elements import GES_TYPE_UI_TYPE
+from pitivi.timeline.elements import KEYFRAME_NODE_RADIUS
 from pitivi.undo.undo import UndoableActionLog
 from pitivi.utils.timeline import Zoomable
 from pitivi.utils.ui import LAYER_HEIGHT
@@ -37,6 +37,8 @@ class TestKeyframeCurve(common.TestCase):
 
     def test_keyframe_toggle(self):
         """Checks keyframes toggling at the playhead position."""
+        # Zoom in so the keyframes can be clicked.
+        Zoomable.set_zoom_level(Zoomable.zoom_steps // 2)
         timeline_container = common.create_timeline_container()
         timeline_container.app.action_log = UndoableActionLog()
         timeline = timeline_container.timeline
@@ -123,14 +125,17 @@ class TestKeyframeCurve(common.TestCase):
         start_px = Zoomable.ns_to_pixel(start)
         inpoint = ges_clip.props.in_point
         duration = ges_clip.props.duration
-        duration_px = Zoomable.ns_to_pixel(duration)
-        offsets_px = (1, int(duration_px / 2), int(duration_px) - 1)
+        duration_px = int(Zoomable.ns_to_pixel(duration))
+        # Far enough from the edge keyframes.
+        margin_px = 2 * KEYFRAME_NODE_RADIUS
+        offsets_px = (margin_px, int(duration_px / 2), duration_px - margin_px)
         timeline.selection.select([ges_clip])
 
         ges_video_source = ges_clip.find_track_element(None, GES.VideoSource)
         binding = ges_video_source.get_control_binding("alpha")
         control_source = binding.props.control_source
         keyframe_curve = ges_video_source.ui.keyframe_curve
+        keyframe_curve.set_size_request(duration_px, LAYER_HEIGHT)
 
         values = [item.timestamp for item in control_source.get_all()]
         self.assertEqual(values, [inpoint, inpoint + duration])
@@ -139,26 +144,17 @@ class TestKeyframeCurve(common.TestCase):
         for offset_px in offsets_px:
             offset = Zoomable.pixel_to_ns(start_px + offset_px) - start
             xdata, ydata = inpoint + offset, 1
-            x, y = keyframe_curve._ax.transData.transform((xdata, ydata))
-
-            event = MouseEvent(
-                name="button_press_event",
-                canvas=keyframe_curve,
-                x=x,
-                y=y,
-                button=1
-            )
+            event = self.create_button_event(*keyframe_curve._data_to_pixel(xdata, ydata))
             keyframe_curve.translate_coordinates = \
                 mock.Mock(return_value=(start_px + offset_px, None))
 
             with mock.patch.object(Gtk, "get_event_widget") as get_event_widget:
                 get_event_widget.return_value = keyframe_curve
-                event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_PRESS)
-                keyframe_curve._mpl_button_press_event_cb(event)
+                event.type = Gdk.EventType.BUTTON_PRESS
+                keyframe_curve.do_button_press_event(event)
 
-                event.name = "button_release_event"
-                event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_RELEASE)
-                keyframe_curve._mpl_button_release_event_cb(event)
+                event.type = Gdk.EventType.BUTTON_RELEASE
+                keyframe_curve.do_button_release_event(event)
 
             values = [item.timestamp for item in control_source.get_all()]
             self.assertIn(inpoint + offset, values)
@@ -167,40 +163,38 @@ class TestKeyframeCurve(common.TestCase):
         for offset_px in offsets_px:
             offset = Zoomable.pixel_to_ns(start_px + offset_px) - start
             xdata, ydata = inpoint + offset, 1
-            x, y = keyframe_curve._ax.transData.transform((xdata, ydata))
-
-            event = MouseEvent(
-                name="button_press_event",
-                canvas=keyframe_curve,
-                x=x,
-                y=y,
-                button=1
-            )
+            event = self.create_button_event(*keyframe_curve._data_to_pixel(xdata, ydata))
             keyframe_curve.translate_coordinates = \
                 mock.Mock(return_value=(start_px + offset_px, None))
             with mock.patch.object(Gtk, "get_event_widget") as get_event_widget:
                 get_event_widget.return_value = keyframe_curve
-                event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_PRESS)
-                keyframe_curve._mpl_button_press_event_cb(event)
+                event.type = Gdk.EventType.BUTTON_PRESS
+                keyframe_curve.do_button_press_event(event)
 
-                event.name = "button_release_event"
-                event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_RELEASE)
-                keyframe_curve._mpl_button_release_event_cb(event)
+                event.type = Gdk.EventType.BUTTON_RELEASE
+                keyframe_curve.do_button_release_event(event)
 
-                event.name = "button_press_event"
-                event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_PRESS)
-                keyframe_curve._mpl_button_press_event_cb(event)
+                event.type = Gdk.EventType.BUTTON_PRESS
+                keyframe_curve.do_button_press_event(event)
 
-                event.guiEvent = Gdk.Event.new(Gdk.EventType._2BUTTON_PRESS)
-                keyframe_curve._mpl_button_press_event_cb(event)
+                event.type = Gdk.EventType.DOUBLE_BUTTON_PRESS
+                keyframe_curve.do_button_press_event(event)
 
-                event.name = "button_release_event"
-                event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_RELEASE)
-                keyframe_curve._mpl_button_release_event_cb(event)
+                event.type = Gdk.EventType.BUTTON_RELEASE
+                keyframe_curve.do_button_release_event(event)
 
             values = [item.timestamp for item in control_source.get_all()]
             self.assertNotIn(inpoint + offset, values)
 
+    @staticmethod
+    def create_button_event(x, y):
+        """Creates a primary button event at the specified position."""
+        event = mock.Mock(spec=Gdk.EventButton)
+        event.x = x
+        event.y = y
+        event.button = Gdk.BUTTON_PRIMARY
+        return event
+
     def test_no_clip_selected(self):
         """Checks nothing happens when no clip is selected."""
         timeline_container = common.create_timeline_container()
@@ -226,25 +220,16 @@ class TestKeyframeCurve(common.TestCase):
 
         # Simulate a mouse click.
         xdata, ydata = 1, LAYER_HEIGHT // 2
-        x, y = keyframe_curve._ax.transData.transform((xdata, ydata))
-
-        event = MouseEvent(
-            name="button_press_event",
-            canvas=keyframe_curve,
-            x=x,
-            y=y,
-            button=1
-        )
+        event = self.create_button_event(*keyframe_curve._data_to_pixel(xdata, ydata))
         keyframe_curve.translate_coordinates = mock.Mock(return_value=(1, None))
 
         with mock.patch.object(Gtk, "get_event_widget") as get_event_widget:
             get_event_widget.return_value = keyframe_curve
-            event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_PRESS)
-            keyframe_curve._mpl_button_press_event_cb(event)
+            event.type = Gdk.EventType.BUTTON_PRESS
+            keyframe_curve.do_button_press_event(event)
 
-            event.name = "button_release_event"
-            event.guiEvent = Gdk.Event.new(Gdk.EventType.BUTTON_RELEASE)
-            keyframe_curve._mpl_button_release_event_cb(event)
+            event.type = Gdk.EventType.BUTTON_RELEASE
+            keyframe_curve.do_button_release_event(event)
 
         self.assertListEqual([item.timestamp for item in control_source.get_all()], [0, 1000000000])
 
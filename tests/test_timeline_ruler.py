@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Tests for the pitivi.timeline.ruler module."""
+# pylint: disable=protected-access
+from unittest import mock
+
+import cairo
+from gi.repository import Gdk
+from gi.repository import Gst
+
+from pitivi.timeline.ruler import TILE_WIDTH_PIXELS
+from pitivi.utils.timeline import Zoomable
+from tests import common
+
+
+class TestScaleRuler(common.TestCase):
+    """Tests for the ScaleRuler class."""
+
+    def test_tiles(self):
+        Zoomable.set_zoom_level(Zoomable.zoom_steps // 2)
+        timeline_container = common.create_timeline_container()
+        ruler = timeline_container.ruler
+        rect = Gdk.Rectangle()
+        rect.width = TILE_WIDTH_PIXELS * 2
+        rect.height = 25
+        ruler.set_allocation(rect)
+        ruler.do_configure_event(None)
+
+        def draw():
+            surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, rect.width, rect.height)
+            ruler.do_draw(cairo.Context(surface))
+
+        with mock.patch.object(ruler, "draw_background"), \
+                mock.patch.object(ruler, "draw_ruler") as draw_ruler:
+            draw()
+            self.assertEqual(draw_ruler.call_count, 2)
+            self.assertSetEqual(set(ruler._tiles), {0, TILE_WIDTH_PIXELS})
+
+            # Only the tile scrolled into view is rendered.
+            ruler.pixbuf_offset = TILE_WIDTH_PIXELS / 2
+            draw()
+            self.assertEqual(draw_ruler.call_count, 3)
+            self.assertSetEqual(set(ruler._tiles), {0, TILE_WIDTH_PIXELS, TILE_WIDTH_PIXELS * 2})
+
+            ruler.pixbuf_offset = TILE_WIDTH_PIXELS
+            draw()
+            self.assertEqual(draw_ruler.call_count, 3)
+            self.assertSetEqual(set(ruler._tiles), {TILE_WIDTH_PIXELS, TILE_WIDTH_PIXELS * 2})
+
+            # The playhead is drawn over the tiles.
+            ruler._pipeline_position_cb(None, Gst.SECOND)
+            draw()
+            self.assertEqual(draw_ruler.call_count, 3)
+
+            # The tiles are rendered again when zooming.
+            Zoomable.set_zoom_level(Zoomable.zoom_steps // 2 + 1)
+            draw()
+            self.assertEqual(draw_ruler.call_count, 5)
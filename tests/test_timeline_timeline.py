@@ -23,6 +23,9 @@ from gi.repository import GES
 from gi.repository import Gst
 from gi.repository import Gtk
 
+from pitivi.timeline.elements import Clip
+from pitivi.timeline.layer import Layer
+from pitivi.timeline.previewers import ThumbnailCache
 from pitivi.undo.timeline import TimelineObserver
 from pitivi.undo.undo import UndoableActionLog
 from pitivi.utils.timeline import UNSELECT
@@ -781,6 +784,76 @@ class TestTimelineContainer(common.TestCase):
         # Check the title clips are ignored.
         timeline_container.update_clips_asset(mock.Mock())
 
+    def test_thumbnails_memory(self):
+        """Checks the thumbnails cache is resized when the setting changes."""
+        timeline_container = common.create_timeline_container()
+        self.addCleanup(ThumbnailCache.pixbufs.set_max_bytes, ThumbnailCache.pixbufs.max_bytes)
+        timeline_container.app.settings.previewers_thumbnails_memory = 1
+        self.assertEqual(ThumbnailCache.pixbufs.max_bytes, 1024 * 1024)
+
+    def test_split_all_clips(self):
+        """Checks splitting all the clips is a single batch edit."""
+        timeline_container = common.create_timeline_container()
+        timeline = timeline_container.timeline
+        ges_layer1 = timeline.ges_timeline.append_layer()
+        ges_layer2 = timeline.ges_timeline.append_layer()
+        self.add_clip(ges_layer1, 0, duration=20)
+        self.add_clip(ges_layer2, 10, duration=20)
+
+        pipeline = timeline.ges_timeline.get_asset().pipeline
+        pipeline.get_position = mock.Mock(return_value=15)
+        commits = []
+
+        def commit_timeline():
+            commits.append((pipeline._prevent_commits, list(timeline.batch_updates or ())))
+
+        with mock.patch.object(pipeline, "commit_timeline", side_effect=commit_timeline):
+            timeline_container.split_action.emit("activate", None)
+        # The timeline is committed once, before the widgets are updated.
+        self.assertEqual([prevent_commits for prevent_commits, unused_updates in commits].count(0), 1)
+        prevent_commits, updates = commits[-1]
+        self.assertEqual(prevent_commits, 0)
+        self.assertIn(ges_layer1.ui.check_media_types, updates)
+        self.assertIn(ges_layer2.ui.check_media_types, updates)
+        for ges_clip in ges_layer1.get_clips() + ges_layer2.get_clips():
+            self.assertIn(ges_clip.ui.update_position, updates)
+        self.assertIsNone(timeline.batch_updates)
+        self.assertEqual(len(ges_layer1.get_clips()), 2)
+        self.assertEqual(len(ges_layer2.get_clips()), 2)
+
+        action_log = timeline_container.app.action_log
+        self.assertEqual(len(action_log.undo_stacks), 1)
+        # Undoing commits the timeline once.
+        with mock.patch.object(pipeline, "commit_timeline") as commit_timeline:
+            action_log.undo()
+        commit_timeline.assert_called_once_with()
+        self.assertEqual(len(ges_layer1.get_clips()), 1)
+        self.assertEqual(len(ges_layer2.get_clips()), 1)
+
+    def test_batch_edit_removed_widgets(self):
+        """Checks the widgets removed during a batch edit are not updated."""
+        timeline_container = common.create_timeline_container()
+        timeline = timeline_container.timeline
+        ges_layer1 = timeline.ges_timeline.append_layer()
+        ges_layer2 = timeline.ges_timeline.append_layer()
+        ges_clip1 = self.add_clip(ges_layer1, 0)
+        ges_clip2 = self.add_clip(ges_layer2, 0)
+        layer1 = ges_layer1.ui
+        clip1 = ges_clip1.ui
+
+        with mock.patch.object(Layer, "check_media_types", autospec=True) as check_media_types, \
+                mock.patch.object(Clip, "update_position", autospec=True) as update_position:
+            with timeline.batch_edit("remove layer"):
+                for ges_layer, ges_clip in ((ges_layer1, ges_clip1), (ges_layer2, ges_clip2)):
+                    timeline.defer_batch_update(ges_layer.ui.check_media_types, ges_layer)
+                    timeline.defer_batch_update(ges_clip.ui.update_position, ges_clip)
+                timeline.ges_timeline.remove_layer(ges_layer2)
+                check_media_types.reset_mock()
+                update_position.reset_mock()
+
+        check_media_types.assert_called_once_with(layer1)
+        update_position.assert_called_once_with(clip1)
+
 
 class TestClipsEdges(common.TestCase):
 
@@ -806,6 +879,30 @@ class TestClipsEdges(common.TestCase):
         self.assertEqual(timeline_container.first_clip_edge(before=20), 15)
 
 
+class TestPreviewersVirtualization(common.TestCase):
+
+    def test_update_previewers(self):
+        """Checks only the clips around the visible area have previewers."""
+        timeline_container = common.create_timeline_container()
+        timeline = timeline_container.timeline
+        ges_layer = timeline.ges_timeline.append_layer()
+        far_start = timeline.pixel_to_ns(10000)
+        clip1 = self.add_clip(ges_layer, 0, duration=10)
+        clip2 = self.add_clip(ges_layer, far_start, duration=10)
+
+        timeline.hadj.props.upper = 20000
+        timeline.hadj.props.page_size = 100
+        timeline.hadj.props.value = 0
+        timeline.update_previewers()
+        self.assertTrue(clip1.ui.previewers_enabled)
+        self.assertFalse(clip2.ui.previewers_enabled)
+
+        timeline.hadj.props.value = 10000
+        timeline.update_previewers()
+        self.assertFalse(clip1.ui.previewers_enabled)
+        self.assertTrue(clip2.ui.previewers_enabled)
+
+
 class TestDragFromOutside(common.TestCase):
 
     def setUp(self):
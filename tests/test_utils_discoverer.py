@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+# Pitivi video editor
+#
+# This program is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public
+# License as published by the Free Software Foundation; either
+# version 2.1 of the License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public
+# License along with this program; if not, see <http://www.gnu.org/licenses/>.
+"""Tests for the pitivi.utils.discoverer module."""
+import os
+import tempfile
+
+from gi.repository import Gst
+from gi.repository import GstPbutils
+
+from pitivi.utils.discoverer import DiscovererCache
+from pitivi.utils.misc import path_from_uri
+from tests import common
+
+
+class TestDiscovererCache(common.TestCase):
+    """Tests for the DiscovererCache class."""
+
+    def test_save_load(self):
+        with common.cloned_sample("tears_of_steel.webm"), \
+                tempfile.TemporaryDirectory() as cache_dir:
+            uri = common.get_sample_uri("tears_of_steel.webm")
+            cache = DiscovererCache(cache_dir)
+            self.assertIsNone(cache.load(uri))
+
+            discoverer = GstPbutils.Discoverer.new(Gst.SECOND * 5)
+            info = discoverer.discover_uri(uri)
+            cache.save(info)
+
+            cached_info = cache.load(uri)
+            self.assertEqual(cached_info.get_uri(), uri)
+            self.assertEqual(cached_info.get_duration(), info.get_duration())
+            self.assertEqual(len(cached_info.get_video_streams()), 1)
+            self.assertEqual(len(cached_info.get_audio_streams()), 1)
+
+            # Changing the file invalidates the entry.
+            path = path_from_uri(uri)
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+            self.assertIsNone(cache.load(uri))
+            self.assertEqual(os.listdir(cache_dir), [])
+
+    def test_remote_uri(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = DiscovererCache(cache_dir)
+            self.assertIsNone(cache.load("http://example.com/video.webm"))
@@ -14,16 +14,20 @@
 #
 # You should have received a copy of the GNU Lesser General Public
 # License along with this program; if not, see <http://www.gnu.org/licenses/>.
+# pylint: disable=protected-access
 from unittest import mock
 
 from gi.repository import GES
+from gi.repository import Gtk
 
+from pitivi.utils.timeline import ClipsIndex
 from pitivi.utils.timeline import EditingContext
 from pitivi.utils.timeline import SELECT
 from pitivi.utils.timeline import SELECT_ADD
 from pitivi.utils.timeline import Selected
 from pitivi.utils.timeline import Selection
 from pitivi.utils.timeline import UNSELECT
+from pitivi.utils.timeline import Zoomable
 from tests import common
 
 
@@ -171,3 +175,137 @@ class TestEditingContext(common.TestCase):
             self.assertTrue(context.with_video)
         else:
             self.assertFalse(context.with_video)
+
+
+class TestClipsIndex(common.TestCase):
+    """Tests for the ClipsIndex class."""
+
+    def test_queries(self):
+        ges_timeline = GES.Timeline.new_audio_video()
+        ges_layer = ges_timeline.append_layer()
+        clips_index = ClipsIndex(ges_layer)
+        self.assertListEqual(clips_index.get_clips_at(0), [])
+        self.assertIsNone(clips_index.get_next_edge(0))
+
+        clip1 = self.add_clip(ges_layer, 0, duration=10)
+        clip2 = self.add_clip(ges_layer, 5, duration=10)
+        clip3 = self.add_clip(ges_layer, 20, duration=10)
+
+        self.assertListEqual(clips_index.get_clips_at(0), [clip1])
+        self.assertListEqual(clips_index.get_clips_at(5), [clip1, clip2])
+        self.assertListEqual(clips_index.get_clips_at(10), [clip1, clip2])
+        self.assertListEqual(clips_index.get_clips_at(16), [])
+        self.assertListEqual(clips_index.get_clips_at(20), [clip3])
+
+        self.assertListEqual(clips_index.get_clips_in_interval(15, 20), [])
+        self.assertListEqual(clips_index.get_clips_in_interval(14, 21), [clip2, clip3])
+
+        self.assertEqual(clips_index.get_next_edge(0), 5)
+        self.assertEqual(clips_index.get_next_edge(10), 15)
+        self.assertIsNone(clips_index.get_next_edge(30))
+        self.assertIsNone(clips_index.get_previous_edge(0))
+        self.assertEqual(clips_index.get_previous_edge(5), 0)
+        self.assertEqual(clips_index.get_previous_edge(21), 20)
+
+        # Check the index follows the changes.
+        clip3.set_start(40)
+        self.assertListEqual(clips_index.get_clips_at(20), [])
+        self.assertListEqual(clips_index.get_clips_at(45), [clip3])
+
+        ges_layer.remove_clip(clip1)
+        self.assertListEqual(clips_index.get_clips_at(0), [])
+
+        clips_index.release()
+
+
+class ZoomableWidget(Gtk.Label, Zoomable):
+    """Widget counting the zoom notifications."""
+
+    def __init__(self):
+        Gtk.Label.__init__(self)
+        Zoomable.__init__(self)
+        self.zoom_changes = 0
+
+    def zoom_changed(self):
+        self.zoom_changes += 1
+
+
+class TestZoomable(common.TestCase):
+    """Tests for the Zoomable class."""
+
+    def test_notifications(self):
+        level = Zoomable.zoom_steps // 2
+        Zoomable.set_zoom_level(level)
+        shown = ZoomableWidget()
+        hidden = ZoomableWidget()
+        Zoomable.set_tick_widget(shown)
+
+        # Nothing is shown, so the instances are notified right away.
+        Zoomable.set_zoom_level(level - 1)
+        self.assertEqual(shown.zoom_changes, 1)
+        self.assertEqual(hidden.zoom_changes, 1)
+
+        with mock.patch.object(shown, "get_mapped", return_value=True), \
+                mock.patch.object(shown, "add_tick_callback") as add_tick_callback:
+            Zoomable.set_zoom_level(level - 2)
+            Zoomable.set_zoom_level(level - 3)
+            self.assertEqual(Zoomable.zoomratio, Zoomable.compute_zoom_ratio(level - 3))
+            self.assertEqual(shown.zoom_changes, 1)
+
+            # The changes are coalesced until the next frame.
+            add_tick_callback.assert_called_once()
+            tick_cb, = add_tick_callback.call_args[0]
+            tick_cb(shown, None)
+            self.assertEqual(shown.zoom_changes, 2)
+
+        # The hidden widget is notified when mapped.
+        self.assertEqual(hidden.zoom_changes, 1)
+        self.assertIn(hidden, Zoomable._outdated_instances)
+        Zoomable.remove_instance(hidden)
+        self.assertNotIn(hidden, Zoomable._outdated_instances)
+
+        # Only the tick widget is used for waiting for the next frame.
+        with mock.patch.object(hidden, "get_mapped", return_value=True), \
+                mock.patch.object(hidden, "add_tick_callback") as add_tick_callback:
+            Zoomable.set_zoom_level(level - 4)
+            add_tick_callback.assert_not_called()
+            self.assertEqual(shown.zoom_changes, 3)
+
+    def test_visible_area(self):
+        level = Zoomable.zoom_steps // 2
+        Zoomable.set_zoom_level(level)
+        layout = Gtk.Layout()
+        layout.get_mapped = mock.Mock(return_value=True)
+        layout.add_tick_callback = mock.Mock()
+        layout.get_allocated_width = mock.Mock(return_value=100)
+        layout.get_allocated_height = mock.Mock(return_value=100)
+        Zoomable.set_tick_widget(layout)
+
+        widgets = []
+        for x in (50, 200):
+            widget = ZoomableWidget()
+            widget.get_mapped = mock.Mock(return_value=True)
+            widget.get_allocated_width = mock.Mock(return_value=10)
+            widget.get_allocated_height = mock.Mock(return_value=10)
+            widget.translate_coordinates = mock.Mock(return_value=(x, 0))
+            layout.put(widget, x, 0)
+            widgets.append(widget)
+        shown, scrolled_away = widgets
+
+        # Only the widget in the visible area is notified.
+        Zoomable.set_zoom_level(level - 1)
+        tick_cb, = layout.add_tick_callback.call_args[0]
+        tick_cb(layout, None)
+        self.assertEqual(shown.zoom_changes, 1)
+        self.assertEqual(scrolled_away.zoom_changes, 0)
+        self.assertIn(scrolled_away, Zoomable._outdated_instances)
+
+        layout.get_hadjustment().emit("value-changed")
+        self.assertEqual(scrolled_away.zoom_changes, 0)
+
+        # The widget is notified when scrolled into view.
+        scrolled_away.translate_coordinates.return_value = (-5, 0)
+        layout.get_hadjustment().emit("value-changed")
+        self.assertEqual(scrolled_away.zoom_changes, 1)
+        self.assertNotIn(scrolled_away, Zoomable._outdated_instances)
+        self.assertEqual(shown.zoom_changes, 1)